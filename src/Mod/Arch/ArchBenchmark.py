@@ -0,0 +1,118 @@
+#***************************************************************************
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+__title__="FreeCAD Arch Workbench - Benchmark"
+__url__ = ["http://www.freecadweb.org"]
+
+'''
+This module measures how the Arch exporters scale with the size of a model.
+It runs headless, for example with:
+
+    FreeCADCmd -c "import ArchBenchmark; ArchBenchmark.run()"
+
+Synthetic buildings of increasing size are generated, made of walls,
+structures and pieces of equipment sharing the same geometry, and the time
+and memory of each stage (building, exports, vector rendering of a cut
+plan) are recorded. Results are stored and compared
+the same way as the Draft benchmark (see DraftBenchmark).
+'''
+
+import FreeCAD, os, functools, DraftBenchmark
+from FreeCAD import Vector
+from DraftBenchmark import Stage
+
+defaultsizes = [10,100,1000]
+
+def getBaselineFile():
+    "returns the default location of the baseline file"
+    return os.path.join(FreeCAD.ConfigGet("UserAppData"),"ArchBenchmark.json")
+
+def makeBuilding(count):
+    '''makeBuilding(count): creates in the active document a building with
+    count bays, each made of a wall, a column and a piece of equipment, and
+    returns the list of created objects'''
+    import Arch, Draft, Part
+    objs = []
+    box = Part.makeBox(500,500,800)
+    side = int(count**0.5) or 1
+    for i in range(count):
+        p = Vector((i%side)*4000,(i//side)*4000,0)
+        line = Draft.makeLine(p,p.add(Vector(3000,0,0)))
+        objs.append(Arch.makeWall(line,width=200,height=3000))
+        col = Arch.makeStructure(length=300,width=300,height=3000)
+        col.Placement.Base = p.add(Vector(3500,0,0))
+        objs.append(col)
+        base = FreeCAD.ActiveDocument.addObject("Part::Feature","Box")
+        base.Shape = box
+        pl = FreeCAD.Placement(p.add(Vector(1000,1000,0)),FreeCAD.Rotation())
+        objs.append(Arch.makeEquipment(base,placement=pl))
+    objs.append(Arch.makeBuilding(objs))
+    FreeCAD.ActiveDocument.recompute()
+    return objs
+
+def benchRenderer(objs):
+    "cuts the given objects at mid-height and renders a sorted plan view with the vector renderer"
+    import ArchVRM, WorkingPlane, Part
+    shapes = [o.Shape for o in objs if o.isDerivedFrom("Part::Feature") and o.Shape.Solids]
+    bb = shapes[0].BoundBox
+    for sh in shapes[1:]:
+        bb.add(sh.BoundBox)
+    cutplane = Part.makePlane(bb.XLength+2,bb.YLength+2,Vector(bb.XMin-1,bb.YMin-1,1500))
+    render = ArchVRM.Renderer(WorkingPlane.plane())
+    render.addShapes(shapes)
+    render.cut(cutplane)
+    render.sort()
+    render.getViewSVG()
+    render.getSectionSVG()
+
+def benchExport(size,results,tmpdir):
+    "runs the export stages on a synthetic building of the given size"
+    doc = FreeCAD.newDocument("ArchBenchmark")
+    FreeCAD.setActiveDocument(doc.Name)
+    try:
+        with Stage(results,"build","building",size):
+            objs = makeBuilding(size)
+        with Stage(results,"ifc","building",size):
+            import importIFC
+            importIFC.export(objs,os.path.join(tmpdir,"building.ifc"))
+        with Stage(results,"obj","building",size):
+            import importOBJ
+            importOBJ.export(objs,os.path.join(tmpdir,"building.obj"))
+        with Stage(results,"webgl","building",size):
+            import importWebGL
+            importWebGL.export(objs,os.path.join(tmpdir,"building.html"))
+        with Stage(results,"vrm","building",size):
+            benchRenderer(objs)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+
+def run(sizes=None,baseline=None,store=False,tolerance=1.5):
+    '''run([sizes],[baseline],[store],[tolerance]): runs the benchmark on
+    synthetic buildings of the given sizes (number of bays). Results are
+    compared with the given baseline file (by default the one in the user
+    folder, if it exists), and stages slower than tolerance times the
+    baseline are reported as regressions. If store is True, the results are
+    saved as the new baseline. Returns a (results,regressions) tuple.'''
+    if sizes is None:
+        sizes = defaultsizes
+    if baseline is None:
+        baseline = getBaselineFile()
+    jobs = [functools.partial(benchExport,size) for size in sizes]
+    return DraftBenchmark.runJobs(jobs,baseline,store,tolerance)
@@ -422,29 +422,28 @@ def getCutVolume(cutplane,shapes):
 def getShapeFromMesh(mesh,fast=True,tolerance=0.001,flat=False,cut=True):
     import Part, MeshPart, DraftGeomUtils
     if mesh.isSolid() and (mesh.countComponents() == 1) and fast:
-        # use the best method
-        faces = []
-        for f in mesh.Facets:
-            p=f.Points+[f.Points[0]]
-            pts = []
-            for pp in p:
-                pts.append(FreeCAD.Vector(pp[0],pp[1],pp[2]))
-            try:
-                f = Part.Face(Part.makePolygon(pts))
-            except:
-                pass
-            else:
-                faces.append(f)
-        shell = Part.makeShell(faces)
+        # use the best method: the facets are sewn together in one go from the
+        # mesh topology, then coplanar facets are merged
+        shape = Part.Shape()
+        shape.makeShapeFromMesh(mesh.Topology,tolerance)
+        shell = Part.makeShell(shape.Faces)
         solid = Part.Solid(shell)
         solid = solid.removeSplitter()
         return solid
 
     faces = []
+    points,facets = mesh.Topology
     segments = mesh.getPlanarSegments(tolerance)
     #print len(segments)
     for i in segments:
-        if len(i) > 0:
+        if len(i) == 1:
+            # single facets are built directly, no need to compute their outline
+            pts = [points[v] for v in facets[i[0]]]
+            try:
+                faces.append(Part.Face(Part.makePolygon(pts+[pts[0]])))
+            except Part.OCCError:
+                pass
+        elif len(i) > 0:
             wires = MeshPart.wireFromSegment(mesh, i)
             if wires:
                 if flat:
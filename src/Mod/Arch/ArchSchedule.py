@@ -35,6 +35,99 @@ __url__ = "http://www.freecadweb.org"
 
 verbose = True # change this for silent recomputes
 
+quantitycache = None
+
+
+def getScheduleContents(objs):
+    """getScheduleContents(objs): returns the objects considered by a schedule
+    line from the given string of semicolon-separated object names (all the
+    document if empty), and an index of these objects by type, role and
+    material, to be used by filterObjects()"""
+    import Draft,Arch
+    if objs:
+        objs = objs.split(";")
+        objs = [FreeCAD.ActiveDocument.getObject(o) for o in objs]
+    else:
+        objs = FreeCAD.ActiveDocument.Objects
+    objs = Draft.getGroupContents(objs,walls=True,addgroups=True)
+    objs = Arch.pruneIncluded(objs)
+    index = {"TYPE":{},"ROLE":{},"MATERIAL":{}}
+    for o in objs:
+        index["TYPE"].setdefault(Draft.getType(o).upper(),set()).add(o.Name)
+        if hasattr(o,"Role"):
+            index["ROLE"].setdefault(o.Role.upper(),set()).add(o.Name)
+        material = getattr(o,"BaseMaterial",None)
+        if hasattr(material,"Label"):
+            index["MATERIAL"].setdefault(material.Label.upper(),set()).add(o.Name)
+    return objs,index
+
+def filterObjects(objs,filters,index):
+    """filterObjects(objs,filters,index): returns the objects of the given list
+    that match all the given semicolon-separated type:value filters. Type,
+    role and material filters are resolved with the given index (see
+    getScheduleContents), name and label filters by matching each object"""
+    names = set([o.Name for o in objs])
+    words = []
+    for f in filters.split(";"):
+        args = [a.strip() for a in f.strip().split(":")]
+        if len(args) < 2:
+            continue
+        key = args[0].upper()
+        value = args[1].upper()
+        neg = key.startswith("!")
+        key = key.lstrip("!")
+        if key in index:
+            found = index[key].get(value,set())
+            if neg:
+                names -= found
+            else:
+                names &= found
+        elif key in ["NAME","LABEL"]:
+            words.append((key,value,neg))
+    result = []
+    for o in objs:
+        if o.Name in names:
+            ok = True
+            for key,value,neg in words:
+                if key == "NAME":
+                    found = value in o.Name.upper()
+                else:
+                    found = value in o.Label.upper()
+                if found == neg:
+                    ok = False
+                    break
+            if ok:
+                result.append(o)
+    return result
+
+def getQuantity(obj,path):
+    """getQuantity(obj,path): returns the value of the given attribute path
+    (for ex. ["Shape","Volume"]) of an object. Values computed from the shape
+    of the object are kept in memory until the shape changes. The number of
+    values kept is given by the scheduleCacheSize parameter, 0 disables the
+    cache"""
+    global quantitycache
+    size = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/Arch").GetInt("scheduleCacheSize",10000)
+    key = None
+    if size and (len(path) > 1) and (path[0] == "Shape") and hasattr(obj,"Shape"):
+        import Draft
+        if quantitycache is None:
+            import collections
+            quantitycache = collections.OrderedDict()
+        key = (obj.Name,tuple(path),Draft.getShapeCacheKey(obj.Shape))
+        if key in quantitycache:
+            d = quantitycache.pop(key)
+            quantitycache[key] = d
+            return d
+    d = obj
+    for v in path:
+        d = getattr(d,v)
+    if key:
+        quantitycache[key] = d
+        while len(quantitycache) > size:
+            quantitycache.popitem(last=False)
+    return d
+
 
 class _CommandArchSchedule:
 
@@ -88,6 +181,7 @@ class _ArchSchedule:
         obj.Result.set("B1","Value")
         obj.Result.set("C1","Unit")
         obj.Result.setStyle('A1:C1', 'bold', 'add')
+        contents = {} # lines using the same objects share their contents and index
         for i in range(len(obj.Description)):
             if not obj.Description[i]:
                 # blank line
@@ -102,52 +196,12 @@ class _ArchSchedule:
             objs = obj.Objects[i]
             val = obj.Value[i]
             if val:
-                import Draft,Arch
-                if objs:
-                    objs = objs.split(";")
-                    objs = [FreeCAD.ActiveDocument.getObject(o) for o in objs]
-                else:
-                    objs = FreeCAD.ActiveDocument.Objects
-                objs = Draft.getGroupContents(objs,walls=True,addgroups=True)
-                objs = Arch.pruneIncluded(objs)
+                if not objs in contents:
+                    contents[objs] = getScheduleContents(objs)
+                objs,index = contents[objs]
                 if obj.Filter[i]:
                     # apply filters
-                    nobjs = []
-                    for o in objs:
-                        ok = True
-                        for f in obj.Filter[i].split(";"):
-                            args = [a.strip() for a in f.strip().split(":")]
-                            if args[0].upper() == "NAME":
-                                if not(args[1].upper() in o.Name.upper()):
-                                    ok = False
-                            elif args[0].upper() == "!NAME":
-                                if (args[1].upper() in o.Name.upper()):
-                                    ok = False
-                            elif args[0].upper() == "LABEL":
-                                if not(args[1].upper() in o.Label.upper()):
-                                    ok = False
-                            elif args[0].upper() == "!LABEL":
-                                if args[1].upper() in o.Label.upper():
-                                    ok = False
-                            elif args[0].upper() == "TYPE":
-                                if Draft.getType(o).upper() != args[1].upper():
-                                    ok = False
-                            elif args[0].upper() == "!TYPE":
-                                if Draft.getType(o).upper() == args[1].upper():
-                                    ok = False
-                            elif args[0].upper() == "ROLE":
-                                if hasattr(o,"Role"):
-                                    if o.Role.upper() != args[1].upper():
-                                        ok = False
-                                else:
-                                    ok = False
-                            elif args[0].upper() == "!ROLE":
-                                if hasattr(o,"Role"):
-                                    if o.Role.upper() == args[1].upper():
-                                        ok = False
-                        if ok:
-                            nobjs.append(o)
-                    objs = nobjs
+                    objs = filterObjects(objs,obj.Filter[i],index)
                 # perform operation
                 if val.upper() == "COUNT":
                     val = len(objs)
@@ -162,9 +216,7 @@ class _ArchSchedule:
                             l = o.Name+" ("+o.Label+"):"
                             print l+(40-len(l))*" ",
                         try:
-                            d = o
-                            for v in vals[1:]:
-                                d = getattr(d,v)
+                            d = getQuantity(o,vals[1:])
                             if verbose:
                                 print d
                         except:
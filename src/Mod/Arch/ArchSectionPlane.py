@@ -69,6 +69,67 @@ def makeSectionView(section,name="View"):
     view.Label = translate("Arch","View of")+" "+section.Name
     return view
 
+cutcache = None
+
+def getPlaneKey(placement):
+    "returns a hashable key identifying the given section plane placement"
+    return tuple(placement.Base)+tuple(placement.Rotation.Q)
+
+def getCutShapes(shape,cutface,cutvolume,invcutvolume,showcut=False,planekey=None):
+    """getCutShapes(shape,cutface,cutvolume,invcutvolume,[showcut],[planekey]):
+    cuts the solids of the given shape with the given cut volume, and returns
+    the remaining solids, the section faces and, if showcut is True, the cut
+    away shapes. If a plane key is given (see getPlaneKey), results are kept
+    in memory and reused as long as the geometry of the shape, of the cut
+    face and of the cut volumes doesn't change. The number of shapes kept is
+    given by the sectionCacheSize parameter, 0 disables the cache."""
+    import Part, DraftGeomUtils
+    global cutcache
+    size = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/Arch").GetInt("sectionCacheSize",500)
+    key = None
+    if size and planekey:
+        if cutcache is None:
+            import collections
+            cutcache = collections.OrderedDict()
+        key = [Draft.getShapeCacheKey(shape),planekey,showcut]
+        for sh in [cutface,cutvolume]+([invcutvolume] if showcut else []):
+            key.append(Draft.getShapeCacheKey(sh))
+        key = tuple(key)
+        if key in cutcache:
+            result = cutcache.pop(key)
+            cutcache[key] = result
+            return result
+    solids = []
+    sections = []
+    hidden = []
+    for sol in shape.Solids:
+        if sol.Volume < 0:
+            sol.reverse()
+        c = sol.cut(cutvolume)
+        s = sol.section(cutface)
+        try:
+            wires = DraftGeomUtils.findWires(s.Edges)
+            for w in wires:
+                f = Part.Face(w)
+                sections.append(f)
+        except Part.OCCError:
+            #print "ArchDrawingView: unable to get a face"
+            sections.append(s)
+        solids.extend(c.Solids)
+        if showcut:
+            hidden.append(sol.cut(invcutvolume))
+    result = (solids,sections,hidden)
+    if key:
+        cutcache[key] = result
+        while len(cutcache) > size:
+            cutcache.popitem(last=False)
+    return result
+
+def clearCutCache():
+    "clearCutCache(): empties the cache of cut shapes used by getCutShapes()"
+    global cutcache
+    cutcache = None
+
 class _CommandSectionPlane:
     "the Arch SectionPlane command definition"
     def GetResources(self):
@@ -326,11 +387,9 @@ class _ArchDrawingView:
     def execute(self, obj):
         if hasattr(obj,"Source"):
             if obj.Source:
-                if not hasattr(self,"svg"):
+                # the section is only rebuilt if the cut objects or the plane changed
+                if (not getattr(self,"svg",None)) or (getattr(self,"viewkey",None) != self.getViewKey(obj,self.getSourceObjects(obj))):
                     self.onChanged(obj,"Source")
-                else:
-                    if not self.svg:
-                        self.onChanged(obj,"Source")
                 if not hasattr(self,"svg"):
                     return ''
                 if not hasattr(self,"direction"):
@@ -347,7 +406,7 @@ class _ArchDrawingView:
                     if self.spaces and round(self.direction.getAngle(FreeCAD.Vector(0,0,1)),Draft.precision()) in [0,round(math.pi,Draft.precision())]:
                         svg += '<g transform="scale(1,-1)">'
                         for s in self.spaces:
-                            svg += Draft.getSVG(s,scale=obj.Scale,fontsize=obj.FontSize.Value,direction=self.direction)
+                            svg += Draft.getCachedSVG(s,scale=obj.Scale,fontsize=obj.FontSize.Value,direction=self.direction)
                         svg += '</g>'
                 result = ''
                 result += '<g id="' + obj.Name + '"'
@@ -367,12 +426,8 @@ class _ArchDrawingView:
             if hasattr(obj,"Source"):
                 if obj.Source:
                     if obj.Source.Objects:
-                        objs = Draft.getGroupContents(obj.Source.Objects,walls=True,addgroups=True)
-                        if hasattr(obj,"AlwaysOn"):
-                            if not obj.AlwaysOn:
-                                objs = Draft.removeHidden(objs)
-                        else:
-                            objs = Draft.removeHidden(objs)
+                        objs = self.getSourceObjects(obj)
+                        self.viewkey = self.getViewKey(obj,objs)
                         # separate spaces
                         self.spaces = []
                         os = []
@@ -438,28 +493,15 @@ class _ArchDrawingView:
                             cutface,cutvolume,invcutvolume = ArchCommands.getCutVolume(obj.Source.Shape.copy(),shapes)
                             if cutvolume:
                                 nsh = []
+                                showcut = False
+                                if hasattr(obj,"ShowCut"):
+                                    showcut = obj.ShowCut
+                                planekey = getPlaneKey(obj.Source.Placement)
                                 for sh in shapes:
-                                    for sol in sh.Solids:
-                                        if sol.Volume < 0:
-                                            sol.reverse()
-                                        c = sol.cut(cutvolume)
-                                        s = sol.section(cutface)
-                                        try:
-                                            wires = DraftGeomUtils.findWires(s.Edges)
-                                            for w in wires:
-                                                f = Part.Face(w)
-                                                sshapes.append(f)
-                                            #s = Part.Wire(s.Edges)
-                                            #s = Part.Face(s)
-                                        except Part.OCCError:
-                                            #print "ArchDrawingView: unable to get a face"
-                                            sshapes.append(s)
-                                        nsh.extend(c.Solids)
-                                        #sshapes.append(s)
-                                        if hasattr(obj,"ShowCut"):
-                                            if obj.ShowCut:
-                                                c = sol.cut(invcutvolume)
-                                                hshapes.append(c)
+                                    c,s,h = getCutShapes(sh,cutface,cutvolume,invcutvolume,showcut,planekey)
+                                    nsh.extend(c)
+                                    sshapes.extend(s)
+                                    hshapes.extend(h)
                                 shapes = nsh
                             if shapes:
                                 self.shapes = shapes
@@ -502,6 +544,26 @@ class _ArchDrawingView:
                                     svgs = svgs.replace('stroke-width:0.35','stroke-width:SWPlaceholder')
                                     self.svg += svgs
 
+    def getSourceObjects(self,obj):
+        "returns the objects cut by the section plane of this view"
+        objs = Draft.getGroupContents(obj.Source.Objects,walls=True,addgroups=True)
+        if hasattr(obj,"AlwaysOn"):
+            if not obj.AlwaysOn:
+                objs = Draft.removeHidden(objs)
+        else:
+            objs = Draft.removeHidden(objs)
+        return objs
+
+    def getViewKey(self,obj,objs):
+        "returns a key that changes whenever the contents of this view must be rebuilt"
+        key = [getPlaneKey(obj.Source.Placement),obj.RenderingMode,getattr(obj.Source,"OnlySolids",None)]
+        for prop in ["ShowCut","ShowFill","AlwaysOn"]:
+            key.append(getattr(obj,prop,None))
+        for o in objs:
+            if o.isDerivedFrom("Part::Feature"):
+                key.append((o.Name,Draft.getShapeCacheKey(o.Shape)))
+        return tuple(key)
+
     def __getstate__(self):
         return self.Type
 
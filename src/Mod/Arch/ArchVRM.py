@@ -25,8 +25,6 @@
 
 import FreeCAD,math,Part,ArchCommands,DraftVecUtils,DraftGeomUtils
 
-MAXLOOP = 10 # the max number of loop before abort
-
 # WARNING: in this module, faces are lists whose first item is the actual OCC face, the
 # other items being additional information such as color, etc.
 
@@ -248,8 +246,14 @@ class Renderer:
                 shapes = []
                 faces = []
                 sections = []
+                cutbox = cutvolume.BoundBox
                 for sh in self.shapes:
                     for sol in sh[0].Solids:
+                        if not sol.BoundBox.intersect(cutbox):
+                            # entirely on the kept side, nothing to cut
+                            shapes.append([sol]+sh[1:])
+                            faces.extend([[f]+sh[1:] for f in sol.Faces])
+                            continue
                         c = sol.cut(cutvolume)
                         shapes.append([c]+sh[1:])
                         for f in c.Faces:
@@ -464,6 +468,24 @@ class Renderer:
         else:
             return None
 
+    def getOverlaps(self,faces):
+        """returns the pairs of indices of the given faces whose bounding boxes
+        overlap in the XY plane. Faces are swept along X, so only faces whose
+        X ranges overlap are tested against each other"""
+        boxes = [f[0].BoundBox for f in faces]
+        order = sorted(range(len(boxes)),key=lambda i:boxes[i].XMin)
+        active = []
+        pairs = []
+        for i in order:
+            b1 = boxes[i]
+            active = [j for j in active if boxes[j].XMax >= b1.XMin]
+            for j in active:
+                b2 = boxes[j]
+                if (b1.YMax >= b2.YMin) and (b1.YMin <= b2.YMax):
+                    pairs.append((min(i,j),max(i,j)))
+            active.append(i)
+        return pairs
+
     def sort(self):
         "projects a shape on the WP"
         if DEBUG: print "\n\n======> Starting sort\n\n"
@@ -477,66 +499,48 @@ class Renderer:
         if not self.oriented:
             self.reorient()
             if DEBUG: print "Done reorientation"
-        faces = self.faces[:]
-        if DEBUG: print "sorting ",len(self.faces)," faces"
+        faces = [f for f in self.faces if f]
+        if DEBUG: print "sorting ",len(faces)," faces"
+
+        # only faces whose projections can overlap need to be compared. Each
+        # result is a constraint: the farther face must be drawn first
+        after = [[] for f in faces]
+        count = [0 for f in faces]
+        for i,j in self.getOverlaps(faces):
+            r = self.compare(faces[i],faces[j])
+            if r == 1:
+                after[j].append(i)
+                count[i] += 1
+            elif r == 2:
+                after[i].append(j)
+                count[j] += 1
+
+        # topological ordering of the constraints. Among the faces that are free
+        # to be drawn, the original order is kept. If the constraints contain a
+        # cycle, the face with the fewest remaining constraints is drawn first
+        import heapq
+        ready = [i for i in range(len(faces)) if count[i] == 0]
+        heapq.heapify(ready)
+        done = [False for f in faces]
         sfaces = []
-        loopcount = 0
-        notfoundstack = 0
-        while faces:
-            if DEBUG: print "loop ", loopcount
-            f1 = faces[0]
-            if sfaces and (notfoundstack < len(faces)):
-                if DEBUG: print "using ordered stack, notfound = ",notfoundstack
-                p = self.findPosition(f1,sfaces)
-                if p == None:
-                    # no position found, we move the face to the end of the pile
-                    faces.remove(f1)
-                    faces.append(f1)
-                    notfoundstack += 1
-                else:
-                    # position found, we insert it
-                    faces.remove(f1)
-                    sfaces.insert(p,f1)
-                    notfoundstack = 0
-            else:
-                # either there is no stack, or no more face can be compared
-                # find a root, 2 faces that can be compared
-                if DEBUG: print "using unordered stack, notfound = ",notfoundstack
-                for f2 in faces[1:]:
-                    if DEBUG: print "comparing face",str(self.faces.index(f1))," with face",str(self.faces.index(f2))
-                    r = self.compare(f1,f2)
-                    print "comparison result:",r
-                    if r == 1:
-                        faces.remove(f2)
-                        sfaces.append(f2)
-                        faces.remove(f1)
-                        sfaces.append(f1)
-                        notfoundstack = 0
-                        break
-                    elif r == 2:
-                        faces.remove(f1)
-                        sfaces.append(f1)
-                        faces.remove(f2)
-                        sfaces.append(f2)
-                        notfoundstack = 0
-                        break
-                    elif r == 31:
-                        if f1 in faces:
-                            faces.remove(f1)
-                    elif r == 32:
-                        if f2 in faces:
-                            faces.remove(f2)
-                else:
-                    # nothing found, move the face to the end of the pile
-                    if f1 in faces:
-                        faces.remove(f1)
-                        faces.append(f1)
-            loopcount += 1
-            if loopcount == MAXLOOP * len(self.faces):
-                if DEBUG: print "Too many loops, aborting."
-                break
-
-        if DEBUG: print "done Z sorting. ", len(sfaces), " faces retained, ", len(self.faces)-len(sfaces), " faces lost."
+        cycles = 0
+        while len(sfaces) < len(faces):
+            if not ready:
+                i = min([i for i in range(len(faces)) if not done[i]],key=lambda i:count[i])
+                count[i] = 0
+                heapq.heappush(ready,i)
+                cycles += 1
+            i = heapq.heappop(ready)
+            if done[i]:
+                continue
+            done[i] = True
+            sfaces.append(faces[i])
+            for j in after[i]:
+                count[j] -= 1
+                if (count[j] == 0) and not done[j]:
+                    heapq.heappush(ready,j)
+
+        if DEBUG: print "done Z sorting. ", len(sfaces), " faces retained, ", len(self.faces)-len(sfaces), " faces lost, ", cycles, " cycles broken."
         self.faces = sfaces
         self.sorted = True
         if DEBUG: print "\n\n======> Finished sort\n\n"
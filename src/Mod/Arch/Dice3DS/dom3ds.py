@@ -16,7 +16,7 @@ data of the second object like this:
 
 """
 
-import os, sys, struct
+import os, sys, struct, mmap
 
 import numpy
 
@@ -38,11 +38,17 @@ class FBufError(Exception):
 # Numeric/string conversion functions, where the string uses
 # little-endian regardless of host byte order
 
-def string_to_array(s,typ):
-    """Convert data block from a 3DS file to a numpy array."""
-    a = numpy.fromstring(s,typ)
+def string_to_array(s,typ,count=-1,offset=0):
+    """Convert data block from a 3DS file to a numpy array.
+
+    The array shares the memory of the data block (which can be a
+    string, an mmaped file or any other buffer) instead of copying
+    it, except on big-endian hosts.
+
+    """
+    a = numpy.frombuffer(s,typ,count,offset)
     if sys.byteorder == 'big':
-        a.byteswap(True)
+        a = a.byteswap()
     return a
 
 def array_to_string(a):
@@ -98,10 +104,27 @@ class FileLikeBuffer(object):
         r = FileLikeBuffer(self.buf,self.index,self.index+length)
         self.advance(length)
         return r
+    def read_array(self,typ,count):
+        length = numpy.dtype(typ).itemsize*count
+        if self.index+length > self.end:
+            raise FBufError("End of fbuf reached")
+        r = string_to_array(self.buf,typ,count,self.index)
+        self.index += length
+        return r
+    def unpack(self,fmt):
+        size = struct.calcsize(fmt)
+        if self.index+size > self.end:
+            raise FBufError("End of fbuf reached")
+        r = struct.unpack_from(fmt,self.buf,self.index)
+        self.index += size
+        return r
+    def skip(self,length):
+        if length < 0 or self.index+length > self.end:
+            raise FBufError("End of fbuf reached")
+        self.index += length
     def read_to_nul(self):
-        try:
-            i = self.buf.index('\0',self.index,self.end)
-        except IndexError:
+        i = self.buf.find('\0',self.index,self.end)
+        if i == -1:
             raise FBufError("End of fbuf reached in string")
         r = self.buf[self.index:i]
         self.index = i+1
@@ -269,15 +292,15 @@ class ChunkBase(object):
 
     @staticmethod
     def get_short(fbuf,flags):
-        return struct.unpack("<H",fbuf.read(2))[0]
+        return fbuf.unpack("<H")[0]
 
     @staticmethod
     def get_long(fbuf,flags):
-        return struct.unpack("<L",fbuf.read(4))[0]
+        return fbuf.unpack("<L")[0]
 
     @staticmethod
     def get_float(fbuf,flags):
-        return struct.unpack("<f",fbuf.read(4))[0]
+        return fbuf.unpack("<f")[0]
 
     @staticmethod
     def get_string(fbuf,flags):
@@ -285,9 +308,16 @@ class ChunkBase(object):
 
     @staticmethod
     def get_chunk(fbuf,flags):
-        tag,length = struct.unpack("<HL",fbuf.read(6))
+        tag,length = fbuf.unpack("<HL")
         pos = fbuf.tell()
+        if length < 6 or pos+length-6 > fbuf.end:
+            raise FBufError("Invalid chunk length %d at position %d" % (length,pos-6))
         cls = ChunkMetaclass.chunk_taghash.get(tag)
+        only = flags.get('only')
+        if only is not None and (cls is None or cls.label not in only):
+            # not needed, skipped without being read
+            fbuf.skip(length-6)
+            return None
         try:
             if cls is not None:
                 ch = cls()
@@ -323,6 +353,8 @@ class ChunkBase(object):
 
         while fbuf.room_for_chunks():
             ch = self.get_chunk(fbuf,flags)
+            if ch is None:
+                continue
             label = ch.label
             if label == "ERROR":
                 label = ch.intended_label
@@ -624,8 +656,7 @@ class ArrayChunk(ChunkBase):
 
 class MatrixChunk(ArrayChunk):
     def read_array(self,fbuf,flags):
-        size = 48
-        a = string_to_array(fbuf.read(size),numpy.float32)
+        a = fbuf.read_array(numpy.float32,12)
         a = numpy.reshape(a,(4,3))
         m = numpy.zeros((4,4),numpy.float32)
         m[:,0:3] = a
@@ -995,10 +1026,8 @@ class POINT_ARRAY(ArrayChunk):
     tag = 0x4110
     struct = "short npoints"
     def read_array(self,fbuf,flags):
-        size = 12*self.npoints
-        a = string_to_array(fbuf.read(size),numpy.float32)
-        a = numpy.reshape(a,(self.npoints,3))
-        self.array = numpy.array(a)
+        a = fbuf.read_array(numpy.float32,3*self.npoints)
+        self.array = numpy.reshape(a,(self.npoints,3))
     def dump_array(self,flo,indent,flags):
         super(POINT_ARRAY,self).dump_array(flo,indent,flags)
         if flags['arraylines'] == 0:
@@ -1022,8 +1051,7 @@ class POINT_FLAG_ARRAY(ArrayChunk):
     tag = 0x4111
     struct = "short npoints"
     def read_array(self,fbuf,flags):
-        size = 2*self.npoints
-        self.array = string_to_array(fbuf.read(size),numpy.uint16)
+        self.array = fbuf.read_array(numpy.uint16,self.npoints)
     def write_array(self):
         s = numpy.array(self.array).astype(numpy.uint16)
         return array_to_string_destructive(s)
@@ -1035,10 +1063,8 @@ class FACE_ARRAY(ArrayChunk):
     multiple = 'MSH_MAT_GROUP materials'
     single = 'SMOOTH_GROUP smoothing, MSH_BOXMAP box'
     def read_array(self,fbuf,flags):
-        size = 8*self.nfaces
-        a = string_to_array(fbuf.read(size),numpy.uint16)
-        a = numpy.reshape(a,(self.nfaces,4))
-        self.array = numpy.array(a)
+        a = fbuf.read_array(numpy.uint16,4*self.nfaces)
+        self.array = numpy.reshape(a,(self.nfaces,4))
     def dump_array(self,flo,indent,flags):
         super(FACE_ARRAY,self).dump_array(flo,indent,flags)
         if flags['arraylines'] == 0:
@@ -1061,8 +1087,7 @@ class MSH_MAT_GROUP(ArrayChunk):
     tag = 0x4130
     struct = "string name, short mfaces"
     def read_array(self,fbuf,flags):
-        size = 2*self.mfaces
-        self.array = string_to_array(fbuf.read(size),numpy.uint16)
+        self.array = fbuf.read_array(numpy.uint16,self.mfaces)
     def dump_array(self,flo,indent,flags):
         super(MSH_MAT_GROUP,self).dump_array(flo,indent,flags)
         if flags['arraylines'] == 0:
@@ -1084,10 +1109,8 @@ class TEX_VERTS(ArrayChunk):
     tag = 0x4140
     struct = "short npoints"
     def read_array(self,fbuf,flags):
-        size = 8*self.npoints
-        a = string_to_array(fbuf.read(size),numpy.float32)
-        a = numpy.reshape(a,(self.npoints,2))
-        self.array = numpy.array(a)
+        a = fbuf.read_array(numpy.float32,2*self.npoints)
+        self.array = numpy.reshape(a,(self.npoints,2))
     def dump_array(self,flo,indent,flags):
         super(TEX_VERTS,self).dump_array(flo,indent,flags)
         if flags['arraylines'] == 0:
@@ -1109,7 +1132,7 @@ class TEX_VERTS(ArrayChunk):
 class SMOOTH_GROUP(ArrayChunk):
     tag = 0x4150
     def read_array(self,fbuf,flags):
-        self.array = string_to_array(fbuf.read_rest(),numpy.uint32)
+        self.array = fbuf.read_array(numpy.uint32,(fbuf.end-fbuf.tell())//4)
     def dump_array(self,flo,indent,flags):
         super(SMOOTH_GROUP,self).dump_array(flo,indent,flags)
         if flags['arraylines'] == 0:
@@ -1733,14 +1756,15 @@ class MAT_MAP_TEXBLUR_OLD(UndefinedChunk): tag = 0xA352
 # Functions to operate on chunks
 #
 
-def read_3ds_mem(membuf,check_magic=True,tight=False,recover=True):
+def read_3ds_mem(membuf,check_magic=True,tight=False,recover=True,only=None):
     """Create a 3DS DOM from a memory buffer.
 
         dom = read_3ds_mem(buffer,check_magic=True,tight=False,
-                           recover=True)
+                           recover=True,only=None)
 
     buffer: is an image of the 3DS file in memory.  It could be
-    a string, an mmaped file, or something else.
+    a string, an mmaped file, or something else.  The arrays of
+    the DOM share its memory.
 
     check_magic: If true, this function checks that the top level
     chunk is the 3DS magic chunk (0x4D4D), and raises an exception
@@ -1752,24 +1776,32 @@ def read_3ds_mem(membuf,check_magic=True,tight=False,recover=True):
     recover: Whether to emit an Error chunk when an error is found;
     otherwise raise an exception.
 
+    only: If given, a list of the labels of the chunks to read,
+    including their parents (for example M3DMAGIC, MDATA...).  The
+    other chunks are skipped by their length, without being read.
+
     """
 
     if check_magic:
-        tag,length = struct.unpack("<HL",membuf[:6])
+        tag,length = struct.unpack_from("<HL",membuf,0)
         if tag != 0x4D4D:
             raise File3dsFormatError("Not a 3D Studio file.")
     fbuf = FileLikeBuffer(membuf,0,len(membuf))
     flags = { 'tight': tight, 'recover': recover }
+    if only is not None:
+        flags['only'] = set(only)
     return ChunkBase.get_chunk(fbuf,flags)
 
 
-def read_3ds_file(filename,check_magic=True,tight=False,recover=True):
+def read_3ds_file(filename,check_magic=True,tight=False,recover=True,only=None):
     """Create a 3DS DOM from a file.
 
         dom = read_3ds_file(filename,check_magic=True,tight=False,
-                            recover=True)
+                            recover=True,only=None)
 
-    filename: name of a 3DS file.
+    filename: name of a 3DS file.  The file is memory mapped
+    (copy on write), so the arrays of the DOM are not copied
+    from it.
 
     check_magic: If true, this function checks that the top level
     chunk is the 3DS magic chunk (0x4D4D), and raises an exception
@@ -1781,13 +1813,20 @@ def read_3ds_file(filename,check_magic=True,tight=False,recover=True):
     recover: Whether to emit an Error chunk when an error is found;
     otherwise raise an exception.
 
+    only: If given, a list of the labels of the chunks to read
+    (see read_3ds_mem).
+
     """
 
     flo = open(filename,'rb')
     try:
-        return read_3ds_mem(flo.read(),check_magic,tight,recover)
+        if os.fstat(flo.fileno()).st_size < 6:
+            raise File3dsFormatError("Not a 3D Studio file.")
+        # the map stays open as long as arrays use it
+        membuf = mmap.mmap(flo.fileno(),0,access=mmap.ACCESS_COPY)
     finally:
         flo.close()
+    return read_3ds_mem(membuf,check_magic,tight,recover,only)
 
 
 def write_3ds_mem(dom,check_magic=True):
@@ -165,6 +165,51 @@ class ArchTest(unittest.TestCase):
         r = (w.Shape.Volume < 0.75)
         self.failUnless(r,"Arch Remove failed")
 
+    def testSchedule(self):
+        FreeCAD.Console.PrintLog ('Checking Arch Schedule filters...\n')
+        import ArchSchedule
+        s1 = Arch.makeStructure(length=2,width=3,height=5)
+        s2 = Arch.makeStructure(length=2,width=3,height=5)
+        m = Arch.makeMaterial("ScheduleConcrete")
+        s1.BaseMaterial = m
+        FreeCAD.ActiveDocument.recompute()
+        objs,index = ArchSchedule.getScheduleContents(s1.Name+";"+s2.Name+";"+m.Name)
+        result = ArchSchedule.filterObjects(objs,"Material:ScheduleConcrete",index)
+        self.assertEqual([o.Name for o in result],[s1.Name])
+        result = ArchSchedule.filterObjects(objs,"Type:Structure;!Material:ScheduleConcrete",index)
+        self.assertEqual([o.Name for o in result],[s2.Name])
+
+    def test3DS(self):
+        FreeCAD.Console.PrintLog ('Checking the 3DS reader...\n')
+        import numpy, struct, tempfile, import3DS
+        from Dice3DS import dom3ds
+        points = numpy.array([[0,0,0],[1,0,0],[0,1,0],[0,0,1]],numpy.float32)
+        faces = numpy.array([[0,1,2,0],[0,1,3,0],[0,2,3,0],[1,2,3,0]],numpy.uint16)
+        dom = dom3ds.M3DMAGIC(version=dom3ds.M3D_VERSION(number=3),
+                              mdata=dom3ds.MDATA(version=dom3ds.MESH_VERSION(number=3),
+                                                 objects=[dom3ds.NAMED_OBJECT(name="tetra",
+                                                          obj=dom3ds.N_TRI_OBJECT(points=dom3ds.POINT_ARRAY(npoints=4,array=points),
+                                                                                  faces=dom3ds.FACE_ARRAY(nfaces=4,array=faces)))]))
+        filename = os.path.join(tempfile.gettempdir(),"ArchTest.3ds")
+        dom3ds.write_3ds_file(filename,dom)
+        for only in [None,import3DS.CHUNKS]:
+            d = dom3ds.read_3ds_file(filename,only=only)
+            obj = d.mdata.objects[0]
+            self.failUnless(obj.name == "tetra","3DS object name not read")
+            self.failUnless((obj.obj.points.array == points).all(),"3DS points not read")
+            self.failUnless((obj.obj.faces.array == faces).all(),"3DS faces not read")
+            # chunks that are not asked for are skipped
+            self.failUnless((d.version is None) == (only is not None),"3DS chunks not skipped")
+        # a chunk shorter than its header
+        f = open(filename,"wb")
+        f.write(struct.pack("<HL",0x4D4D,24)+struct.pack("<HL",0x1234,0)+"\0"*12)
+        f.close()
+        for only in [None,["M3DMAGIC"]]:
+            self.assertRaises(dom3ds.FBufError,dom3ds.read_3ds_file,filename,recover=False,only=only)
+            d = dom3ds.read_3ds_file(filename,only=only)
+            self.failUnless(d.label == "ERROR","3DS error chunk not created")
+        os.remove(filename)
+
     def tearDown(self):
         FreeCAD.closeDocument("ArchTest")
         pass
@@ -80,26 +80,27 @@ def decode(name):
     return decodedName
 
 
+# the chunks used by read(), the others are skipped
+CHUNKS = ["M3DMAGIC","MDATA","NAMED_OBJECT","N_TRI_OBJECT","POINT_ARRAY","FACE_ARRAY","MESH_MATRIX"]
+
 def read(filename):
-    dom = dom3ds.read_3ds_file(filename,tight=False)
+    dom = dom3ds.read_3ds_file(filename,tight=False,only=CHUNKS)
 
     for j,d_nobj in enumerate(dom.mdata.objects):
         if type(d_nobj.obj) != dom3ds.N_TRI_OBJECT:
             continue
-        verts = []
-        if d_nobj.obj.points:
-            for d_point in d_nobj.obj.points.array:
-                verts.append([d_point[0],d_point[1],d_point[2]])
-            meshdata = []
-            for d_face in d_nobj.obj.faces.array:
-                meshdata.append([verts[int(d_face[i])] for i in xrange(3)])
-            m = [tuple(r) for r in d_nobj.obj.matrix.array]
-            m = m[0] + m[1] + m[2] + m[3]
-            placement = FreeCAD.Placement(FreeCAD.Matrix(*m))
-            mesh = Mesh.Mesh(meshdata)
+        if d_nobj.obj.points and d_nobj.obj.faces:
+            # the mesh is built from its shared vertices and the vertex
+            # indices of its faces, taken directly from the file arrays
+            verts = [FreeCAD.Vector(*p) for p in d_nobj.obj.points.array.tolist()]
+            faces = [tuple(f) for f in d_nobj.obj.faces.array[:,:3].tolist()]
+            if d_nobj.obj.matrix:
+                placement = FreeCAD.Placement(FreeCAD.Matrix(*d_nobj.obj.matrix.array.ravel().tolist()))
+            else:
+                placement = FreeCAD.Placement()
+            mesh = Mesh.Mesh((verts,faces))
             obj = FreeCAD.ActiveDocument.addObject("Mesh::Feature","Mesh")
             obj.Mesh = mesh
             obj.Placement = placement
         else:
             print "Skipping object without vertices array: ",d_nobj.obj
-
@@ -120,12 +120,242 @@ def doubleClickTree(item,column):
             addr[0].setSelected(True)
 
 
+def getBreps(ifcfile,products,settings,cores=0,cache=False,buffersize=256):
+    """getBreps(ifcfile,products,settings,[cores,cache,buffersize]): yields a
+    (product,brep,key) tuple for each of the given products, in the same order,
+    brep being the BREP string generated by IfcOpenShell, or None if the product
+    has no geometry. If cores is higher than 0 and the IfcOpenShell geometry
+    iterator is available, the geometry is generated on that number of cores.
+    The results of the iterator are kept until their product comes in turn, but
+    no more than buffersize of them: past that, the iterator has moved past the
+    current product, whose geometry is then generated on its own. If cache is
+    True, geometry is read from the on-disk cache when possible, and newly
+    generated geometry is stored there under the returned key (None otherwise)."""
+
+    import ifcopenshell
+    from ifcopenshell import geom
+    keys = {} # { id:cachekey }
+    cached = set() # ids of the products found in the cache
+    if cache:
+        for product in products:
+            key = getCacheKey(product)
+            keys[product.id()] = key
+            if os.path.exists(getCacheFile(key,"brep")):
+                cached.add(product.id())
+        if DEBUG: print len(cached),"products found in the cache"
+    todo = [p for p in products if not (p.id() in cached)]
+    iterator = None
+    if cores > 0 and hasattr(ifcopenshell.geom,"iterator") and todo:
+        # structural products need curves, they are done one by one below
+        settings.set(settings.INCLUDE_CURVES,False)
+        include = [p for p in todo if not (p.is_a() in structuralifcobjects)]
+        try:
+            iterator = ifcopenshell.geom.iterator(settings,ifcfile,cores,include=include)
+        except TypeError:
+            try:
+                iterator = ifcopenshell.geom.iterator(settings,ifcfile,cores)
+            except TypeError:
+                iterator = None
+        if iterator and not iterator.initialize():
+            iterator = None # no product with geometry in this file
+        if DEBUG and iterator: print "Using the geometry iterator on",cores,"cores"
+    wanted = set() # ids of the products expected from the iterator
+    if iterator:
+        wanted = set([p.id() for p in todo if not (p.is_a() in structuralifcobjects)])
+    results = {} # { id:brep } results of the iterator not yet yielded
+    for product in products:
+        pid = product.id()
+        if pid in cached:
+            data = readCache(keys[pid],"brep")
+            if data != None:
+                yield product,data or None,keys[pid]
+                continue
+        brep = None
+        single = True # the geometry is generated on its own
+        if pid in wanted:
+            # the iterator doesn't output products without geometry
+            hasgeometry = bool(getattr(product,"Representation",None))
+            if hasgeometry:
+                while (not pid in results) and iterator and (len(results) < buffersize):
+                    cr = iterator.get()
+                    if cr.id in wanted:
+                        results[cr.id] = cr.geometry.brep_data
+                    if not iterator.next():
+                        iterator = None
+            wanted.remove(pid) # dropped if the iterator outputs it later
+            if pid in results:
+                brep = results.pop(pid)
+                single = False
+            elif not (hasgeometry and iterator):
+                single = False
+        if single:
+            if product.is_a() in structuralifcobjects:
+                settings.set(settings.INCLUDE_CURVES,True)
+            else:
+                settings.set(settings.INCLUDE_CURVES,False)
+            try:
+                cr = ifcopenshell.geom.create_shape(settings,product)
+                brep = cr.geometry.brep_data
+            except:
+                pass # IfcOpenShell will yield an error if a given product has no shape, but we don't care
+        if cache:
+            writeCache(keys[pid],"brep",brep or "")
+        yield product,brep,keys.get(pid)
+
+
+def getCacheKey(product):
+    """getCacheKey(product): returns a string identifying the geometry of the
+    given product: its GlobalId and type, plus a hash of the entities that
+    define its shape (representation, placement and openings). Entity numbers
+    are replaced by their order of appearance, so renumbering a file doesn't
+    change the key."""
+
+    import hashlib,re
+    roots = [product.ObjectPlacement,product.Representation]
+    if not SEPARATE_OPENINGS:
+        for rel in getattr(product,"HasOpenings",None) or []:
+            roots.extend([rel.RelatedOpeningElement.ObjectPlacement,rel.RelatedOpeningElement.Representation])
+    lines = []
+    seen = set()
+    todo = list(reversed(roots))
+    while todo:
+        e = todo.pop()
+        if isinstance(e,(list,tuple)):
+            todo.extend(reversed(e))
+        elif hasattr(e,"is_a") and not (e.id() in seen):
+            seen.add(e.id())
+            lines.append(str(e))
+            todo.extend(reversed([e[i] for i in range(len(e))]))
+    numbers = {}
+    def renumber(match):
+        return "#" + str(numbers.setdefault(match.group(0),len(numbers)))
+    data = re.sub("#[0-9]+",renumber,"\n".join(lines))
+    data += str(product.is_a()) + str(SEPARATE_OPENINGS)
+    return str(product.GlobalId) + "-" + hashlib.sha1(data).hexdigest()
+
+
+def getCacheFolder():
+    "returns the folder of the on-disk cache"
+
+    return os.path.join(FreeCAD.ConfigGet("UserAppData"),"IfcCache")
+
+
+def getCacheFile(key,ext):
+    "returns the path of the on-disk cache file of the given key and type"
+
+    return os.path.join(getCacheFolder(),key[-2:],key+"."+ext)
+
+
+def readCache(key,ext):
+    "returns the data cached under the given key and type, or None"
+
+    path = getCacheFile(key,ext)
+    if os.path.exists(path):
+        f = pyopen(path,"rb")
+        data = f.read()
+        f.close()
+        try:
+            os.utime(path,None) # the least recently used files are pruned first
+        except OSError:
+            pass
+        return data
+    return None
+
+
+def writeCache(key,ext,data):
+    """stores the given data in the on-disk cache under the given key and type.
+    The data is written to a temporary file which is then renamed, so an
+    interrupted import never leaves a truncated entry"""
+
+    path = getCacheFile(key,ext)
+    if not os.path.exists(os.path.dirname(path)):
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            pass # created by another import
+    tmppath = path+"."+str(os.getpid())+".tmp"
+    f = pyopen(tmppath,"wb")
+    f.write(data)
+    f.close()
+    try:
+        os.rename(tmppath,path)
+    except OSError:
+        # on Windows the file may already exist, stored by another import
+        os.remove(tmppath)
+
+
+def pruneCache(maxsize):
+    """pruneCache(maxsize): removes the least recently used files of the on-disk
+    cache until it holds no more than maxsize megabytes"""
+
+    files = []
+    for folder,dirs,names in os.walk(getCacheFolder()):
+        for name in names:
+            path = os.path.join(folder,name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime,st.st_size,path))
+    files.sort(reverse=True)
+    size = 0
+    for mtime,fsize,path in files:
+        size += fsize
+        if size > maxsize*1048576:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def getExtrusion(shape,key=None):
+    """getExtrusion(shape,[key]): returns the extrusion data of the given shape,
+    like Arch.getExtrusionData, with the placement of the base face applied to
+    its geometry. If a cache key is given, the result is read from or stored in
+    the on-disk cache."""
+
+    if key:
+        data = readCache(key,"extr")
+        if data != None:
+            if not data:
+                return None
+            vec,brep = data.split("\n",1)
+            face = Part.Shape()
+            face.importBrepFromString(brep)
+            return [face,FreeCAD.Vector(*[float(v) for v in vec.split()])]
+    ex = Arch.getExtrusionData(shape)
+    if ex and not ex[0].Placement.isNull():
+        # bug in ifcopenshell? Some faces of a shell may have non-null placement
+        # workaround: apply the placement to the geometry of a copy of the face
+        m = ex[0].Placement.toMatrix()
+        face = ex[0].copy()
+        face.Placement = FreeCAD.Placement()
+        face.transformShape(m,True)
+        ex = [face,ex[1]]
+    if key:
+        if ex:
+            writeCache(key,"extr",repr(ex[1].x)+" "+repr(ex[1].y)+" "+repr(ex[1].z)+"\n"+ex[0].exportBrepToString())
+        else:
+            writeCache(key,"extr","")
+    return ex
+
+
+def timeStage(stages,name):
+    """timeStage(stages,name): appends to the given list of [name,time,duration]
+    stages a new stage with the given name, its duration being the time spent
+    since the previous stage"""
+
+    now = time.time()
+    stages.append([name,now,now-stages[-1][1]])
+
+
 def getPreferences():
     """retrieves IFC preferences"""
     global DEBUG, PREFIX_NUMBERS, SKIP, SEPARATE_OPENINGS
     global ROOT_ELEMENT, GET_EXTRUSIONS, MERGE_MATERIALS
     global MERGE_MODE_ARCH, MERGE_MODE_STRUCT, CREATE_CLONES
     global FORCE_BREP, IMPORT_PROPERTIES, STORE_UID, SERIALIZE
+    global MULTICORE, CACHE, CACHE_SIZE
     p = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/Arch")
     if FreeCAD.GuiUp and p.GetBool("ifcShowDialog",False):
         import FreeCADGui
@@ -149,6 +379,9 @@ def getPreferences():
     IMPORT_PROPERTIES = p.GetBool("ifcImportProperties",False)
     STORE_UID = p.GetBool("ifcStoreUid",True)
     SERIALIZE = p.GetBool("ifcSerialize",False)
+    MULTICORE = p.GetInt("ifcMulticore",0)
+    CACHE = p.GetBool("ifcCache",False)
+    CACHE_SIZE = p.GetInt("ifcCacheSize",500)
 
 
 def explore(filename=None):
@@ -363,6 +596,7 @@ def insert(filename,docname,skip=[],only=[],root=None):
     materials = ifcfile.by_type("IfcMaterial")
 
     if DEBUG: print "Building relationships table...",
+    stages = [["start",time.time()]]
 
     # building relations tables
     objects = {} # { id:object, ... }
@@ -403,6 +637,25 @@ def insert(filename,docname,skip=[],only=[],root=None):
                 mattable[o.id()] = r.RelatingMaterial.MaterialLayers[0].Material.id()
             elif r.RelatingMaterial.is_a("IfcMaterialLayerSetUsage"):
                 mattable[o.id()] = r.RelatingMaterial.ForLayerSet.MaterialLayers[0].Material.id()
+    if DEBUG: timeStage(stages,"relationships")
+
+    # indexing representation items, so styles can be matched by a dictionary lookup
+    itemproducts = {} # { itemid:[productid,...] } first items of product representations
+    for p in ifcfile.by_type("IfcProduct"):
+        if hasattr(p,"Representation"):
+            if p.Representation:
+                for it in p.Representation.Representations:
+                    if it.Items:
+                        itemproducts.setdefault(it.Items[0].id(),[]).append(p.id())
+                        if it.Items[0].is_a("IfcBooleanResult"):
+                            itemproducts.setdefault(it.Items[0].FirstOperand.id(),[]).append(p.id())
+    itemmaterials = {} # { itemid:[materialid,...] } first items of material representations
+    for m in ifcfile.by_type("IfcMaterialDefinitionRepresentation"):
+        for it in m.Representations:
+            if it.Items:
+                itemmaterials.setdefault(it.Items[0].id(),[]).append(m.RepresentedMaterial.id())
+    if DEBUG: timeStage(stages,"indexing")
+
     for r in ifcfile.by_type("IfcStyledItem"):
         if r.Styles:
             if r.Styles[0].is_a("IfcPresentationStyleAssignment"):
@@ -411,22 +664,12 @@ def insert(filename,docname,skip=[],only=[],root=None):
                         if r.Styles[0].Styles[0].Styles[0].SurfaceColour:
                             c = r.Styles[0].Styles[0].Styles[0].SurfaceColour
                             if r.Item:
-                                for p in ifcfile.by_type("IfcProduct"):
-                                    if hasattr(p,"Representation"):
-                                        if p.Representation:
-                                            for it in p.Representation.Representations:
-                                                if it.Items:
-                                                    if it.Items[0].id() == r.Item.id():
-                                                        colors[p.id()] = (c.Red,c.Green,c.Blue)
-                                                    elif it.Items[0].is_a("IfcBooleanResult"):
-                                                        if (it.Items[0].FirstOperand.id() == r.Item.id()):
-                                                            colors[p.id()] = (c.Red,c.Green,c.Blue)
+                                for pid in itemproducts.get(r.Item.id(),[]):
+                                    colors[pid] = (c.Red,c.Green,c.Blue)
                         else:
-                            for m in ifcfile.by_type("IfcMaterialDefinitionRepresentation"):
-                                for it in m.Representations:
-                                    if it.Items:
-                                        if it.Items[0].id() == r.id():
-                                            colors[m.RepresentedMaterial.id()] = (c.Red,c.Green,c.Blue)
+                            for mid in itemmaterials.get(r.id(),[]):
+                                colors[mid] = (c.Red,c.Green,c.Blue)
+    if DEBUG: timeStage(stages,"styles")
 
     if only: # only import a list of IDs and their children
         ids = []
@@ -437,6 +680,22 @@ def insert(filename,docname,skip=[],only=[],root=None):
                 only.extend(additions[currentid])
         products = [ifcfile[currentid] for currentid in ids]
 
+    # skipped products are removed beforehand, so no geometry is generated for them
+    kept = []
+    for product in products:
+        ptype = product.is_a()
+        archobj = not (ptype in structuralifcobjects)
+        if MERGE_MODE_ARCH == 4 and archobj:
+            continue
+        if MERGE_MODE_STRUCT == 3 and not archobj:
+            continue
+        if product.id() in skip: # user given id skip list
+            continue
+        if ptype in SKIP: # preferences-set type skip list
+            continue
+        kept.append(product)
+    products = kept
+
     if DEBUG: print "done."
 
     count = 0
@@ -446,7 +705,7 @@ def insert(filename,docname,skip=[],only=[],root=None):
     if DEBUG: print "Processing objects..."
 
     # products
-    for product in products:
+    for product,brep,cachekey in getBreps(ifcfile,products,settings,MULTICORE,CACHE):
 
         pid = product.id()
         guid = product.GlobalId
@@ -458,7 +717,6 @@ def insert(filename,docname,skip=[],only=[],root=None):
         if PREFIX_NUMBERS: name = "ID" + str(pid) + " " + name
         obj = None
         baseobj = None
-        brep = None
         shape = None
 
         archobj = True  # assume all objects not in structuralifcobjects are architecture
@@ -469,18 +727,6 @@ def insert(filename,docname,skip=[],only=[],root=None):
             if DEBUG: print " (struct)",
         else:
             if DEBUG: print " (arch)",
-        if MERGE_MODE_ARCH == 4 and archobj:
-            if DEBUG: print " skipped."
-            continue
-        if MERGE_MODE_STRUCT == 3 and not archobj:
-            if DEBUG: print " skipped."
-            continue
-        if pid in skip: # user given id skip list
-            if DEBUG: print " skipped."
-            continue
-        if ptype in SKIP: # preferences-set type skip list
-            if DEBUG: print " skipped."
-            continue
 
         # detect if this object is sharing its shape
         clone = None
@@ -501,16 +747,6 @@ def insert(filename,docname,skip=[],only=[],root=None):
                             sharedobjects[bid] = None
                             store = bid
 
-        if structobj:
-            settings.set(settings.INCLUDE_CURVES,True)
-        else:
-            settings.set(settings.INCLUDE_CURVES,False)
-        try:
-            cr = ifcopenshell.geom.create_shape(settings,product)
-            brep = cr.geometry.brep_data
-        except:
-            pass # IfcOpenShell will yield an error if a given product has no shape, but we don't care
-
         if brep:
             if DEBUG: print " ",str(len(brep)/1000),"k ",
 
@@ -536,22 +772,11 @@ def insert(filename,docname,skip=[],only=[],root=None):
                         if DEBUG: print "clone ",
                     else:
                         if GET_EXTRUSIONS:
-                            ex = Arch.getExtrusionData(shape)
+                            ex = getExtrusion(shape,cachekey)
                             if ex:
                                 print "extrusion ",
                                 baseface = FreeCAD.ActiveDocument.addObject("Part::Feature",name+"_footprint")
-                                # bug in ifcopenshell? Some faces of a shell may have non-null placement
-                                # workaround to remove the bad placement: exporting/reimporting as step
-                                if not ex[0].Placement.isNull():
-                                    import tempfile
-                                    fd, tf = tempfile.mkstemp(suffix=".stp")
-                                    ex[0].exportStep(tf)
-                                    f = Part.read(tf)
-                                    os.close(fd)
-                                    os.remove(tf)
-                                else:
-                                    f = ex[0]
-                                baseface.Shape = f
+                                baseface.Shape = ex[0]
                                 baseobj = FreeCAD.ActiveDocument.addObject("Part::Extrusion",name+"_body")
                                 baseobj.Base = baseface
                                 baseobj.Dir = ex[1]
@@ -714,10 +939,16 @@ def insert(filename,docname,skip=[],only=[],root=None):
                         break
 
         count += 1
-        progressbar.next()
+        try:
+            progressbar.next(True)
+        except RuntimeError: # raised when the user aborts the progress indicator
+            FreeCAD.Console.PrintWarning("IFC import cancelled by the user\n")
+            break
 
     progressbar.stop()
+    if DEBUG: timeStage(stages,"products")
     FreeCAD.ActiveDocument.recompute()
+    if DEBUG: timeStage(stages,"recompute")
 
     if MERGE_MODE_STRUCT == 2:
 
@@ -848,6 +1079,7 @@ def insert(filename,docname,skip=[],only=[],root=None):
                     Arch.rebuildArchShape(obj)
 
     FreeCAD.ActiveDocument.recompute()
+    if DEBUG: timeStage(stages,"relations")
 
     # 2D elements
 
@@ -882,12 +1114,16 @@ def insert(filename,docname,skip=[],only=[],root=None):
         count += 1
 
     FreeCAD.ActiveDocument.recompute()
+    if DEBUG: timeStage(stages,"annotations")
 
     # Materials
 
     if DEBUG and materials: print "Creating materials..."
     print "mattable:",mattable
     print "materials:",materials
+    matobjects = {} # { matid:[objid,...] }
+    for o,m in mattable.items():
+        matobjects.setdefault(m,[]).append(o)
     fcmats = {}
     for material in materials:
         name = "Material"
@@ -903,13 +1139,18 @@ def insert(filename,docname,skip=[],only=[],root=None):
             if mdict:
                 mat.Material = mdict
             fcmats[name] = mat
-        for o,m in mattable.items():
-            if m == material.id():
-                if o in objects:
-                    if hasattr(objects[o],"BaseMaterial"):
-                        objects[o].BaseMaterial = mat
+        for o in matobjects.get(material.id(),[]):
+            if o in objects:
+                if hasattr(objects[o],"BaseMaterial"):
+                    objects[o].BaseMaterial = mat
 
     FreeCAD.ActiveDocument.recompute()
+    if CACHE:
+        pruneCache(CACHE_SIZE)
+    if DEBUG:
+        timeStage(stages,"materials")
+        for stage in stages[1:]:
+            print stage[0],":",round(stage[2],3),"s"
 
     if FreeCAD.GuiUp:
         import FreeCADGui
@@ -953,7 +1194,7 @@ def export(exportList,filename):
     of.write(template.encode("utf8"))
     of.close()
     os.close(templatefilehandle)
-    global ifcfile, surfstyles, clones, sharedobjects
+    global ifcfile, surfstyles, clones, clonebases, sharedobjects
     ifcfile = ifcopenshell.open(templatefile)
     history = ifcfile.by_type("IfcOwnerHistory")[0]
     context = ifcfile.by_type("IfcGeometricRepresentationContext")[0]
@@ -963,6 +1204,7 @@ def export(exportList,filename):
     products = {} # { Name: IfcEntity, ... }
     surfstyles = {} # { (r,g,b): IfcEntity, ... }
     clones = {} # { Basename:[Clonename1,Clonename2,...] }
+    clonebases = {} # { Name:Basename } for bases and clones
     sharedobjects = {} # { BaseName: IfcRepresentationMap }
     count = 1
     groups = {} # { Host: [Child,Child,...] }
@@ -973,6 +1215,21 @@ def export(exportList,filename):
             b = Draft.getCloneBase(o,strict=True)
             if b:
                 clones.setdefault(b.Name,[]).append(o.Name)
+        # objects with identical geometry are exported as clones too
+        geometries = {} # { key:Basename }
+        for o in objectslist:
+            if (o.Name in clones) or Draft.getCloneBase(o,strict=True):
+                continue
+            key = getGeometryKey(o,forcebrep=(getBrepFlag(o) or FORCE_BREP))
+            if key:
+                if key in geometries:
+                    clones.setdefault(geometries[key],[]).append(o.Name)
+                else:
+                    geometries[key] = o.Name
+        for k,v in clones.items():
+            clonebases[k] = k
+            for n in v:
+                clonebases[n] = k
 
     #print "clones table: ",clones
     #print objectslist
@@ -1020,11 +1277,7 @@ def export(exportList,filename):
             ifctype = "IfcBuildingElementProxy"
 
         # getting the "Force BREP" flag
-        brepflag = False
-        if hasattr(obj,"IfcAttributes"):
-            if "FlagForceBrep" in obj.IfcAttributes.keys():
-                if obj.IfcAttributes["FlagForceBrep"] == "True":
-                    brepflag = True
+        brepflag = getBrepFlag(obj)
 
         # getting the representation
         representation,placement,shapetype = getRepresentation(ifcfile,context,obj,forcebrep=(brepflag or FORCE_BREP))
@@ -1310,6 +1563,37 @@ def export(exportList,filename):
     os.remove(templatefile)
 
 
+def getBrepFlag(obj):
+    """returns True if the given object has the FlagForceBrep IFC attribute set"""
+
+    if hasattr(obj,"IfcAttributes"):
+        if "FlagForceBrep" in obj.IfcAttributes.keys():
+            if obj.IfcAttributes["FlagForceBrep"] == "True":
+                return True
+    return False
+
+
+def getGeometryKey(obj,forcebrep=False):
+    """getGeometryKey(obj,[forcebrep]): returns a string identifying the geometry
+    of the given object regardless of its placement, so objects with the same key
+    can share one IfcRepresentationMap, or None if the object would not be
+    exported as a BREP"""
+
+    if not obj.isDerivedFrom("Part::Feature"):
+        return None
+    if (not forcebrep) and hasattr(obj,"Proxy") and hasattr(obj.Proxy,"getProfiles"):
+        # extrusions are exported with their own placement
+        if len(obj.Proxy.getProfiles(obj,noplacement=True)) == 1:
+            if not DraftVecUtils.isNull(obj.Proxy.getExtrusionVector(obj,noplacement=True)):
+                return None
+    shape = obj.Shape
+    if shape.isNull() or not (shape.Solids or shape.Shells):
+        return None
+    if not obj.Placement.multiply(shape.Placement.inverse()).isNull():
+        return None
+    return Draft.getShapeBrepKey(shape)
+
+
 def getRepresentation(ifcfile,context,obj,forcebrep=False,subtraction=False,tessellation=1):
     """returns an IfcShapeRepresentation object or None"""
 
@@ -1322,24 +1606,24 @@ def getRepresentation(ifcfile,context,obj,forcebrep=False,subtraction=False,tess
 
     # check for clones
     if not subtraction:
-        for k,v in clones.items():
-            if (obj.Name == k ) or (obj.Name in v):
-                if k in sharedobjects:
-                    # base shape already exists
-                    repmap = sharedobjects[k]
-                    pla = obj.Placement
-                    axis1 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(1,0,0))))
-                    axis2 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(0,1,0))))
-                    axis3 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(0,0,1))))
-                    origin = ifcfile.createIfcCartesianPoint(tuple(FreeCAD.Vector(pla.Base).multiply(0.001)))
-                    transf = ifcfile.createIfcCartesianTransformationOperator3D(axis1,axis2,origin,1.0,axis3)
-                    mapitem = ifcfile.createIfcMappedItem(repmap,transf)
-                    shapes = [mapitem]
-                    solidType = "MappedRepresentation"
-                    shapetype = "clone"
-                else:
-                    # base shape not yet created
-                    tostore = k
+        k = clonebases.get(obj.Name)
+        if k:
+            if k in sharedobjects:
+                # base shape already exists
+                repmap = sharedobjects[k]
+                pla = obj.Placement
+                axis1 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(1,0,0))))
+                axis2 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(0,1,0))))
+                axis3 = ifcfile.createIfcDirection(tuple(pla.Rotation.multVec(FreeCAD.Vector(0,0,1))))
+                origin = ifcfile.createIfcCartesianPoint(tuple(FreeCAD.Vector(pla.Base).multiply(0.001)))
+                transf = ifcfile.createIfcCartesianTransformationOperator3D(axis1,axis2,origin,1.0,axis3)
+                mapitem = ifcfile.createIfcMappedItem(repmap,transf)
+                shapes = [mapitem]
+                solidType = "MappedRepresentation"
+                shapetype = "clone"
+            else:
+                # base shape not yet created
+                tostore = k
 
     if (not shapes) and (not forcebrep):
         profile = None
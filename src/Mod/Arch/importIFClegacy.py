@@ -30,6 +30,7 @@
 
 import FreeCAD, Arch, Draft, os, sys, time, Part, DraftVecUtils, uuid, math, re
 from DraftTools import translate
+from SCL import Part21
 
 __title__="FreeCAD IFC importer"
 __author__ = "Yorik van Havre"
@@ -1401,6 +1402,40 @@ def explore(filename=None):
         
 # IfcReader #############################################
 
+# attribute tokens: typed values such as IFCLABEL('a'), which are kept whole,
+# strings, parenthesis, commas, and anything else without surrounding spaces
+IFCTOKEN_RE = re.compile(r"[A-Za-z_]\w*\s*\((?:'(?:[^']|'')*'|[^()'])*\)|'(?:[^']|'')*'|[(),]|[^'(),\s](?:[^'(),]*[^'(),\s])?")
+
+def decodeValue(s):
+    "turns a token of an attributes string into a python value"
+    if s[0] == "'" and s[-1] == "'": # string
+        return s[1:-1]
+    elif s == "$":
+        return None
+    try:
+        return float(s) # number, any kind
+    except ValueError:
+        return s # ref, enum or other
+
+def parseValues(attrs_str):
+    '''parseValues(string): returns the list of values of an attributes
+    string, in one pass. Aggregates are returned as nested lists.'''
+    stack = []
+    top = []
+    for token in IFCTOKEN_RE.findall(attrs_str):
+        if token == ",":
+            continue
+        elif token == "(":
+            stack.append(top)
+            top = []
+        elif token == ")":
+            l = top
+            top = stack.pop() if stack else []
+            top.append(l)
+        else:
+            top.append(decodeValue(token))
+    return top
+
 class IfcSchema:
     SIMPLETYPES = ["INTEGER", "REAL", "STRING", "NUMBER", "LOGICAL", "BOOLEAN"]
     NO_ATTR = ["WHERE", "INVERSE","WR2","WR3", "WR4", "WR5", "UNIQUE", "DERIVE"]
@@ -1413,12 +1448,13 @@ class IfcSchema:
             filename = p + os.sep + filename
             if not os.path.exists(filename):
                 raise ImportError("no IFCSchema file found!")
-
-            self.file = open(self.filename)
-            self.data = self.file.read()
-            self.types = self.readTypes()
-            self.entities = self.readEntities()
-            if DEBUG: print "Parsed from schema %s: %s entities and %s types" % (self.filename, len(self.entities), len(self.types))
+        self.file = pyopen(filename)
+        self.data = self.file.read()
+        self.file.close()
+        self.types = self.readTypes()
+        self.entities = self.readEntities()
+        self.attributes = {}
+        if DEBUG: print "Parsed from schema %s: %s entities and %s types" % (self.filename, len(self.entities), len(self.types))
 
     def readTypes(self):
         """
@@ -1477,16 +1513,19 @@ class IfcSchema:
         """
         Get all attributes af an entity, including supertypes
         """
+        if name in self.attributes:
+            return self.attributes[name]
         ent = self.entities[name]
 
         attrs = []
         while ent != None:
-            this_ent_attrs = copy.copy(ent["attributes"])
+            this_ent_attrs = list(ent["attributes"])
             this_ent_attrs.reverse()
             attrs.extend(this_ent_attrs)
             ent = self.entities.get(ent["supertype"], None)
 
         attrs.reverse()
+        self.attributes[name] = attrs
         return attrs
 
     def capitalize(self, name):
@@ -1499,8 +1538,9 @@ class IfcSchema:
 
 class IfcFile:
     """
-    Parses an ifc file given by filename, entities can be retrieved by name and id
-    The whole file is stored in a dictionary (in memory)
+    Parses an ifc file given by filename, entities can be retrieved by name and id.
+    Only the type and the raw attributes string of each entity are kept in
+    memory, attributes are parsed when they are needed (see parseAttributes)
     """
     
     entsById = {}
@@ -1509,68 +1549,72 @@ class IfcFile:
     def __init__(self, filename,schema):
         self.filename = filename
         self.schema = IfcSchema(schema)
-        self.file = open(self.filename)
+        self.file = pyopen(self.filename,"rb")
         self.entById, self.entsByName, self.header = self.read()
         self.file.close()
         if DEBUG: print "Parsed from file %s: %s entities" % (self.filename, len(self.entById))
     
     def getEntityById(self, id):
-        return self.entById.get(id, None)
+        "returns the parsed entity with the given id, as a {id,name,attributes} dict"
+        if not id in self.entById:
+            return None
+        name,attrs = self.entById[id]
+        return {"id": str(id), "name": name, "attributes": self.parseAttributes(name, attrs)}
     
     def getEntitiesByName(self, name):
         return self.entsByName.get(name, None)
 
     def read(self):
         """
-        Returns 2 dictionaries, entById and entsByName
+        Returns 2 dictionaries, entById (id: (name, attributes string))
+        and entsByName (name: [ids]), and the header
         """
         entById = {}
         entsByName = {}
         header = 'HEADER '
         readheader = False
-        for line in self.file:
-            e = self.parseLine(line)
+        for record in Part21.iter_records(self.file):
+            e = self.parseLine(record)
             if e:
-                entById[int(e["id"])] = e
-                ids = e.get(e["name"],[])
-                ids.append(e["id"])
-                entsByName[e["name"]] = list(set(ids))
-            elif 'HEADER' in line:
+                id,name,attrs = e
+                entById[id] = (name,attrs)
+                if name in entsByName:
+                    entsByName[name].append(id)
+                else:
+                    entsByName[name] = [id]
+            elif record == 'HEADER':
                 readheader = True
             elif readheader:
-                if 'ENDSEC' in line:
+                if record == 'ENDSEC':
                     readheader = False
                 else:
-                    header += line
+                    header += record + ";\n"
                     
         return [entById, entsByName, header]
 
     def parseLine(self, line):
         """
-        Parse a line 
+        Splits a record into its (id, name, attributes string), or returns
+        False if it is not an entity
         """ 
-        m = IFCLINE_RE.search(line)  # id,name,attrs
-        if m:
-            id, name, attrs = m.groups()
-            id = id.strip()
-            name = name.strip()
-            attrs = attrs.strip()
-        else:
+        if not line.startswith("#"):
             return False
-        
-        return {"id": id, "name": name, "attributes": self.parseAttributes(name, attrs)}
+        eq = line.find("=")
+        start = line.find("(",eq)
+        end = line.rfind(")")
+        if (eq == -1) or (start == -1) or (end < start):
+            return False
+        try:
+            id = int(line[1:eq])
+        except ValueError:
+            return False
+        return id, line[eq+1:start].strip(), line[start+1:end]
 
     def parseAttributes(self, ent_name, attrs_str):
         """
         Parse the attributes of a line
         """
-        parts = []
-        lastpos = 0
-        
-        while lastpos < len(attrs_str):
-            newpos = self.nextString(attrs_str, lastpos)
-            parts.extend(self.parseAttribute(attrs_str[lastpos:newpos-1]))
-            lastpos = newpos
+        parts = parseValues(attrs_str)
         
         schema_attributes = self.schema.getAttributes(ent_name)
 
@@ -1582,64 +1626,23 @@ class IfcFile:
         
         return dict(zip(attribute_names, parts))
 
-    def parseAttribute(self, attr_str):
-        """
-        Map a single attribute to a python type (recursively)
-        """
-        parts = []
-        lastpos = 0
-        while lastpos < len(attr_str):
-            newpos = self.nextString(attr_str, lastpos)
-            s = attr_str[lastpos:newpos-1]
-            if (s[0] == "(" and s[-1] == ")"): # list, recurse
-                parts.append(self.parseAttribute(s[1:-1]))
-            else:
-                try:
-                    parts.append(float(s)) # number, any kind
-                except ValueError:
-                    if s[0] == "'" and s[-1] == "'": # string
-                        parts.append(s[1:-1])
-                    elif s == "$":
-                        parts.append(None)
-                    else:
-                        parts.append(s) # ref, enum or other
-
-            lastpos = newpos
-        
-        return parts
-
-
-    def nextString(self, s, start):
-        """
-        Parse the data part of a line
-        """
-        parens = 0
-        quotes = 0
-
-        for pos in range(start,len(s)):
-            c = s[pos]
-            if c == "," and parens == 0 and quotes == 0:
-                return pos+1
-            elif c == "(" and quotes == 0:
-                parens += 1
-            elif c == ")" and quotes == 0:
-                parens -= 1
-            elif c == "\'" and quotes == 0:
-                quotes = 1
-            elif c =="\'" and quotes == 1:
-                quotes = 0
-            
-        return len(s)+1                  
-
 class IfcEntity:
-    "a container for an IFC entity"
+    """a container for an IFC entity. Its attributes are decoded by its
+    document the first time one of them is accessed"""
     def __init__(self,ent,doc=None):
         self.data = ent
-        self.id = int(ent['id'])
-        self.type = ent['name'].upper().strip(",[]()")
-        self.attributes = ent['attributes']
+        self.id = ent[0]
+        self.type = ent[1].upper().strip(",[]()")
         self.doc = doc
 
+    def __getattr__(self,attr):
+        if attr.startswith("__") or ("attributes" in self.__dict__) or (not self.doc):
+            raise AttributeError(attr)
+        self.doc.decode(self)
+        if attr in self.__dict__:
+            return self.__dict__[attr]
+        raise AttributeError(attr)
+
     def __repr__(self):
         return str(self.id) + ' : ' + self.type + ' ' + str(self.attributes)
 
@@ -1671,39 +1674,48 @@ class IfcEntity:
 
     def getAttribute(self,attr):
         "returns the value of the given attribute, if exists"
-        if hasattr(self,attr):
-            return self.__dict__[attr]
-        return None
+        return getattr(self,attr,None)
             
 class IfcDocument:
     "an object representing an IFC document"
     def __init__(self,filename,schema="IFC2X3_TC1.exp"):
         f = IfcFile(filename,schema)
+        self.file = f
         self.filename = filename
         self.data = f.entById
         self.Entities = {0:f.header}
-        for k,e in self.data.iteritems():
-            eid = int(e['id'])
-            self.Entities[eid] = IfcEntity(e,self)
-        if DEBUG: print len(self.Entities),"entities created. Creating attributes..."
-        for k,ent in self.Entities.iteritems():
-            if DEBUG: print "attributing entity ",ent
-            if hasattr(ent,"attributes"):
-                for k,v in ent.attributes.iteritems():
-                    if DEBUG: print "parsing attribute: ",k," value ",v
-                    if isinstance(v,str):
-                        val = self.__clean__(v)
-                    elif isinstance(v,list):
-                        val = []
-                        for item in v:
-                            if isinstance(item,str):
-                                val.append(self.__clean__(item))
-                            else:
-                                val.append(item)
+        for eid,e in self.data.iteritems():
+            self.Entities[eid] = IfcEntity((eid,e[0],e[1]),self)
+        # entity lists by type, and indexes built by find()
+        self.types = {}
+        for name,ids in f.entsByName.iteritems():
+            ifctype = name.upper().strip(",[]()")
+            self.types.setdefault(ifctype,[]).extend([self.Entities[i] for i in ids])
+        self.indexes = {}
+        if DEBUG: print len(self.Entities),"entities created"
+
+    def decode(self,ent):
+        "parses and sets the attributes of the given entity"
+        if DEBUG: print "attributing entity ",ent.id
+        try:
+            ent.attributes = self.file.parseAttributes(ent.data[1],ent.data[2])
+        except Exception:
+            if DEBUG: print "error parsing attributes of entity",ent.id
+            ent.attributes = {}
+        for k,v in ent.attributes.iteritems():
+            if DEBUG: print "parsing attribute: ",k," value ",v
+            if isinstance(v,str):
+                val = self.__clean__(v)
+            elif isinstance(v,list):
+                val = []
+                for item in v:
+                    if isinstance(item,str):
+                        val.append(self.__clean__(item))
                     else:
-                        val = v
-                    setattr(ent,k.strip(),val)
-        if DEBUG: print "Document successfully created"
+                        val.append(item)
+            else:
+                val = v
+            setattr(ent,k.strip(),val)
 
     def __clean__(self,value):
         "turns an attribute value into something usable"
@@ -1753,25 +1765,13 @@ class IfcDocument:
             if ref in self.Entities:
                 return self.Entities[ref]
         elif isinstance(ref,str):
-            l = []
-            ref = ref.upper()
-            for k,ob in self.Entities.iteritems():
-                if hasattr(ob,"type"):
-                    if ob.type == ref:
-                        l.append(ob)
-            return l
+            return list(self.types.get(ref.upper(),[]))
         return None
 
     def search(self,pat):
         "searches entities types for partial match"
-        l = []
         pat = pat.upper()
-        for k,ob in self.Entities.iteritems():
-            if hasattr(ob,"type"):
-                if pat in ob.type:
-                    if not ob.type in l:
-                        l.append(ob.type)
-        return l
+        return [t for t in self.types.keys() if pat in t]
 
     def find(self,pat1,pat2=None,pat3=None):
         '''finds objects in the current IFC document.
@@ -1781,13 +1781,28 @@ class IfcDocument:
           property "property" has the given value
         '''
         if pat3:
-            bobs = self.getEnt(pat1)
-            obs = []
-            for bob in bobs:
-                if hasattr(bob,pat2):
-                    if bob.getAttribute(pat2) == pat3:
-                        obs.append(bob)
-            return obs
+            # the objects of each type are indexed by the values of the
+            # searched property the first time it is searched
+            key = (pat1.upper(),pat2)
+            if not key in self.indexes:
+                index = {}
+                for bob in self.getEnt(pat1):
+                    if hasattr(bob,pat2):
+                        v = bob.getAttribute(pat2)
+                        values = v if isinstance(v,list) else [v]
+                        for v in values:
+                            try:
+                                l = index.setdefault(v,[])
+                            except TypeError: # unhashable value
+                                continue
+                            if not bob in l:
+                                l.append(bob)
+                self.indexes[key] = index
+            index = self.indexes[key]
+            try:
+                return list(index.get(pat3,[]))
+            except TypeError: # unhashable value, scan the objects
+                return [bob for bob in self.getEnt(pat1) if hasattr(bob,pat2) and bob.getAttribute(pat2) == pat3]
         elif pat1:
             ll = self.search(pat1)
             obs = []
@@ -1796,6 +1811,32 @@ class IfcDocument:
             return obs
         return None
 
+def benchmark(filenames,schema=None):
+    '''benchmark(filenames,[schema]): reads the given IFC files with the
+    internal parser, decodes the attributes of all their entities, and
+    returns a list of (filename, size in bytes, number of entities, reading
+    time, decoding time) tuples'''
+    global DEBUG
+    if not schema:
+        schema = getSchema()
+    debug = DEBUG
+    DEBUG = False
+    results = []
+    try:
+        for filename in filenames:
+            t1 = time.time()
+            ifc = IfcDocument(filename,schema)
+            t2 = time.time()
+            for ent in ifc.Entities.itervalues():
+                if isinstance(ent,IfcEntity):
+                    ent.attributes
+            t3 = time.time()
+            results.append((filename,os.path.getsize(filename),len(ifc.Entities)-1,t2-t1,t3-t2))
+            FreeCAD.Console.PrintMessage("%s: %i bytes, %i entities, read in %.3fs, decoded in %.3fs\n" % results[-1])
+    finally:
+        DEBUG = debug
+    return results
+
 def explorer(filename,schema="IFC2X3_TC1.exp"):
     "returns a PySide dialog showing the contents of an IFC file"
     from PySide import QtCore,QtGui
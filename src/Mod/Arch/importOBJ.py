@@ -42,12 +42,24 @@ def findVert(aVertex,aList):
                     return i
     return None
 
+def getVertKey(point):
+    "returns a hashable key for the given vector, rounded to the Draft precision"
+    return (round(point.x,p),round(point.y,p),round(point.z,p))
+
+def getVertIndex(aList):
+    "returns a dictionary of vertex keys and their first index in aList"
+    index = {}
+    for i,v in enumerate(aList):
+        index.setdefault(getVertKey(v.Point),i)
+    return index
+
 def getIndices(shape,offset):
     "returns a list with 2 lists: vertices and face indexes, offsetted with the given amount"
     vlist = []
     elist = []
     flist = []
     curves = None
+    index = None
     for e in shape.Edges:
         try:
             if not isinstance(e.Curve,Part.Line):
@@ -61,20 +73,21 @@ def getIndices(shape,offset):
             break
     if curves:
         for v in curves[0]:
-            vlist.append(" "+str(round(v.x,p))+" "+str(round(v.y,p))+" "+str(round(v.z,p)))
+            vlist.append(" %s %s %s" % getVertKey(v))
         for f in curves[1]:
-            fi = ""
-            for vi in f:
-                fi += " " + str(vi + offset)
-            flist.append(fi)
+            flist.append(" "+" ".join([str(vi + offset) for vi in f]))
     else:
-        for v in shape.Vertexes:
-            vlist.append(" "+str(round(v.X,p))+" "+str(round(v.Y,p))+" "+str(round(v.Z,p)))
+        # vertices are looked up by their rounded coordinates instead of
+        # searching the whole list each time (see findVert)
+        vertexes = shape.Vertexes
+        index = getVertIndex(vertexes)
+        for v in vertexes:
+            vlist.append(" %s %s %s" % getVertKey(v.Point))
         if not shape.Faces:
             for e in shape.Edges:
                 if DraftGeomUtils.geomType(e) == "Line":
-                    ei = " " + str(findVert(e.Vertexes[0],shape.Vertexes) + offset)
-                    ei += " " + str(findVert(e.Vertexes[-1],shape.Vertexes) + offset)
+                    ei = " " + str(index[getVertKey(e.Vertexes[0].Point)] + offset)
+                    ei += " " + str(index[getVertKey(e.Vertexes[-1].Point)] + offset)
                     elist.append(ei)
         for f in shape.Faces:
             if len(f.Wires) > 1:
@@ -83,18 +96,17 @@ def getIndices(shape,offset):
                 for fdata in tris[1]:
                     fi = ""
                     for vi in fdata:
-                        vdata = Part.Vertex(tris[0][vi])
-                        fi += " " + str(findVert(vdata,shape.Vertexes) + offset)
+                        ind = index.get(getVertKey(tris[0][vi]))
+                        if ind == None:
+                            return None,None,None
+                        fi += " " + str(ind + offset)
                     flist.append(fi)
             else:
                 fi = ""
                 # OCC vertices are unsorted. We need to sort in the right order...
                 edges = Part.__sortEdges__(f.OuterWire.Edges)
-                #print edges
                 for e in edges:
-                    #print e.Vertexes[0].Point,e.Vertexes[1].Point
-                    v = e.Vertexes[0]
-                    ind = findVert(v,shape.Vertexes)
+                    ind = index.get(getVertKey(e.Vertexes[0].Point))
                     if ind == None:
                         return None,None,None
                     fi += " " + str(ind + offset)
@@ -112,19 +124,18 @@ def export(exportList,filename):
     objectslist = Arch.pruneIncluded(objectslist)
     for obj in objectslist:
         if obj.isDerivedFrom("Part::Feature"):
-            if obj.ViewObject.isVisible():
+            if (not FreeCAD.GuiUp) or obj.ViewObject.isVisible():
                 vlist,elist,flist = getIndices(obj.Shape,offset)
                 if vlist == None:
                     FreeCAD.Console.PrintError("Unable to export object "+obj.Label+". Skipping.\n")
                 else:
                     offset += len(vlist)
-                    outfile.write("o " + obj.Name + "\n")
-                    for v in vlist:
-                        outfile.write("v" + v + "\n")
-                    for e in elist:
-                        outfile.write("l" + e + "\n")
-                    for f in flist:
-                        outfile.write("f" + f + "\n")
+                    # each object is written in one block, then discarded
+                    lines = ["o " + obj.Name]
+                    lines.extend(["v" + v for v in vlist])
+                    lines.extend(["l" + e for e in elist])
+                    lines.extend(["f" + f for f in flist])
+                    outfile.write("\n".join(lines) + "\n")
     outfile.close()
     FreeCAD.Console.PrintMessage(translate("Arch","successfully written ").decode('utf8')+filename+"\n")
             
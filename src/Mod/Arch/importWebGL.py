@@ -26,9 +26,13 @@
 options: importWebGL.wireframeStyle = "faceloop" (can also be "multimaterial" or None)
 importWebGL.template = a complete html file, where $CameraData is a placeholder for the 
 FreeCAD camera, and $ObjectsData a placeholder for the FreeCAD objects.
-importWebGL.linewidth = an integer, specifyig the width of lines in "faceloop" mode"""
+importWebGL.linewidth = an integer, specifyig the width of lines in "faceloop" mode
+importWebGL.geometryStyle = "compact" (can also be "legacy"). In compact mode, vertices
+and faces are written as base64-encoded binary arrays, materials are shared between
+objects of the same color, and objects with identical geometry share the same
+three.js geometry. Legacy mode writes one javascript statement per vertex and face."""
 
-import FreeCAD,Draft,Part,DraftGeomUtils
+import FreeCAD,Draft,Part,DraftGeomUtils,struct,base64
 
 if FreeCAD.GuiUp:
     import FreeCADGui
@@ -42,6 +46,7 @@ tab = "                " # the tab size
 wireframeStyle = "faceloop" # this can be "faceloop", "multimaterial" or None
 cameraPosition = None # set this to a tuple to change, for ex. (0,0,0)
 linewidth = 1
+geometryStyle = "compact" # this can be "compact" or "legacy"
 template = """<!DOCTYPE html>
         <html>
         <head>
@@ -123,9 +128,17 @@ def getHTML(objectsList):
     "returns the complete HTML code of a viewer for the given objects"
     
     # get objects data
-    objectsData = ''
-    for obj in objectsList:
-        objectsData += getObjectData(obj)
+    if geometryStyle == "compact":
+        geometries = {}
+        materials = {}
+        objectsData = [compactFunctions % linewidth]
+        for obj in objectsList:
+            objectsData.append(getCompactData(obj,wireframeStyle,geometries,materials))
+        objectsData = "".join(objectsData)
+    else:
+        objectsData = ''
+        for obj in objectsList:
+            objectsData += getObjectData(obj)
     t = template.replace("$CameraData",getCameraData())
     t = t.replace("$ObjectsData",objectsData)
     return t
@@ -227,3 +240,111 @@ def getObjectData(obj,wireframeMode=wireframeStyle):
         
     return result
         
+
+
+# compact mode
+
+compactFunctions = """
+                function decode(data,type) {
+                    var s = atob(data), b = new Uint8Array(s.length);
+                    for (var i = 0; i < s.length; i++) b[i] = s.charCodeAt(i);
+                    return new type(b.buffer);
+                };
+                function makeGeometry(verts,faces) {
+                    var v = decode(verts,Float32Array), f = decode(faces,Uint32Array);
+                    var geom = new THREE.Geometry();
+                    for (var i = 0; i < v.length; i += 3) geom.vertices.push(new THREE.Vector3(v[i],v[i+1],v[i+2]));
+                    for (var i = 0; i < f.length; i += 3) geom.faces.push(new THREE.Face3(f[i],f[i+1],f[i+2]));
+                    return geom;
+                };
+                function makeWire(verts) {
+                    var v = decode(verts,Float32Array), wire = new THREE.Geometry();
+                    for (var i = 0; i < v.length; i += 3) wire.vertices.push(new THREE.Vector3(v[i],v[i+1],v[i+2]));
+                    return wire;
+                };
+                function place(obj,m) {
+                    obj.matrixAutoUpdate = false;
+                    obj.matrix.set.apply(obj.matrix,m);
+                    scene.add(obj);
+                };
+                var linematerial = new THREE.LineBasicMaterial({linewidth: %d, color: 0x000000,});
+                var wireframe = new THREE.MeshBasicMaterial( { color: 0x000000, wireframe: true, transparent: true } );
+"""
+
+def getFloats(vectors):
+    "returns the given list of vectors as a base64-encoded array of 32-bit floats"
+    values = []
+    for v in vectors:
+        values.extend((v.x,v.y,v.z))
+    return base64.b64encode(struct.pack("<%df" % len(values),*values))
+
+def getInts(values):
+    "returns the given list of index tuples as a base64-encoded array of 32-bit integers"
+    values = [i for t in values for i in t]
+    return base64.b64encode(struct.pack("<%dI" % len(values),*values))
+
+def getMatrix(placement):
+    "returns the matrix of a placement as a javascript array"
+    m = placement.toMatrix()
+    return "["+",".join([str(v) for v in (m.A11,m.A12,m.A13,m.A14,
+                                          m.A21,m.A22,m.A23,m.A24,
+                                          m.A31,m.A32,m.A33,m.A34,
+                                          m.A41,m.A42,m.A43,m.A44)])+"]"
+
+def getCompactData(obj,wireframeMode,geometries,materials):
+    """returns the geometry data of an object as compact three.js snippet.
+    geometries and materials are dictionaries holding the geometries and
+    materials already written, so they can be reused by later objects"""
+
+    result = []
+    placement = FreeCAD.Placement()
+    if obj.isDerivedFrom("Part::Feature"):
+        shape = obj.Shape.copy()
+        if shape.isNull():
+            return ""
+        placement = shape.Placement
+        shape.Placement = FreeCAD.Placement()
+        key = Draft.getShapeBrepKey(shape)
+        if not key in geometries:
+            name = "geom"+str(len(geometries))
+            fcmesh = shape.tessellate(0.1)
+            result.append(tab+"var "+name+" = makeGeometry('"+getFloats(fcmesh[0])+"','"+getInts(fcmesh[1])+"');\n")
+            wires = []
+            if wireframeMode == "faceloop":
+                for f in shape.Faces:
+                    for w in f.Wires:
+                        wo = Part.Wire(Part.__sortEdges__(w.Edges))
+                        wname = name+"w"+str(len(wires))
+                        result.append(tab+"var "+wname+" = makeWire('"+getFloats(wo.discretize(QuasiDeflection=0.1))+"');\n")
+                        wires.append(wname)
+            geometries[key] = (name,wires)
+        name,wires = geometries[key]
+    elif obj.isDerivedFrom("Mesh::Feature"):
+        mesh = obj.Mesh
+        name = "geom"+str(len(geometries))
+        geometries[obj.Name] = (name,[])
+        wires = []
+        points = [p.Vector for p in mesh.Points]
+        result.append(tab+"var "+name+" = makeGeometry('"+getFloats(points)+"','"+getInts([f.PointIndices for f in mesh.Facets])+"');\n")
+    else:
+        return ""
+
+    # materials are shared between objects of the same color
+    if FreeCADGui:
+        col = obj.ViewObject.ShapeColor
+        rgb = Draft.getrgb(col,testbw=False)
+    else:
+        rgb = "#888888" # test color
+    if not rgb in materials:
+        materials[rgb] = "material"+str(len(materials))
+        result.append(tab+"var "+materials[rgb]+" = new THREE.MeshBasicMaterial( { color: 0x"+str(rgb)[1:]+" } );\n")
+    material = materials[rgb]
+
+    m = getMatrix(placement)
+    if wireframeMode == "multimaterial":
+        result.append(tab+"place(THREE.SceneUtils.createMultiMaterialObject( "+name+", [ "+material+", wireframe ] ),"+m+");\n")
+    else:
+        result.append(tab+"place(new THREE.Mesh( "+name+", "+material+" ),"+m+");\n")
+        for w in wires:
+            result.append(tab+"place(new THREE.Line( "+w+", linematerial ),"+m+");\n")
+    return "".join(result)
@@ -86,7 +86,7 @@ def getParamType(param):
     if param in ["dimsymbol","dimPrecision","dimorientation","precision","defaultWP",
                  "snapRange","gridEvery","linewidth","UiMode","modconstrain","modsnap",
                  "maxSnapEdges","modalt","HatchPatternResolution","snapStyle",
-                 "dimstyle","gridSize"]:
+                 "dimstyle","gridSize","svgCacheSize","projectionCacheSize"]:
         return "int"
     elif param in ["constructiongroupname","textfont","patternFile","template",
                    "snapModes","FontFile","ClonePrefix"]:
@@ -306,6 +306,33 @@ def shapify(obj):
     FreeCAD.ActiveDocument.recompute()
     return newobj
 
+def getShapeInstance(shape):
+    '''getShapeInstance(shape): returns a new shape that shares the underlying
+    geometry of the given shape. Unlike shape.copy(), nothing is duplicated,
+    so the returned shape can be moved around at almost no cost, but its
+    geometry must not be modified in place.'''
+    import Part
+    return Part.makeCompound([shape]).childShapes()[0]
+
+def fuseShapes(shapes,chunk=64):
+    '''fuseShapes(shapes,[chunk]): fuses a list of shapes together. The list
+    is partitioned in groups of chunk shapes which are fused separately, then
+    the partial results are fused together, which keeps each boolean operation
+    small when fusing a large number of shapes.'''
+    if not shapes:
+        return None
+    chunk = max(chunk,2)
+    while len(shapes) > 1:
+        parts = []
+        for i in range(0,len(shapes),chunk):
+            group = shapes[i:i+chunk]
+            if len(group) > 1:
+                parts.append(group[0].multiFuse(group[1:]))
+            else:
+                parts.append(group[0])
+        shapes = parts
+    return shapes[0]
+
 def getGroupContents(objectslist,walls=False,addgroups=False):
     '''getGroupContents(objectlist,[walls,addgroups]): if any object of the given list
     is a group, its content is appened to the list, which is returned. If walls is True,
@@ -2229,6 +2256,174 @@ def getSVG(obj,scale=1,linewidth=0.35,fontsize=12,fillstyle="shape color",direct
                     svg = getPath(obj.Shape.Edges)
     return svg
 
+def getGeometryKey(geom):
+    """getGeometryKey(geom): returns a hashable key made of the type and the
+    parameters of the given curve or surface"""
+    def freeze(v):
+        if isinstance(v,FreeCAD.Vector):
+            return tuple(v)
+        if isinstance(v,list):
+            return tuple([freeze(i) for i in v])
+        return v
+    key = [geom.__class__.__name__]
+    for attr in ["Center","Axis","Radius","MajorRadius","MinorRadius","AngleXU",
+                 "Location","Direction","StartPoint","EndPoint","Position","Apex","SemiAngle",
+                 "Degree","UDegree","VDegree"]:
+        try:
+            key.append(freeze(getattr(geom,attr)))
+        except Exception:
+            pass
+    for method in ["getPoles","getWeights","getKnots","getUKnots","getVKnots"]:
+        if hasattr(geom,method):
+            try:
+                key.append(freeze(getattr(geom,method)()))
+            except Exception:
+                pass
+    return tuple(key)
+
+def getShapeCacheKey(shape):
+    '''getShapeCacheKey(shape): returns a hashable key computed from the
+    geometry of the given shape: the coordinates of its vertices, the curves
+    of its edges and the surfaces of its faces. It changes whenever the shape
+    is moved or its geometry changes, to be used by caches of data computed
+    from shapes'''
+    import hashlib
+    if shape.isNull():
+        return None
+    key = [shape.ShapeType,len(shape.Solids),len(shape.Faces),len(shape.Edges)]
+    for v in shape.Vertexes:
+        key.append(tuple(v.Point))
+    for e in shape.Edges:
+        try:
+            curve = getGeometryKey(e.Curve)
+        except Exception:
+            curve = e.Length
+        key.append((curve,e.FirstParameter,e.LastParameter,e.Orientation))
+    for f in shape.Faces:
+        try:
+            surface = getGeometryKey(f.Surface)
+        except Exception:
+            surface = f.Area
+        key.append((surface,f.Orientation))
+    return hashlib.sha1(repr(key)).hexdigest()
+
+def getShapeBrepKey(shape):
+    '''getShapeBrepKey(shape): returns a key computed from the BREP of the
+    given shape without its placement. Moved copies of a shape have the same
+    key, so data that doesn't depend on the placement, such as meshes or
+    representations, can be shared between them'''
+    import hashlib
+    if shape.isNull():
+        return None
+    if not shape.Placement.isNull():
+        shape = shape.copy()
+        shape.Placement = FreeCAD.Placement()
+    return hashlib.sha1(shape.exportBrepToString()).hexdigest()
+
+svgcache = None
+
+def getCachedSVG(obj,scale=1,linewidth=0.35,fontsize=12,fillstyle="shape color",direction=None,linestyle=None,color=None,linespacing=None):
+    '''getCachedSVG(object,[scale], [linewidth],[fontsize],[fillstyle],[direction],[linestyle],[color],[linespacing]):
+    same as getSVG(), but the SVG fragments of shape-based objects are kept in
+    memory and reused as long as the shape of the object and the given view
+    parameters don't change. The number of fragments kept is given by the
+    svgCacheSize parameter, 0 disables the cache.'''
+    import Part, WorkingPlane
+    global svgcache
+    size = getParam("svgCacheSize",1000)
+    key = None
+    if size and obj and not isinstance(obj,Part.Shape):
+        if obj.isDerivedFrom("Part::Feature") and not (getType(obj) in ["Dimension","AngularDimension","Annotation","Axis","Space"]):
+            if (direction is None) or isinstance(direction,(FreeCAD.Vector,WorkingPlane.plane)):
+                key = getSVGCacheKey(obj,scale,linewidth,fontsize,fillstyle,direction,linestyle,color,linespacing)
+    if key is None:
+        return getSVG(obj,scale,linewidth,fontsize,fillstyle,direction,linestyle,color,linespacing)
+    if svgcache is None:
+        import collections
+        svgcache = collections.OrderedDict()
+    if key in svgcache:
+        svg = svgcache.pop(key)
+    else:
+        svg = getSVG(obj,scale,linewidth,fontsize,fillstyle,direction,linestyle,color,linespacing)
+    svgcache[key] = svg
+    while len(svgcache) > size:
+        svgcache.popitem(last=False)
+    return svg
+
+def getSVGCacheKey(obj,scale,linewidth,fontsize,fillstyle,direction,linestyle,color,linespacing):
+    "returns a hashable key identifying the SVG fragment of a shape-based object"
+    shapekey = getShapeCacheKey(obj.Shape)
+    direction = getSVGPlaneKey(direction)
+    if color:
+        color = tuple(color)
+    viewkey = None
+    if gui and obj.ViewObject:
+        viewkey = []
+        for prop in ["LineColor","ShapeColor","DisplayMode"]:
+            if hasattr(obj.ViewObject,prop):
+                v = getattr(obj.ViewObject,prop)
+                if isinstance(v,list):
+                    v = tuple(v)
+                viewkey.append(v)
+        viewkey = tuple(viewkey)
+    return (obj.Document.Name,obj.Name,shapekey,scale,linewidth,fontsize,fillstyle,direction,linestyle,color,linespacing,viewkey)
+
+def getSVGPlaneKey(direction):
+    """returns a hashable key identifying the plane used by getSVG() for the
+    given direction: the plane built from the direction, the given working
+    plane, or the position and axis of the current working plane"""
+    import WorkingPlane
+    plane = None
+    if isinstance(direction,FreeCAD.Vector):
+        if direction != Vector(0,0,0):
+            plane = WorkingPlane.plane()
+            plane.alignToPointAndAxis_SVG(Vector(0,0,0),direction.negative().negative(),0)
+    elif direction:
+        plane = direction
+    if plane:
+        return (tuple(plane.u),tuple(plane.v),tuple(plane.axis),tuple(plane.position))
+    if hasattr(FreeCAD,"DraftWorkingPlane"):
+        return (tuple(FreeCAD.DraftWorkingPlane.axis),tuple(FreeCAD.DraftWorkingPlane.position))
+    return None
+
+def clearSVGCache():
+    "clearSVGCache(): empties the cache of SVG fragments used by getCachedSVG()"
+    global svgcache
+    svgcache = None
+
+projectioncache = None
+
+def getProjection(shape,direction,name=None):
+    '''getProjection(shape,direction,[name]): returns the edge groups given by
+    Drawing.projectEx() for the given shape and direction. Results are kept
+    in memory, visible and hidden lines together, and reused as long as the
+    geometry of the shape doesn't change. The name of the object the shape
+    belongs to can be given to keep its projections apart. The number of
+    projections kept is given by the projectionCacheSize parameter, 0
+    disables the cache.'''
+    import Drawing
+    global projectioncache
+    size = getParam("projectionCacheSize",50)
+    if not size:
+        return Drawing.projectEx(shape,direction)
+    if projectioncache is None:
+        import collections
+        projectioncache = collections.OrderedDict()
+    key = (name,getShapeCacheKey(shape),tuple(direction))
+    if key in projectioncache:
+        groups = projectioncache.pop(key)
+    else:
+        groups = Drawing.projectEx(shape,direction)
+    projectioncache[key] = groups
+    while len(projectioncache) > size:
+        projectioncache.popitem(last=False)
+    return groups
+
+def clearProjectionCache():
+    "clearProjectionCache(): empties the cache of projections used by getProjection()"
+    global projectioncache
+    projectioncache = None
+
 def getrgb(color,testbw=True):
     """getRGB(color,[testbw]): returns a rgb value #000000 from a freecad color
     if testwb = True (default), pure white will be converted into pure black"""
@@ -4632,9 +4827,9 @@ class _DrawingView(_DraftObject):
                             if obj.AlwaysOn:
                                 v = True
                         if v:
-                            svg += getSVG(o,obj.Scale,obj.LineWidth,obj.FontSize.Value,obj.FillStyle,obj.Direction,ls,lc,lp)
+                            svg += getCachedSVG(o,obj.Scale,obj.LineWidth,obj.FontSize.Value,obj.FillStyle,obj.Direction,ls,lc,lp)
                 else:
-                    svg = getSVG(obj.Source,obj.Scale,obj.LineWidth,obj.FontSize.Value,obj.FillStyle,obj.Direction,ls,lc,lp)
+                    svg = getCachedSVG(obj.Source,obj.Scale,obj.LineWidth,obj.FontSize.Value,obj.FillStyle,obj.Direction,ls,lc,lp)
                 result += '<g id="' + obj.Name + '"'
                 result += ' transform="'
                 result += 'rotate('+str(obj.Rotation)+','+str(obj.X)+','+str(obj.Y)+') '
@@ -4898,9 +5093,9 @@ class _Shape2DView(_DraftObject):
 
     def getProjected(self,obj,shape,direction):
         "returns projected edges from a shape and a direction"
-        import Part,Drawing,DraftGeomUtils
+        import Part,DraftGeomUtils
         edges = []
-        groups = Drawing.projectEx(shape,direction)
+        groups = getProjection(shape,direction,obj.Name)
         for g in groups[0:5]:
             if g:
                 edges.append(g)
@@ -5033,6 +5228,7 @@ class _Array(_DraftObject):
         obj.addProperty("App::PropertyVectorDistance","Center","Draft","Center point")
         obj.addProperty("App::PropertyAngle","Angle","Draft","Angle to cover with copies")
         obj.addProperty("App::PropertyBool","Fuse","Draft","Specifies if copies must be fused (slower)")
+        obj.addProperty("App::PropertyBool","Instancing","Draft","Specifies if copies share the geometry of the base object instead of duplicating it (faster, lighter)")
         obj.ArrayType = ['ortho','polar']
         obj.NumberX = 1
         obj.NumberY = 1
@@ -5045,6 +5241,7 @@ class _Array(_DraftObject):
         obj.Angle = 360
         obj.Axis = Vector(0,0,1)
         obj.Fuse = False
+        obj.Instancing = False
 
     def execute(self,obj):
         import DraftGeomUtils
@@ -5052,69 +5249,84 @@ class _Array(_DraftObject):
             fuse = obj.Fuse
         else:
             fuse = False
+        if hasattr(obj,"Instancing"):
+            instancing = obj.Instancing
+        else:
+            instancing = False
         if obj.Base:
             pl = obj.Placement
             if obj.ArrayType == "ortho":
                 sh = self.rectArray(obj.Base.Shape,obj.IntervalX,obj.IntervalY,
-                                    obj.IntervalZ,obj.NumberX,obj.NumberY,obj.NumberZ,fuse)
+                                    obj.IntervalZ,obj.NumberX,obj.NumberY,obj.NumberZ,fuse,instancing)
             else:
                 av = obj.IntervalAxis if hasattr(obj,"IntervalAxis") else None
-                sh = self.polarArray(obj.Base.Shape,obj.Center,obj.Angle.Value,obj.NumberPolar,obj.Axis,av,fuse)
+                sh = self.polarArray(obj.Base.Shape,obj.Center,obj.Angle.Value,obj.NumberPolar,obj.Axis,av,fuse,instancing)
             obj.Shape = sh
             if not DraftGeomUtils.isNull(pl):
                 obj.Placement = pl
 
-    def rectArray(self,shape,xvector,yvector,zvector,xnum,ynum,znum,fuse=False):
-        import Part
-        base = [shape.copy()]
+    def rectPlacements(self,xvector,yvector,zvector,xnum,ynum,znum):
+        "returns the list of placements of a rectangular array, the first one being the base"
+        xvector = Vector(xvector)
+        yvector = Vector(yvector)
+        zvector = Vector(zvector)
+        # a null count stops the inner directions, as the nested loops always did
+        if xnum < 1:
+            xnum = ynum = znum = 1
+        elif ynum < 1:
+            ynum = znum = 1
+        placements = []
         for xcount in range(xnum):
-            currentxvector=Vector(xvector).multiply(xcount)
-            if not xcount==0:
-                nshape = shape.copy()
-                nshape.translate(currentxvector)
-                base.append(nshape)
             for ycount in range(ynum):
-                currentyvector=FreeCAD.Vector(currentxvector)
-                currentyvector=currentyvector.add(Vector(yvector).multiply(ycount))
-                if not ycount==0:
-                    nshape = shape.copy()
-                    nshape.translate(currentyvector)
-                    base.append(nshape)
-                for zcount in range(znum):
-                    currentzvector=FreeCAD.Vector(currentyvector)
-                    currentzvector=currentzvector.add(Vector(zvector).multiply(zcount))
-                    if not zcount==0:
-                        nshape = shape.copy()
-                        nshape.translate(currentzvector)
-                        base.append(nshape)
-        if fuse and len(base) > 1:
-            return base[0].multiFuse(base[1:]).removeSplitter()
-        else:
-            return Part.makeCompound(base)
+                for zcount in range(max(znum,1)):
+                    v = xvector*xcount + yvector*ycount + zvector*zcount
+                    placements.append(FreeCAD.Placement(v,FreeCAD.Rotation()))
+        return placements
 
-    def polarArray(self,shape,center,angle,num,axis,axisvector,fuse=False):
-        #print("angle ",angle," num ",num)
-        import Part
+    def polarPlacements(self,center,angle,num,axis,axisvector):
+        "returns the list of placements of a polar array, the first one being the base"
         if angle == 360:
             fraction = float(angle)/num
         else:
-            if num == 0:
-                return shape
             fraction = float(angle)/(num-1)
-        base = [shape.copy()]
+        if axisvector and DraftVecUtils.isNull(axisvector):
+            axisvector = None
+        placements = [FreeCAD.Placement()]
         for i in range(num-1):
             currangle = fraction + (i*fraction)
-            nshape = shape.copy()
-            nshape.rotate(DraftVecUtils.tup(center), DraftVecUtils.tup(axis), currangle)
+            p = FreeCAD.Placement(Vector(),FreeCAD.Rotation(axis,currangle),center)
             if axisvector:
-                if not DraftVecUtils.isNull(axisvector):
-                    nshape.translate(FreeCAD.Vector(axisvector).multiply(i+1))
+                p.move(Vector(axisvector).multiply(i+1))
+            placements.append(p)
+        return placements
+
+    def buildArray(self,shape,placements,fuse=False,instancing=False):
+        "places the shape at each of the given placements and returns the result"
+        import Part
+        base = []
+        for p in placements:
+            if instancing:
+                nshape = getShapeInstance(shape)
+            else:
+                nshape = shape.copy()
+            nshape.Placement = p.multiply(shape.Placement)
             base.append(nshape)
         if fuse and len(base) > 1:
-            return base[0].multiFuse(base[1:]).removeSplitter()
+            return fuseShapes(base).removeSplitter()
         else:
             return Part.makeCompound(base)
 
+    def rectArray(self,shape,xvector,yvector,zvector,xnum,ynum,znum,fuse=False,instancing=False):
+        placements = self.rectPlacements(xvector,yvector,zvector,xnum,ynum,znum)
+        return self.buildArray(shape,placements,fuse,instancing)
+
+    def polarArray(self,shape,center,angle,num,axis,axisvector,fuse=False,instancing=False):
+        #print("angle ",angle," num ",num)
+        if (angle != 360) and (num == 0):
+            return shape
+        placements = self.polarPlacements(center,angle,num,axis,axisvector)
+        return self.buildArray(shape,placements,fuse,instancing)
+
 
 class _PathArray(_DraftObject):
     "The Draft Path Array object"
@@ -5127,10 +5339,12 @@ class _PathArray(_DraftObject):
         obj.addProperty("App::PropertyInteger","Count","Draft","Number of copies")
         obj.addProperty("App::PropertyVectorDistance","Xlate","Draft","Optional translation vector")
         obj.addProperty("App::PropertyBool","Align","Draft","Orientation of Base along path")
+        obj.addProperty("App::PropertyBool","Instancing","Draft","Specifies if copies share the geometry of the base object instead of duplicating it (faster, lighter)")
         obj.Count = 2
         obj.PathSubs = []
         obj.Xlate = FreeCAD.Vector(0,0,0)
         obj.Align = False
+        obj.Instancing = False
 
     def execute(self,obj):
         import FreeCAD
@@ -5147,7 +5361,8 @@ class _PathArray(_DraftObject):
             else:
                 FreeCAD.Console.PrintLog ("_PathArray.createGeometry: path " + obj.PathObj.Name + " has no edges\n")
                 return
-            obj.Shape = self.pathArray(obj.Base.Shape,w,obj.Count,obj.Xlate,obj.Align)
+            instancing = obj.Instancing if hasattr(obj,"Instancing") else False
+            obj.Shape = self.pathArray(obj.Base.Shape,w,obj.Count,obj.Xlate,obj.Align,instancing)
             if not DraftGeomUtils.isNull(pl):
                 obj.Placement = pl
 
@@ -5173,7 +5388,7 @@ class _PathArray(_DraftObject):
             length = offset
         return(edge.getParameterByLength(length))
 
-    def orientShape(self,shape,edge,offset,RefPt,xlate,align,normal=None):
+    def orientShape(self,shape,edge,offset,RefPt,xlate,align,normal=None,instancing=False):
         '''Orient shape to tangent at parm offset along edge.'''
         # http://en.wikipedia.org/wiki/Euler_angles
         import Part
@@ -5184,7 +5399,10 @@ class _PathArray(_DraftObject):
         x = FreeCAD.Vector(1,0,0)                                    # unit +X
         nullv = FreeCAD.Vector(0,0,0)
         nullPlace =FreeCAD.Placement()
-        ns = shape.copy()
+        if instancing:
+            ns = getShapeInstance(shape)
+        else:
+            ns = shape.copy()
         ns.Placement.Base = nullPlace.Base                           # reset Placement point so translate goes to right place.
         ns.Placement.Rotation = shape.Placement.Rotation             # preserve global orientation
         ns.translate(RefPt+xlate)
@@ -5232,7 +5450,7 @@ class _PathArray(_DraftObject):
             ns.rotate(RefPt,b,phi)
         return ns
 
-    def pathArray(self,shape,pathwire,count,xlate,align):
+    def pathArray(self,shape,pathwire,count,xlate,align,instancing=False):
         '''Distribute shapes along a path.'''
         import Part
         import DraftGeomUtils
@@ -5246,11 +5464,11 @@ class _PathArray(_DraftObject):
             ends.append(cdist)
         base = []
         pt = path[0].Vertexes[0].Point                                 # place the start shape
-        ns = self.orientShape(shape,path[0],0,pt,xlate,align,normal)
+        ns = self.orientShape(shape,path[0],0,pt,xlate,align,normal,instancing)
         base.append(ns)
         if not(closedpath):                                            # closed path doesn't need shape on last vertex
             pt = path[-1].Vertexes[-1].Point                           # place the end shape
-            ns = self.orientShape(shape,path[-1],path[-1].Length,pt,xlate,align,normal)
+            ns = self.orientShape(shape,path[-1],path[-1].Length,pt,xlate,align,normal,instancing)
             base.append(ns)
         if count < 3:
             return(Part.makeCompound(base))
@@ -5274,7 +5492,7 @@ class _PathArray(_DraftObject):
             remains = ends[iend] - travel
             offset = path[iend].Length - remains
             pt = path[iend].valueAt(self.getParameterFromV0(path[iend],offset))
-            ns = self.orientShape(shape,path[iend],offset,pt,xlate,align,normal)
+            ns = self.orientShape(shape,path[iend],offset,pt,xlate,align,normal,instancing)
             base.append(ns)
             travel += step
         return(Part.makeCompound(base))
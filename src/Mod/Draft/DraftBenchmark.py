@@ -0,0 +1,315 @@
+#***************************************************************************
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+__title__="FreeCAD Draft Workbench - Import/export benchmark"
+__url__ = ["http://www.freecadweb.org"]
+
+'''
+This module measures the throughput of the Draft importers and exporters
+(DXF, SVG, OCA), of getSVG and of some DraftGeomUtils functions. It runs
+headless, for example with:
+
+    FreeCADCmd -c "import DraftBenchmark; DraftBenchmark.run()"
+
+Synthetic drawings of increasing size are generated in a temporary folder,
+and optional sample files can be added. For each file the time and the
+memory of each stage are recorded: parse (reading the file only), objects
+(creating the document objects), geometry (recomputing the document),
+export, getsvg and geomutils. The memory of a stage is the change of the
+resident memory of the process, and the amount by which the stage raised
+its peak memory. Results can be stored as a baseline, and later runs are
+compared against it to flag regressions.
+'''
+
+import FreeCAD, os, sys, time, json, shutil, tempfile
+from FreeCAD import Vector
+
+defaultsizes = [100,1000,10000]
+
+def getBaselineFile():
+    "returns the default location of the baseline file"
+    return os.path.join(FreeCAD.ConfigGet("UserAppData"),"DraftBenchmark.json")
+
+def getMemory():
+    "returns the resident memory of this process, in MB, or None if unknown"
+    try:
+        f = open("/proc/self/statm")
+        pages = int(f.read().split()[1])
+        f.close()
+    except (IOError,OSError,IndexError,ValueError):
+        return None
+    return pages*os.sysconf("SC_PAGE_SIZE")/1048576.0
+
+def getPeakMemory():
+    "returns the peak memory used by this process so far, in MB, or None if unknown"
+    try:
+        import resource
+    except ImportError:
+        return None
+    m = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        # bytes on Mac, kilobytes elsewhere
+        return m/1048576.0
+    return m/1024.0
+
+def getDelta(start,end):
+    if (start is None) or (end is None):
+        return None
+    return end-start
+
+class Stage:
+    """a context manager that records the duration and the memory used by a
+    benchmark stage. A failed stage is recorded with no duration, and its
+    exception is not stopped"""
+
+    def __init__(self,results,name,fmt,size):
+        self.results = results
+        self.key = "%s/%s/%s" % (fmt,size,name)
+
+    def __enter__(self):
+        self.memory = getMemory()
+        self.peak = getPeakMemory()
+        self.start = time.time()
+        return self
+
+    def __exit__(self,exctype,excvalue,traceback):
+        t = time.time()-self.start
+        result = {"time":t,"memory":getDelta(self.memory,getMemory()),
+                  "peak":getDelta(self.peak,getPeakMemory())}
+        if exctype:
+            result["time"] = None
+            result["error"] = str(excvalue) or exctype.__name__
+        self.results[self.key] = result
+        return False
+
+# synthetic drawings
+
+def getGrid(count):
+    "yields count points on a square grid"
+    side = int(count**0.5) or 1
+    for i in range(count):
+        yield Vector((i%side)*10.0,(i//side)*10.0,0)
+
+def makeDXF(filename,count):
+    "writes a DXF file with count lines, circles and arcs"
+    f = open(filename,"w")
+    f.write("0\nSECTION\n2\nENTITIES\n")
+    for i,p in enumerate(getGrid(count)):
+        if i%3 == 0:
+            f.write("0\nLINE\n8\n0\n10\n%f\n20\n%f\n30\n0.0\n11\n%f\n21\n%f\n31\n0.0\n" % (p.x,p.y,p.x+8,p.y+8))
+        elif i%3 == 1:
+            f.write("0\nCIRCLE\n8\n0\n10\n%f\n20\n%f\n30\n0.0\n40\n4.0\n" % (p.x+5,p.y+5))
+        else:
+            f.write("0\nARC\n8\n0\n10\n%f\n20\n%f\n30\n0.0\n40\n4.0\n50\n0.0\n51\n90.0\n" % (p.x+5,p.y+5))
+    f.write("0\nENDSEC\n0\nEOF\n")
+    f.close()
+
+def makeSVG(filename,count):
+    "writes a SVG file with count paths, circles and rectangles"
+    side = (int(count**0.5) or 1)*10
+    f = open(filename,"w")
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<svg xmlns="http://www.w3.org/2000/svg" width="%dmm" height="%dmm" viewBox="0 0 %d %d">\n' % (side,side,side,side))
+    for i,p in enumerate(getGrid(count)):
+        if i%3 == 0:
+            f.write('<path d="M %f %f L %f %f L %f %f Z" style="fill:none;stroke:#000000"/>\n' % (p.x,p.y,p.x+8,p.y,p.x+8,p.y+8))
+        elif i%3 == 1:
+            f.write('<circle cx="%f" cy="%f" r="4" style="fill:none;stroke:#000000"/>\n' % (p.x+5,p.y+5))
+        else:
+            f.write('<rect x="%f" y="%f" width="8" height="6" style="fill:none;stroke:#000000"/>\n' % (p.x,p.y))
+    f.write('</svg>\n')
+    f.close()
+
+def makeOCA(filename,count):
+    "writes an OCA file with count lines and circles"
+    f = open(filename,"w")
+    f.write("#oca file generated by the Draft benchmark\n")
+    for i,p in enumerate(getGrid(count)):
+        f.write("P%d=P(%f %f 0)\n" % (i,p.x,p.y))
+        if i%2 == 0:
+            f.write("L%d=P%d P(%f %f 0)\n" % (i,i,p.x+8,p.y+8))
+        else:
+            f.write("C%d=P%d VAL 4\n" % (i,i))
+    f.close()
+
+generators = {"dxf":makeDXF,"svg":makeSVG,"oca":makeOCA}
+
+# parsers used for the parse stage
+
+def parseFile(filename):
+    "reads the given file without creating any object, returns the number of entities"
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".svg":
+        import xml.sax
+        class counter(xml.sax.ContentHandler):
+            count = 0
+            def startElement(self,name,attrs):
+                self.count += 1
+        handler = counter()
+        xml.sax.parse(filename,handler)
+        return handler.count
+    elif ext == ".dxf":
+        import importDXF
+        importDXF.getDXFlibs()
+        if importDXF.dxfReader:
+            drawing = importDXF.dxfReader.readDXF(filename)
+            return len(drawing.entities.data)
+        f = open(filename)
+        count = sum(1 for l in f if l.strip() == "0")
+        f.close()
+        return count
+    else:
+        f = open(filename)
+        count = sum(1 for l in f if "=" in l)
+        f.close()
+        return count
+
+def getImporter(filename):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext == ".dxf":
+        import importDXF
+        return importDXF
+    elif ext == ".svg":
+        import importSVG
+        return importSVG
+    elif ext in [".oca",".gcad"]:
+        import importOCA
+        return importOCA
+    return None
+
+def benchFile(filename,fmt,size,results,tmpdir):
+    "runs all the benchmark stages on the given file"
+    importer = getImporter(filename)
+    if not importer:
+        FreeCAD.Console.PrintWarning("Benchmark: unsupported file "+filename+"\n")
+        return
+    import Draft, DraftGeomUtils
+    with Stage(results,"parse",fmt,size):
+        parseFile(filename)
+    doc = FreeCAD.newDocument("DraftBenchmark")
+    FreeCAD.setActiveDocument(doc.Name)
+    try:
+        with Stage(results,"objects",fmt,size):
+            importer.insert(filename,doc.Name)
+        with Stage(results,"geometry",fmt,size):
+            doc.recompute()
+        objs = [o for o in doc.Objects if o.isDerivedFrom("Part::Feature")]
+        with Stage(results,"export",fmt,size):
+            importer.export(objs,os.path.join(tmpdir,"export"+os.path.splitext(filename)[1]))
+        with Stage(results,"getsvg",fmt,size):
+            for o in objs:
+                Draft.getSVG(o)
+        with Stage(results,"geomutils",fmt,size):
+            edges = []
+            for o in objs:
+                edges.extend(o.Shape.Edges)
+            DraftGeomUtils.findWires(edges)
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+
+def benchSynthetic(fmt,size,results,tmpdir):
+    "runs all the benchmark stages on a synthetic drawing"
+    filename = os.path.join(tmpdir,"synthetic%d.%s" % (size,fmt))
+    generators[fmt](filename,size)
+    benchFile(filename,fmt,size,results,tmpdir)
+
+def run(sizes=None,samples=[],baseline=None,store=False,tolerance=1.5,formats=None):
+    '''run([sizes],[samples],[baseline],[store],[tolerance],[formats]): runs the
+    benchmark on synthetic drawings of the given sizes (number of entities) and
+    on the given sample files. Results are compared with the given baseline
+    file (by default the one in the user folder, if it exists), and stages
+    slower than tolerance times the baseline are reported as regressions.
+    If store is True, the results are saved as the new baseline. Returns a
+    (results,regressions) tuple.'''
+    import functools
+    if sizes is None:
+        sizes = defaultsizes
+    if formats is None:
+        formats = sorted(generators.keys())
+    if baseline is None:
+        baseline = getBaselineFile()
+    jobs = []
+    for fmt in formats:
+        for size in sizes:
+            jobs.append(functools.partial(benchSynthetic,fmt,size))
+    for sample in samples:
+        jobs.append(functools.partial(benchFile,sample,"sample",os.path.basename(sample)))
+    return runJobs(jobs,baseline,store,tolerance)
+
+def runJobs(jobs,baseline,store=False,tolerance=1.5):
+    '''runJobs(jobs,baseline,[store],[tolerance]): calls each of the given
+    benchmark jobs with a results dictionary and a temporary folder, then
+    compares, reports and optionally stores the results like run() does.
+    A job that fails is reported, and the next one is run. Returns a
+    (results,regressions) tuple.'''
+    results = {}
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for job in jobs:
+            try:
+                job(results,tmpdir)
+            except Exception as e:
+                FreeCAD.Console.PrintError("Benchmark job failed: "+(str(e) or e.__class__.__name__)+"\n")
+    finally:
+        shutil.rmtree(tmpdir,ignore_errors=True)
+    regressions = []
+    if os.path.exists(baseline):
+        f = open(baseline)
+        reference = json.load(f)
+        f.close()
+        regressions = compare(results,reference,tolerance)
+    report(results,regressions)
+    if store:
+        f = open(baseline,"w")
+        json.dump(results,f,indent=1,sort_keys=True)
+        f.close()
+        FreeCAD.Console.PrintMessage("Benchmark baseline saved to "+baseline+"\n")
+    return results,regressions
+
+def compare(results,reference,tolerance=1.5,minimum=0.05):
+    '''compare(results,reference,[tolerance],[minimum]): returns the keys of the
+    stages that took more than tolerance times their reference time. Stages
+    faster than minimum seconds are ignored, as they are too noisy'''
+    regressions = []
+    for key in sorted(results.keys()):
+        if key in reference:
+            t = results[key]["time"]
+            r = reference[key]["time"]
+            if (t is None) or (r is None):
+                continue
+            if (t > minimum) and (t > r*tolerance):
+                regressions.append(key)
+    return regressions
+
+def report(results,regressions=[]):
+    "prints the given benchmark results: time, memory change and peak memory increase of each stage"
+    for key in sorted(results.keys()):
+        t = results[key]["time"]
+        line = key.ljust(32)
+        line += ("%.3fs" % t).rjust(12) if t is not None else "failed".rjust(12)
+        for m in [results[key].get("memory"),results[key].get("peak")]:
+            line += ("%+.1fMB" % m).rjust(12) if m is not None else "".rjust(12)
+        if key in regressions:
+            line += "  REGRESSION"
+        if "error" in results[key]:
+            line += "  "+results[key]["error"]
+        FreeCAD.Console.PrintMessage(line+"\n")
+    if regressions:
+        FreeCAD.Console.PrintWarning(str(len(regressions))+" stage(s) slower than the baseline\n")
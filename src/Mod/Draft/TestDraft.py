@@ -132,6 +132,75 @@ class DraftTest(unittest.TestCase):
         r2 = Draft.offset(r,FreeCAD.Vector(-1,-1,0),copy=True)
         self.failUnless(r2,"Draft Offset failed")
 
+    def testArray(self):
+        FreeCAD.Console.PrintLog ('Checking Draft Array with instancing...\n')
+        r = Draft.makeRectangle(4,2)
+        a = Draft.makeArray(r,FreeCAD.Vector(5,0,0),FreeCAD.Vector(0,3,0),3,2)
+        a.Instancing = True
+        FreeCAD.ActiveDocument.recompute()
+        self.failUnless(len(a.Shape.Wires) == 6,"Draft Array with instancing failed")
+
+    def checkArray(self,array,copies):
+        "compares the shape of an array with the given copies of its base shape"
+        import Part
+        for fuse in [False,True]:
+            if fuse:
+                reference = copies[0].multiFuse(copies[1:]).removeSplitter()
+            else:
+                reference = Part.makeCompound(copies)
+            centers = sorted([tuple([round(c,6) for c in s.CenterOfMass]) for s in reference.Solids])
+            for instancing in [False,True]:
+                array.Fuse = fuse
+                array.Instancing = instancing
+                array.touch()
+                FreeCAD.ActiveDocument.recompute()
+                shape = array.Shape
+                message = "Draft Array differs with Fuse=%s Instancing=%s" % (fuse,instancing)
+                self.assertEqual(len(shape.Solids),len(reference.Solids),message)
+                self.assertAlmostEqual(shape.Volume,reference.Volume,6,message)
+                self.assertEqual(sorted([tuple([round(c,6) for c in s.CenterOfMass]) for s in shape.Solids]),centers,message)
+
+    def testArrayCopies(self):
+        FreeCAD.Console.PrintLog ('Checking Draft Array against separate copies...\n')
+        b = FreeCAD.ActiveDocument.addObject("Part::Box","ArrayBox")
+        b.Length = 4
+        FreeCAD.ActiveDocument.recompute()
+        # rectangular, with copies overlapping along x
+        a = Draft.makeArray(b,FreeCAD.Vector(3,0,0),FreeCAD.Vector(0,12,0),3,2)
+        copies = []
+        for x in range(3):
+            for y in range(2):
+                c = b.Shape.copy()
+                c.translate(FreeCAD.Vector(3*x,12*y,0))
+                copies.append(c)
+        self.checkArray(a,copies)
+        # polar, with copies touching at the center
+        a = Draft.makeArray(b,FreeCAD.Vector(0,0,0),270,4)
+        copies = []
+        for i in range(4):
+            c = b.Shape.copy()
+            c.rotate((0,0,0),(0,0,1),90*i)
+            copies.append(c)
+        self.checkArray(a,copies)
+
+    def testShapeCacheKey(self):
+        FreeCAD.Console.PrintLog ('Checking Draft shape cache keys...\n')
+        import Part, math
+        b1 = Part.makeBox(2,2,2)
+        b2 = Part.makeBox(2,2,2)
+        self.assertEqual(Draft.getShapeCacheKey(b1),Draft.getShapeCacheKey(b2))
+        b2.translate(FreeCAD.Vector(1,0,0))
+        self.assertNotEqual(Draft.getShapeCacheKey(b1),Draft.getShapeCacheKey(b2))
+        # same vertices, different curves
+        c1 = Part.makeCircle(2,FreeCAD.Vector(0,0,0),FreeCAD.Vector(0,0,1),0,180)
+        c2 = Part.Edge(Part.Ellipse(FreeCAD.Vector(0,0,0),2,1),0,math.pi)
+        self.assertNotEqual(Draft.getShapeCacheKey(c1),Draft.getShapeCacheKey(c2))
+        # BREP keys don't depend on the placement
+        self.assertEqual(Draft.getShapeBrepKey(b1),Draft.getShapeBrepKey(b2))
+        self.assertNotEqual(Draft.getShapeBrepKey(b1),Draft.getShapeBrepKey(Part.makeBox(2,2,3)))
+        # the SVG of a shape depends on the working plane
+        self.assertNotEqual(Draft.getSVGPlaneKey(FreeCAD.Vector(0,0,1)),Draft.getSVGPlaneKey(FreeCAD.Vector(0,1,0)))
+
     # modification tools
 
     def tearDown(self):
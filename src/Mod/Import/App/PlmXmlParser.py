@@ -24,167 +24,275 @@
 #***************************************************************************/
 
 
-import xml.etree.ElementTree as ET
+# The file is read with iterparse: each Instance and Part of the InstanceGraph
+# is turned into a document object as soon as it is read, then dropped, so
+# big product structures are never held in memory as a whole. The links
+# between the objects are resolved at the end through the index of the
+# created objects by PlmXml id. All the state of an import is held by an
+# Importer object, so several files can be imported at the same time.
 
-FreeCAD_On = False
-FreeCAD_Doc = None
-FreeCAD_ObjList = []
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+import os
+
+NS = '{http://www.plmxml.org/Schemas/PLMXMLSchema}'
+INSTANCEGRAPH = NS+'InstanceGraph'
+INSTANCE = NS+'Instance'
+PART = NS+'Part'
+USERDATA = NS+'UserData'
+USERVALUE = NS+'UserValue'
+BOUND = NS+'Bound'
+REPRESENTATION = NS+'Representation'
+TRANSFORM = NS+'Transform'
+
+def getStructureOnly():
+    "returns True if the geometry of the parts must not be loaded at import"
+    import FreeCAD
+    p = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/Import")
+    return p.GetBool("PlmXmlStructureOnly",False)
 
 def ParseUserData(element):
     res = {}
-    for i in element.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}UserData'):
-        for value in i.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}UserValue'):
-            res[value.attrib['title']] = value.attrib['value']
+    for i in element:
+        if i.tag == USERDATA:
+            for value in i:
+                if value.tag == USERVALUE:
+                    res[value.attrib['title']] = value.attrib['value']
+    return res
+
+def getPlacement(text):
+    "returns the placement of a PlmXml transform, a 4x4 matrix given column by column"
+    import FreeCAD
+    m = [float(i) for i in text.split()]
+    return FreeCAD.Placement(FreeCAD.Matrix(m[0],m[4],m[8],m[12],
+                                            m[1],m[5],m[9],m[13],
+                                            m[2],m[6],m[10],m[14],
+                                            m[3],m[7],m[11],m[15]))
+
+def readGeometry(location,format):
+    """returns a (feature type, property, geometry) tuple with the content of
+    the given representation file, or None if it can't be read"""
+    import FreeCAD
+    if not os.path.exists(location):
+        FreeCAD.Console.PrintWarning("PlmXml: representation file not found: "+location+"\n")
+        return None
+    try:
+        if format.upper() == 'JT' or location.lower().endswith('.jt'):
+            import JtReader
+            geom = JtReader.read(location)
+            res = ("Mesh::Feature","Mesh",geom)
+        else:
+            import Part
+            geom = Part.read(location)
+            res = ("Part::Feature","Shape",geom)
+    except Exception, e:
+        FreeCAD.Console.PrintWarning("PlmXml: unable to read "+location+": "+str(e)+"\n")
+        return None
+    if geom is None:
+        FreeCAD.Console.PrintWarning("PlmXml: no geometry in "+location+"\n")
+        return None
     return res
 
-def addPart(partElement):
-    global FreeCAD_On,FreeCAD_Doc,FreeCAD_ObjList
-    print "=== Part ======================================================"
-    name = partElement.attrib['name']
-    id = partElement.attrib['id']
-    userData = ParseUserData(partElement)
-
-    bound = partElement.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}Bound')
-    print bound.attrib['values']
-
-    representation = partElement.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}Representation')
-    format =  representation.attrib['format']
-    location = representation.attrib['location']
-
-    print id, name, userData, format, location
-    if FreeCAD_On:
-        import FreeCAD,Assembly
-        print"Create Reference"
-        partObject =FreeCAD_Doc.addObject("App::Part",id)
-        FreeCAD_ObjList.append(partObject)
-        partObject.Label = name
-        partObject.Meta = userData
-
-def addAssembly(asmElement):
-    global FreeCAD_On,FreeCAD_Doc,FreeCAD_ObjList
-    print "=== Assembly ======================================================"
-    userData = ParseUserData(asmElement)
-    name = asmElement.attrib['name']
-    id = asmElement.attrib['id']
-    instanceRefs = asmElement.attrib['instanceRefs']
-    userData['instanceRefs'] = instanceRefs
-
-    print id, name, instanceRefs, userData
-    if FreeCAD_On:
-        import FreeCAD,Assembly
-        print"Create Reference"
-        admObject =FreeCAD_Doc.addObject("Assembly::Product",id)
-        FreeCAD_ObjList.append(admObject)
-        admObject.Label = name
-        admObject.Meta = userData
-
-def addReference(refElement):
-    global FreeCAD_On,FreeCAD_Doc,FreeCAD_ObjList
-    print "=== Reference ======================================================"
-    userData = ParseUserData(refElement)
-    partRef = refElement.attrib['partRef'][1:]
-    userData['partRef'] = partRef
-    id = refElement.attrib['id']
-    name = refElement.attrib['name']
-    transform = refElement.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}Transform')
-    mtrx = [float(i) for i in transform.text.split(' ')]
-    print mtrx
-    print id,name,partRef
-
-    if FreeCAD_On:
-        import FreeCAD,Assembly
-        print"Create Reference"
-        refObject =FreeCAD_Doc.addObject("Assembly::ProductRef",id)
-        FreeCAD_ObjList.append(refObject)
-        refObject.Label = name
-        refObject.Meta = userData
-
-def resolveRefs():
-    global FreeCAD_On,FreeCAD_Doc,FreeCAD_ObjList
-    print "=== Resolve References ======================================================"
-    if FreeCAD_On:
-        for i in FreeCAD_ObjList:
-            if i.TypeId == 'Assembly::Product':
-                objectList = []
-                for l in  i.Meta['instanceRefs'].split(' '):
-                    objectList.append(FreeCAD_Doc.getObject(l))
-                i.Items = objectList
-            if i.TypeId == 'Assembly::ProductRef':
-                i.Item = FreeCAD_Doc.getObject(i.Meta['partRef'])
-
-def open(fileName):
+
+class Importer:
+    """Imports a PlmXml product structure in the given document. If doc is
+    None, the file is only read and its records counted. If structureOnly is
+    True, the geometry of the parts is not loaded, see expand()."""
+
+    def __init__(self,doc=None,structureOnly=False):
+        self.doc = doc
+        self.structureOnly = structureOnly
+        self.directory = ''
+        self.objects = {}   # PlmXml id -> document object
+        self.geometry = {}  # representation file -> result of readGeometry
+        self.links = []     # (object, property, PlmXml ids) to resolve
+        self.counts = {}    # tag -> number of records read
+
+    def parse(self,fileName):
+        self.directory = os.path.dirname(os.path.abspath(fileName))
+        graph = None
+        depth = 0
+        for event,elem in ET.iterparse(fileName,events=('start','end')):
+            if graph is None:
+                if (event == 'start') and (elem.tag == INSTANCEGRAPH):
+                    graph = elem
+            elif event == 'start':
+                depth += 1
+            elif depth:
+                depth -= 1
+                if not depth:
+                    # a complete child of the InstanceGraph
+                    self.addRecord(elem)
+                    graph.remove(elem)
+            else:
+                graph = None
+        self.resolveRefs()
+
+    def addRecord(self,elem):
+        tag = elem.tag
+        self.counts[tag] = self.counts.get(tag,0)+1
+        if tag == INSTANCE:
+            self.addReference(elem)
+        elif tag == PART:
+            type = elem.attrib.get('type')
+            if type == 'solid':
+                self.addPart(elem)
+            elif type == 'assembly':
+                self.addAssembly(elem)
+            elif type:
+                self.warn("Unknown Part type: "+type)
+            else:
+                self.warn("not Type in Part "+elem.attrib.get('id',''))
+
+    def warn(self,message):
+        if self.doc:
+            import FreeCAD
+            FreeCAD.Console.PrintWarning("PlmXml: "+message+"\n")
+        else:
+            print message
+
+    def addPart(self,partElement):
+        id = partElement.attrib['id']
+        location = None
+        representation = partElement.find(REPRESENTATION)
+        if representation is not None:
+            format = representation.attrib.get('format','')
+            location = representation.attrib.get('location')
+        userData = ParseUserData(partElement)
+        bound = partElement.find(BOUND)
+        if bound is not None:
+            userData['bound'] = bound.attrib['values']
+        if location:
+            location = os.path.normpath(os.path.join(self.directory,location))
+            userData['location'] = location
+            userData['format'] = format
+        partObject = None
+        if self.doc:
+            partObject = self.doc.addObject("App::Part",id)
+            partObject.Label = partElement.attrib['name']
+            partObject.Meta = userData
+            if location and not self.structureOnly:
+                self.loadGeometry(partObject)
+        self.objects[id] = partObject
+
+    def addAssembly(self,asmElement):
+        id = asmElement.attrib['id']
+        instanceRefs = asmElement.attrib.get('instanceRefs','')
+        userData = ParseUserData(asmElement)
+        userData['instanceRefs'] = instanceRefs
+        asmObject = None
+        if self.doc:
+            asmObject = self.doc.addObject("Assembly::Product",id)
+            asmObject.Label = asmElement.attrib['name']
+            asmObject.Meta = userData
+            self.links.append((asmObject,'Items',instanceRefs.split()))
+        self.objects[id] = asmObject
+
+    def addReference(self,refElement):
+        id = refElement.attrib['id']
+        partRef = refElement.attrib['partRef'][1:]
+        userData = ParseUserData(refElement)
+        userData['partRef'] = partRef
+        refObject = None
+        if self.doc:
+            refObject = self.doc.addObject("Assembly::ProductRef",id)
+            refObject.Label = refElement.attrib['name']
+            refObject.Meta = userData
+            transform = refElement.find(TRANSFORM)
+            if (transform is not None) and transform.text:
+                refObject.Placement = getPlacement(transform.text)
+            self.links.append((refObject,'Item',[partRef]))
+        self.objects[id] = refObject
+
+    def resolveRefs(self):
+        for obj,prop,ids in self.links:
+            items = [self.objects[i] for i in ids if self.objects.get(i)]
+            if len(items) < len(ids):
+                self.warn("unresolved references in "+obj.Name)
+            if prop == 'Items':
+                obj.Items = items
+            elif items:
+                obj.Item = items[0]
+        self.links = []
+
+    def loadGeometry(self,partObject):
+        """adds the geometry of its representation file to the given part
+        object. Files shared by several parts are read only once, and their
+        parts get features holding the same geometry"""
+        meta = partObject.Meta
+        location = meta.get('location')
+        if not location:
+            return
+        if meta.get('geometry') and partObject.Document.getObject(meta['geometry']):
+            return
+        if not location in self.geometry:
+            self.geometry[location] = readGeometry(location,meta.get('format',''))
+        res = self.geometry[location]
+        if res is None:
+            return
+        type,prop,geom = res
+        feature = partObject.Document.addObject(type,partObject.Name+"_Geometry")
+        setattr(feature,prop,geom)
+        partObject.addObject(feature)
+        meta['geometry'] = feature.Name
+        partObject.Meta = meta
+
+    def expand(self,obj):
+        "loads the geometry of the given part, or of all the parts below the given assembly or instance"
+        if obj.TypeId == 'Assembly::ProductRef':
+            if obj.Item:
+                self.expand(obj.Item)
+        elif obj.TypeId == 'Assembly::Product':
+            for item in obj.Items:
+                self.expand(item)
+        elif obj.TypeId == 'App::Part':
+            self.loadGeometry(obj)
+
+
+def expand(objects):
+    """expand(objects): loads the geometry of the given parts, assemblies or
+    instances of a product structure imported without geometry"""
+    if not isinstance(objects,list):
+        objects = [objects]
+    importer = Importer()
+    for obj in objects:
+        importer.expand(obj)
+
+def open(fileName,structureOnly=None):
     """called when freecad opens an PlmXml file"""
-    global FreeCAD_On,FreeCAD_Doc
-    import FreeCAD,os
+    import FreeCAD
     docname = os.path.splitext(os.path.basename(fileName))[0]
     doc = FreeCAD.newDocument(docname)
     message='Started with opening of "'+fileName+'" file\n'
     FreeCAD.Console.PrintMessage(message)
-    FreeCAD_Doc = doc
-    FreeCAD_On = True
-    parse(fileName)
-    resolveRefs()
+    if structureOnly is None:
+        structureOnly = getStructureOnly()
+    Importer(doc,structureOnly).parse(fileName)
 
-def insert(filename,docname):
+def insert(filename,docname,structureOnly=None):
     """called when freecad imports an PlmXml file"""
-    global FreeCAD_On,FreeCAD_Doc
     import FreeCAD
     FreeCAD.setActiveDocument(docname)
     doc=FreeCAD.getDocument(docname)
-    FreeCAD.Console.PrintMessage('Started import of "'+filename+'" file')
-    FreeCAD_Doc = doc
-    FreeCAD_On = True
-    parse(fileName)
-    resolveRefs()
+    FreeCAD.Console.PrintMessage('Started import of "'+filename+'" file\n')
+    if structureOnly is None:
+        structureOnly = getStructureOnly()
+    Importer(doc,structureOnly).parse(filename)
 
 def main():
     parse('../../../../data/tests/Jt/Engine/2_Cylinder_Engine3.plmxml')
 
 def parse(fileName):
-
-    tree = ET.parse(fileName)
-    root = tree.getroot()
-    ProductDef = root.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}ProductDef')
-
-    res = ParseUserData(ProductDef.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}UserData'))
-
-    InstanceGraph = ProductDef.find('{http://www.plmxml.org/Schemas/PLMXMLSchema}InstanceGraph')
-
-    # get all the special elements we can read
-    Instances = InstanceGraph.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}Instance')
-    Parts = InstanceGraph.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}Part')
-    ProductInstances = InstanceGraph.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}ProductInstance')
-    ProductRevisionViews = InstanceGraph.findall('{http://www.plmxml.org/Schemas/PLMXMLSchema}ProductRevisionView')
-
-    instanceTypesSet = set()
-    for child in InstanceGraph:
-        instanceTypesSet.add(child.tag)
+    """reads the given file without creating any object, and prints the
+    number of records of each type below the InstanceGraph"""
+    importer = Importer()
+    importer.parse(fileName)
     print "All types below the InstanceGraph:"
-    for i in instanceTypesSet:
-        print i
-    print ""
-
-    print len(Instances),'\t{http://www.plmxml.org/Schemas/PLMXMLSchema}Instance'
-    print len(Parts),'\t{http://www.plmxml.org/Schemas/PLMXMLSchema}Part'
-    print len(ProductInstances),'\t{http://www.plmxml.org/Schemas/PLMXMLSchema}ProductInstance'
-    print len(ProductRevisionViews),'\t{http://www.plmxml.org/Schemas/PLMXMLSchema}ProductRevisionView'
-
-    # handle all instances
-    for child in Instances:
-        addReference(child)
-
-    #handle the parts and assemblies
-    for child in Parts:
-        if 'type' in child.attrib:
-            if child.attrib['type'] == 'solid' :
-                addPart(child)
-                continue
-            if child.attrib['type'] == 'assembly' :
-                addAssembly(child)
-                continue
-            print "Unknown Part type:",child
-        else:
-            print "not Type in Part", child
+    for tag in sorted(importer.counts.keys()):
+        print importer.counts[tag],'\t'+tag
+    return importer
 
 
 if __name__ == '__main__':
@@ -29,10 +29,104 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+import array
 from SimpleDataTypes import *
 from TypeChecker import check_type
 import BaseType
 
+class NumericContainer(object):
+    """ A list-like container for the items of the ARRAY, LIST and BAG aggregates
+    of REAL or INTEGER values (cartesian point coordinates, B-spline weights and
+    knots...). Values are stored in an array.array, 8 bytes each instead of a
+    python object, and are returned as instances of the base type. Items can
+    be None (indeterminate).
+    """
+    __slots__ = ('_base_type','_values','_defined')
+
+    def __init__(self, base_type, typecode, size=0):
+        self._base_type = base_type
+        self._values = array.array(typecode,size*[0])
+        self._defined = bytearray(size)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getitem__(self, index):
+        if self._defined[index]:
+            return self._base_type(self._values[index])
+        return None
+
+    def __setitem__(self, index, value):
+        if value is None:
+            self._values[index] = 0
+            self._defined[index] = 0
+        else:
+            try:
+                self._values[index] = value
+            except OverflowError:
+                # too big for the array, fall back to a list
+                self._values = list(self._values)
+                self._values[index] = value
+            self._defined[index] = 1
+
+    def __iter__(self):
+        for index in xrange(len(self._values)):
+            yield self[index]
+
+    def __contains__(self, value):
+        if value is None:
+            return self.count(None) > 0
+        for item in self:
+            if item == value:
+                return True
+        return False
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def count(self, value):
+        if value is None:
+            return self._defined.count('\x00')
+        return len([item for item in self if item == value])
+
+    def append(self, value):
+        self._values.append(0)
+        self._defined.append(0)
+        self[len(self._values)-1] = value
+
+    def extend(self, values):
+        for value in values:
+            self.append(value)
+
+# the array typecode of each base type, None if its values are stored in a list
+_typecodes = {}
+
+def new_container(aggregate, size=0):
+    """ Returns the container for the items of an ARRAY, LIST or BAG: a
+    NumericContainer if its base type is a REAL or INTEGER type, a list of
+    size None items otherwise.
+    """
+    try:
+        base_type = aggregate.get_type()
+    except (AssertionError,TypeError):
+        # base type not defined in the scope (yet)
+        base_type = None
+    try:
+        typecode = _typecodes[base_type]
+    except KeyError:
+        typecode = None
+        if isinstance(base_type,type):
+            if issubclass(base_type,REAL):
+                typecode = 'd'
+            elif issubclass(base_type,INTEGER):
+                typecode = 'l'
+        _typecodes[base_type] = typecode
+    except TypeError: # unhashable base type
+        typecode = None
+    if typecode:
+        return NumericContainer(base_type,typecode,size)
+    return size*[None]
+
 class BaseAggregate(object):
     """ A class that define common properties to ARRAY, LIST, SET and BAG.
     """
@@ -139,7 +233,7 @@ class ARRAY(BaseType.Type, BaseType.Aggregate):
         self._optional = OPTIONAL
         # preallocate list elements
         list_size = bound_2 - bound_1 + 1
-        self._container = list_size*[None]
+        self._container = new_container(self,list_size)
     
     def bound_1(self):
         return self._bound_1
@@ -254,10 +348,10 @@ class LIST(BaseType.Type, BaseType.Aggregate):
         # preallocate list elements if bounds are both integers
         if not self._unbounded:
             list_size = bound_2 - bound_1 + 1
-            self._container = list_size*[None]
+            self._container = new_container(self,list_size)
         # for unbounded list, this will come after
         else:
-            self._container = [None]
+            self._container = new_container(self,1)
 
     def bound_1(self):
         return self._bound_1
@@ -348,7 +442,7 @@ class LIST(BaseType.Type, BaseType.Aggregate):
             # if the _container list is of good size, just do like the bounded case
             if (index-self._bound_1<len(self._container)):
                 # first check the type of the value
-                check_type(value,self.get_type)
+                check_type(value,self.get_type())
                 # then check if the value is already in the array
                 if self._unique:
                     if value in self._container:
@@ -424,7 +518,7 @@ class BAG(BaseType.Type, BaseType.Aggregate):
         # set up class attributes
         self._bound_1 = bound_1
         self._bound_2 = bound_2
-        self._container = []
+        self._container = new_container(self)
 
     def bound_1(self):
         return self._bound_1
@@ -29,6 +29,9 @@
 # (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
+# the types already looked up, by (scope, name)
+_resolved_types = {}
+
 class Type(object):
     '''
     A type can be defined from its name and scope
@@ -44,10 +47,14 @@ class Type(object):
     
     def get_type(self):
         if type(self._typedef) == str:
+            key = (self._scope,self._typedef)
+            if key in _resolved_types:
+                return _resolved_types[key]
             if self._scope == None:
                 raise AssertionError('No scope defined for this type')
             elif vars(self._scope).has_key(self._typedef):
-                return vars(self._scope)[self._typedef]
+                resolved_type = _resolved_types[key] = vars(self._scope)[self._typedef]
+                return resolved_type
             else:
                 raise TypeError("Type '%s' is not defined in given scope"%self._typedef)
         else:
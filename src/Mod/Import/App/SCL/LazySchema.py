@@ -0,0 +1,313 @@
+# This file is part of the StepClassLibrary (SCL).
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+#   Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+#
+#   Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+#   Neither the name of the <ORGANIZATION> nor the names of its contributors may
+#   be used to endorse or promote products derived from this software without
+#   specific prior written permission.
+
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED.
+# IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY
+# DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES
+# (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES;
+# LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND
+# ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF
+# THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+"""Lazy loading of the schema modules generated by fedex_python
+
+The generated schema modules (config_control_design, automotive_design,
+ifc2x3...) declare thousands of classes. Importing one of them compiles and
+runs all of them. load_schema() instead returns an object that behaves like
+the schema module, but only runs the top-level statements defining the
+names that are actually used, for example:
+
+    import LazySchema
+    schema = LazySchema.load_schema('config_control_design')
+    product = schema.product # only product and what it needs are defined
+
+The source of a schema is split once into its top-level statements. The
+table of their positions, of the names they define and of the names they
+use is stored in the user's FreeCAD data folder (or in a private folder of
+the temp folder) and reused as long as the source does not change.
+"""
+
+import sys, os, re, imp, marshal, hashlib
+
+__title__="Lazy schema loader"
+__version__ = "0.1 (Oct 2016)"
+
+TABLE_VERSION = 1
+
+
+def get_table_folder():
+    """returns the folder where the tables are stored: the SchemaTables folder
+    of the user's FreeCAD data, or a folder of the temp folder that only the
+    user can write to. Returns None if there is no such folder"""
+    try:
+        import FreeCAD
+        folder = os.path.join(FreeCAD.ConfigGet("UserAppData"),"SchemaTables")
+    except (ImportError,AttributeError):
+        import tempfile, getpass
+        folder = os.path.join(tempfile.gettempdir(),"SchemaTables-"+getpass.getuser())
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder,0700)
+        except OSError:
+            if not os.path.isdir(folder):
+                return None
+    if hasattr(os,'getuid'):
+        # the tables are loaded with marshal, so nobody else may plant them
+        stat = os.stat(folder)
+        if (stat.st_uid != os.getuid()) or (stat.st_mode & 022):
+            return None
+    return folder
+
+def get_table_file(filename):
+    """returns the file where the table of the given schema source is stored,
+    or None"""
+    folder = get_table_folder()
+    if not folder:
+        return None
+    filename = os.path.abspath(filename)
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(folder,name+'-'+hashlib.md5(filename).hexdigest()[:12]+'.sclt')
+
+# top-level statements of the generated modules start at the beginning of a
+# line, everything else (class and function bodies, continuation lines of
+# SELECT definitions...) is indented
+STATEMENT_RE = re.compile(r"^[A-Za-z_@]", re.M)
+DEFINITION_RE = re.compile(r"(?:class|def)\s+([A-Za-z_]\w*)|([A-Za-z_]\w*)\s*=(?!=)")
+# strings and comments are removed before looking for the names used
+IGNORED_RE = re.compile(r"\'\'\'.*?\'\'\'|\"\"\".*?\"\"\"|'[^'\n]*'|\"[^\"\n]*\"|#[^\n]*", re.S)
+NAME_RE = re.compile(r"[A-Za-z_]\w*")
+
+def build_table(filename):
+    """splits the source of a schema module into its top-level statements, and
+    returns a (statements, names, dependencies, header) tuple:
+    statements : the (start, end) offsets of each statement in the source
+    names : the index of the statement defining each name
+    dependencies : for each statement, the indices of the statements defining
+    the names it uses
+    header : the indices of the statements that define no name (imports...)
+    """
+    source = open(filename,'rU').read()
+    starts = [m.start() for m in STATEMENT_RE.finditer(source)]
+    statements = [(starts[i],starts[i+1]) for i in range(len(starts)-1)]
+    if starts:
+        statements.append((starts[-1],len(source)))
+    names = {}
+    used = []
+    header = []
+    for i,(start,end) in enumerate(statements):
+        m = DEFINITION_RE.match(source,start,end)
+        if m:
+            names[m.group(1) or m.group(2)] = i
+        else:
+            header.append(i)
+        used.append(set(NAME_RE.findall(IGNORED_RE.sub(' ',source[start:end]))))
+    dependencies = []
+    for i,u in enumerate(used):
+        dependencies.append(tuple(sorted(set([names[n] for n in u if (n in names) and (names[n] != i)]))))
+    return statements, names, dependencies, header
+
+def get_table(filename):
+    """returns the table of the given schema source (see build_table), from
+    the stored table file if it is up to date"""
+    stat = os.stat(filename)
+    key = (TABLE_VERSION,int(stat.st_mtime),stat.st_size)
+    tablefile = get_table_file(filename)
+    if tablefile and os.path.exists(tablefile):
+        try:
+            f = open(tablefile,'rb')
+            data = marshal.load(f)
+            f.close()
+        except (EOFError,ValueError,TypeError,IOError):
+            pass
+        else:
+            if data[0] == key:
+                return data[1]
+    table = build_table(filename)
+    if tablefile:
+        # written to a temporary file which is then renamed, so another import
+        # never reads a partly written table
+        tmpfile = tablefile+'.'+str(os.getpid())+'.tmp'
+        try:
+            f = open(tmpfile,'wb')
+            marshal.dump((key,table),f)
+            f.close()
+            if os.name == 'nt' and os.path.exists(tablefile):
+                os.remove(tablefile) # rename doesn't replace files on Windows
+            os.rename(tmpfile,tablefile)
+        except (IOError,OSError):
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+    return table
+
+
+class LazyDict(dict):
+    """ The namespace of a lazy schema. Names that are not defined yet are
+    loaded from the schema source when they are looked up.
+    """
+    def __init__(self,schema):
+        dict.__init__(self)
+        self._lazy_schema = schema
+
+    def __missing__(self,key):
+        if self._lazy_schema._load(key):
+            return dict.__getitem__(self,key)
+        raise KeyError(key)
+
+    def __contains__(self,key):
+        return dict.__contains__(self,key) or self._lazy_schema._load(key)
+
+    def has_key(self,key):
+        return self.__contains__(key)
+
+    def get(self,key,default=None):
+        if self.__contains__(key):
+            return dict.__getitem__(self,key)
+        return default
+
+
+class LazySchema(object):
+    """ A schema module whose top-level statements are run on first use.
+    vars() of this object returns its namespace, so it can be used as the
+    scope of the SCL types.
+    """
+    def __init__(self,name,filename):
+        statements,names,dependencies,header = get_table(filename)
+        self.__dict__ = LazyDict(self)
+        self.__dict__.update({'__name__':name,'__file__':filename})
+        self._lazy_source = open(filename,'rU').read()
+        self._lazy_statements = statements
+        self._lazy_names = names
+        self._lazy_dependencies = dependencies
+        self._lazy_done = set()
+        self._lazy_errors = {}
+        sys.modules[name] = self
+        for i in header:
+            self._run(i)
+
+    def __getattr__(self,name):
+        if name.startswith('__') or not self._load(name):
+            raise AttributeError(name)
+        return dict.__getitem__(self.__dict__,name)
+
+    def _run(self,i):
+        "runs the given top-level statement"
+        self._lazy_done.add(i)
+        start,end = self._lazy_statements[i]
+        try:
+            # padded so line numbers in tracebacks match the source file
+            padding = '\n'*self._lazy_source.count('\n',0,start)
+            code = compile(padding+self._lazy_source[start:end],self.__file__,'exec')
+        except SyntaxError, e:
+            # some generated statements are not valid python, they only
+            # fail when they are needed
+            self._lazy_errors[i] = e
+            return
+        exec code in self.__dict__
+
+    def _load(self,name):
+        """defines the given name, together with all the names it uses.
+        Returns False if the schema does not define it"""
+        if not name in self._lazy_names:
+            return False
+        i = self._lazy_names[name]
+        if i in self._lazy_done:
+            return dict.__contains__(self.__dict__,name)
+        # the statements used by this one are run first, in depth-first order
+        order = []
+        stack = [(i,False)]
+        seen = set([i])
+        while stack:
+            j,expanded = stack.pop()
+            if expanded:
+                order.append(j)
+                continue
+            stack.append((j,True))
+            for k in self._lazy_dependencies[j]:
+                if not (k in seen or k in self._lazy_done):
+                    seen.add(k)
+                    stack.append((k,False))
+        for j in order:
+            if not j in self._lazy_done:
+                self._run(j)
+        if i in self._lazy_errors:
+            raise ImportError("%s: unable to define %s: %s"%(self.__name__,name,self._lazy_errors[i]))
+        return dict.__contains__(self.__dict__,name)
+
+    def get_names(self):
+        """returns all the names defined by this schema, without loading them"""
+        return self._lazy_names.keys()
+
+    def get_number_of_loaded_names(self):
+        return len([n for n,i in self._lazy_names.items() if i in self._lazy_done])
+
+
+def load_schema(name,path=None):
+    """load_schema(name,[path]): returns the lazy schema of the given name,
+    searched on sys.path or in the given list of folders"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    fp,filename,description = imp.find_module(name,path)
+    if fp:
+        fp.close()
+    if description[2] != imp.PY_SOURCE:
+        raise ImportError("No schema source for %s"%name)
+    return LazySchema(name,filename)
+
+def benchmark(names,entities=[]):
+    """benchmark(names,[entities]): for each given schema name, imports the
+    schema normally and lazily in separate processes, uses the given entities,
+    and prints the time and memory taken"""
+    import subprocess
+    script = """
+import sys, time, resource
+sys.path = %r
+r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+t = time.time()
+try:
+    if %r:
+        import LazySchema
+        m = LazySchema.load_schema(%r)
+    else:
+        m = __import__(%r)
+    for e in %r:
+        getattr(m,e,None)
+except Exception, e:
+    print 'failed: %%s'%%e
+else:
+    print '%%.3fs %%.1fMB'%%(time.time()-t,(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss-r)/1024.)
+"""
+    here = os.path.dirname(os.path.abspath(__file__))
+    path = [here]+sys.path
+    for name in names:
+        for lazy in [False,True]:
+            p = subprocess.Popen([sys.executable,'-c',script%(path,lazy,name,name,entities)],stdout=subprocess.PIPE)
+            out = p.communicate()[0].strip()
+            print "%s %s: %s"%(name,['import','lazy'][lazy],out)
+
+if __name__ == "__main__":
+    # compares the normal and lazy loading of the schemas given on the command
+    # line, or of the schemas found next to this folder
+    names = sys.argv[1:]
+    if not names:
+        names = ['config_control_design','automotive_design','ifc2x3','ifc4',
+                 'ap203_configuration_controlled_3d_design_of_mechanical_parts_and_assemblies_mim_lf']
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    benchmark(names,['product','ifcproduct'])
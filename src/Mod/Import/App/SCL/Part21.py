@@ -30,12 +30,266 @@
 # THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import re
-import Utils
+import os
+import sys
 import time
 
 
 INSTANCE_DEFINITION_RE = re.compile("#(\d+)[^\S\n]?=[^\S\n]?(.*?)\((.*)\)[^\S\n]?;[\\r]?$")
 
+# a record is everything up to the next semicolon that is not inside a string
+# or a comment. It is only used when the next semicolon may be inside a string
+# or a comment. A string may not end right before another quote, otherwise
+# 'a''b' could also be read as the two strings 'a' and 'b', and a failed match
+# (an incomplete record) would try every split of every '' in it
+RECORD_RE = re.compile(r"(?:[^;'/]|'(?:[^']|'')*'(?!')|/\*.*?\*/|/(?!\*))*;", re.S)
+# attribute tokens: strings, parenthesis, commas, and anything else without
+# its surrounding whitespace
+ATTRIBUTE_TOKEN_RE = re.compile(r"'(?:[^']|'')*'|[(),]|[^'(),\s](?:[^'(),]*[^'(),\s])?")
+# comments are only comments outside strings
+STRING_OR_COMMENT_RE = re.compile(r"'(?:[^']|'')*'|/\*.*?\*/", re.S)
+
+BLOCK_SIZE = 1048576
+
+def remove_comment(match):
+    text = match.group(0)
+    if text.startswith("'"):
+        return text
+    return ''
+
+def clean_record(record):
+    """ Removes the comments, line breaks and surrounding whitespace of a record
+    """
+    if '/*' in record:
+        record = STRING_OR_COMMENT_RE.sub(remove_comment, record)
+    return record.replace("\n","").replace("\r","").strip()
+
+def iter_records(fp, block_size=BLOCK_SIZE, offsets=False):
+    """ Yields the records (without their terminating semicolon) of an open
+    Part21 file, reading it block by block. Line breaks are removed. If offsets
+    is True, (offset, length, record) tuples are yielded, offset and length
+    being the position of the raw record in the file.
+    """
+    buf = ''
+    base = 0 # the file position of the start of buf
+    while True:
+        block = fp.read(block_size)
+        if not block:
+            break
+        buf += block
+        pos = 0
+        while True:
+            end = buf.find(';', pos)
+            if end == -1:
+                break
+            if (buf.count("'", pos, end) % 2) or ('/*' in buf[pos:end]):
+                # the semicolon may be inside a string or a comment
+                match = RECORD_RE.match(buf, pos)
+                if not match:
+                    break
+                end = match.end()-1
+            if offsets:
+                yield base+pos, end+1-pos, clean_record(buf[pos:end])
+            else:
+                yield clean_record(buf[pos:end])
+            pos = end+1
+        buf = buf[pos:]
+        base += pos
+
+class TypedParameter(list):
+    """ A typed parameter, such as LENGTH_MEASURE(1.E-06), or one of the
+    partial entities of a complex instance, such as SI_UNIT(.MILLI.,.METRE.).
+    It is the list of its parameters, name being the type or entity name.
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name, parameters=()):
+        list.__init__(self, parameters)
+        self.name = name
+
+    def __eq__(self, other):
+        if isinstance(other, TypedParameter) and (other.name != self.name):
+            return False
+        return list.__eq__(self, other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return 'TypedParameter(%r, %s)'%(self.name, list.__repr__(self))
+
+def parse_attributes(attr_str):
+    """ Splits an attributes string into a list of attributes, nested lists
+    being returned as lists. Strings are kept whole, with their quotes, and
+    whitespace around attributes is removed.
+    input string: "(1,4,(5,6),7)"
+    output: [['1','4',['5','6'],'7']]
+    Typed parameters and the partial entities of complex instances are
+    returned as TypedParameter lists:
+    input string: "LENGTH_UNIT()SI_UNIT(.MILLI.,.METRE.)"
+    output: [TypedParameter('LENGTH_UNIT', ['']), TypedParameter('SI_UNIT', ['.MILLI.', '.METRE.'])]
+    """
+    stack = []
+    top = []
+    current = ''
+    for token in ATTRIBUTE_TOKEN_RE.findall(attr_str):
+        if token == ',':
+            top.append(current)
+            current = ''
+        elif token == '(':
+            if not isinstance(current, str):
+                top.append(current)
+                current = ''
+            # current is the name of a typed parameter, or empty
+            stack.append((top, current))
+            top = []
+            current = ''
+        elif token == ')':
+            top.append(current)
+            if stack:
+                parameters = top
+                top, name = stack.pop()
+            else:
+                # unbalanced parenthesis
+                parameters, name = top, ''
+                top = []
+            if name:
+                current = TypedParameter(name, parameters)
+            else:
+                current = parameters
+        else:
+            if isinstance(current, list) or current:
+                # the partial entities of a complex instance are not
+                # separated by commas
+                top.append(current)
+            current = token
+    top.append(current)
+    return top
+
+def parse_record(record):
+    """ Returns the (id, entity name, attributes list) of an entity instance
+    record, or None if the record is not an entity instance.
+    """
+    if not record.startswith('#'):
+        return None
+    eq = record.find('=')
+    if eq == -1:
+        return None
+    body = record[eq+1:].strip()
+    start = body.find('(')
+    end = body.rfind(')')
+    if (start == -1) or (end < start):
+        return None
+    try:
+        instance_id = int(record[1:eq])
+    except ValueError:
+        return None
+    return instance_id, body[:start].strip(), parse_attributes(body[start+1:end])
+
+def iter_instances(filename):
+    """ Yields the (id, entity name, attributes list) of all the entity
+    instances of a Part21 file, and ('schema', name) for the FILE_SCHEMA header.
+    """
+    fp = open(filename)
+    try:
+        for record in iter_records(fp):
+            instance = parse_record(record)
+            if instance:
+                yield instance
+            elif record.startswith('FILE_SCHEMA'):
+                yield ('schema', record.split("'")[1].split("'")[0].split(" ")[0].lower())
+    finally:
+        fp.close()
+
+def quote_string(value):
+    """ Returns the Part21 string literal of a text value. Non ASCII characters
+    of unicode values are encoded with \\X2\\ control directives.
+    """
+    value = value.replace('\\','\\\\').replace("'","''")
+    if isinstance(value, unicode):
+        chars = []
+        for c in value:
+            if ord(c) < 128:
+                chars.append(str(c))
+            else:
+                chars.append('\\X2\\%04X\\X0\\'%ord(c))
+        value = ''.join(chars)
+    return "'"+value+"'"
+
+def format_real(value):
+    """ Returns the Part21 literal of a real value. The mantissa always
+    contains a decimal point, for example 1. or 1.5E-07
+    """
+    mantissa, e, exponent = repr(float(value)).upper().partition('E')
+    if not '.' in mantissa:
+        mantissa += '.'
+    if e:
+        return mantissa+'E'+exponent
+    return mantissa
+
+def format_attribute(value):
+    """ Returns the Part21 representation of an attribute value:
+    str : written as it is. These are Part21 tokens, as returned by
+    parse_attributes: "'text'", "#12", ".T.", "$"...
+    unicode : a string literal (see quote_string)
+    None : $
+    bool, int, long, float : a logical, integer or real literal
+    TypedParameter : a typed parameter, such as LENGTH_MEASURE(1.E-06)
+    list or tuple : an aggregate
+    objects with an id attribute (instances of a SimpleReader.LazyModel) :
+    a reference to the instance
+    """
+    if isinstance(value, str):
+        return value
+    elif isinstance(value, unicode):
+        return quote_string(value)
+    elif value is None:
+        return '$'
+    elif isinstance(value, bool):
+        return value and '.T.' or '.F.'
+    elif isinstance(value, (int, long)):
+        return str(value)
+    elif isinstance(value, float):
+        return format_real(value)
+    elif isinstance(value, TypedParameter):
+        return value.name.upper()+'('+format_attributes(value)+')'
+    elif isinstance(value, (list, tuple)):
+        return '('+format_attributes(value)+')'
+    elif hasattr(value, 'id'):
+        return '#%i'%value.id
+    raise TypeError("Can not write a %s attribute"%type(value))
+
+def format_attributes(attributes):
+    """ Returns the Part21 representation of an attributes list, without the
+    enclosing parenthesis. This is the reverse of parse_attributes:
+    input: ['1','4',['5','6'],'7']
+    output string: "1,4,(5,6),7"
+    """
+    return ','.join([format_attribute(a) for a in attributes])
+
+def format_instance(instance_id, entity_name, attributes):
+    """ Returns the Part21 record of an entity instance, with its semicolon.
+    The attributes of a complex instance, whose entity name is empty, are its
+    partial entities, as TypedParameter lists (see parse_attributes)
+    """
+    if not entity_name:
+        return '#%i=(%s);'%(instance_id, ''.join([format_attribute(a) for a in attributes]))
+    return '#%i=%s(%s);'%(instance_id, entity_name.upper(), format_attributes(attributes))
+
+def clear_type_mismatches():
+    """ Forgets the type mismatches recorded by the type checkers already
+    loaded (see TypeChecker.clear_pending). The schema modules import it as
+    SCL.TypeChecker and the SCL modules as TypeChecker, which can be two
+    different modules
+    """
+    for name in ('TypeChecker', 'SCL.TypeChecker'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module.clear_pending()
+
 def map_string_to_num(stri):
     """ Take a string, check wether it is an integer, a float or not
     """
@@ -90,6 +344,80 @@ class Part21EntityInstance:
         print self._attributes_definition
 
 
+class Part21Index:
+    """
+    Indexes the entity instances of a Part21 file without parsing their
+    attributes. Two dicts are created:
+    self._offsets : the (offset, length) of the record of each instance in the file,
+    key is the instance integer id
+    self._types : the list of instance ids of each entity name
+    Records are read and parsed on demand by get_definition().
+    """
+    def __init__(self, filename):
+        self._filename = filename
+        self._schema_name = ""
+        self._offsets = {}
+        self._types = {}
+        self._fp = None
+        self.index_file()
+
+    def get_schema_name(self):
+        return self._schema_name
+
+    def get_number_of_instances(self):
+        return len(self._offsets)
+
+    def get_entity_names(self):
+        return self._types.keys()
+
+    def get_ids(self, entity_name=None):
+        """ Returns the ids of all the instances of the given entity name,
+        or of all instances if no name is given
+        """
+        if entity_name is None:
+            return self._offsets.keys()
+        return self._types.get(entity_name.upper(), [])
+
+    def has_id(self, instance_id):
+        return instance_id in self._offsets
+
+    def index_file(self):
+        # the type mismatches of the previous file are forgotten
+        clear_type_mismatches()
+        fp = open(self._filename, 'rb')
+        try:
+            for offset, length, record in iter_records(fp, offsets=True):
+                if record.startswith('#'):
+                    eq = record.find('=')
+                    start = record.find('(', eq)
+                    if (eq == -1) or (start == -1):
+                        continue
+                    try:
+                        instance_id = int(record[1:eq])
+                    except ValueError:
+                        continue
+                    self._offsets[instance_id] = (offset, length)
+                    self._types.setdefault(record[eq+1:start].strip().upper(), []).append(instance_id)
+                elif record.startswith('FILE_SCHEMA'):
+                    self._schema_name = record.split("'")[1].split("'")[0].split(" ")[0].lower()
+        finally:
+            fp.close()
+
+    def get_definition(self, instance_id):
+        """ Returns the (entity name, attributes list) of the given instance
+        """
+        offset, length = self._offsets[instance_id]
+        if self._fp is None:
+            self._fp = open(self._filename, 'rb')
+        self._fp.seek(offset)
+        record = clean_record(self._fp.read(length)[:-1])
+        return parse_record(record)[1:]
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+
 class Part21Parser:
     """
     Loads all instances definition of a Part21 file into memory.
@@ -125,33 +453,14 @@ class Part21Parser:
     def parse_file(self):
         init_time = time.time()
         print "Parsing file %s..."%self._filename,
-        fp = open(self._filename)
-        while True:
-            line = fp.readline()
-            if not line:
-                break
-            # there may be a multline definition. In this case, we read lines untill we found
-            # a ;
-            while (line.find(';') == -1): #its a multiline
-                line = line.replace("\n","").replace("\r","") + fp.readline()
-            # parse line
-            match_instance_definition = INSTANCE_DEFINITION_RE.search(line)  # id,name,attrs
-            if match_instance_definition:
-                instance_id, entity_name, entity_attrs = match_instance_definition.groups()
-                instance_int_id = int(instance_id)
-                # find number of ancestors
-                #number_of_ancestors = entity_attrs.count('#')
-                # fill number of ancestors dict
-                #self._number_of_ancestors[number_of_ancestors].append(instance_int_id) # this kind of sorting don't work on non-trivial files
-                # parse attributes string
-                entity_attrs_list, str_len = Utils.process_nested_parent_str(entity_attrs)
-                # then finally append this instance to the disct instance
-                self._instances_definition[instance_int_id] = (entity_name,entity_attrs_list)
-            else: #does not match with entity instance definition, parse the header
-                if line.startswith('FILE_SCHEMA'):
-                    #identify the schema name
-                    self._schema_name = line.split("'")[1].split("'")[0].split(" ")[0].lower()
-        fp.close()
+        # the type mismatches of the previous file are forgotten
+        clear_type_mismatches()
+        for instance in iter_instances(self._filename):
+            if instance[0] == 'schema':
+                self._schema_name = instance[1]
+            else:
+                # then finally append this instance to the dict instance
+                self._instances_definition[instance[0]] = instance[1:]
         print 'done in %fs.'%(time.time()-init_time)
         print 'schema: - %s entities %i'%(self._schema_name,len(self._instances_definition.keys()))
 
@@ -200,10 +509,177 @@ class Part21Population(object):
         print "instance_attributes:",instance_attributes
         a = object_(*instance_attributes)
 
+class Part21Writer:
+    """
+    Writes a Part21 file incrementally. Records are buffered, and written to
+    disk each time the buffer exceeds buffer_size bytes. Instances keep the
+    ids they are given, instances written without an id are numbered after
+    the highest id written so far:
+
+        writer = Part21Writer("out.stp", "config_control_design")
+        context = writer.write_instance("APPLICATION_CONTEXT", [u"mechanical design"])
+        writer.write_instance("PRODUCT", [u"part", u"part", u"", ["#%i"%context]])
+        writer.close()
+    """
+    def __init__(self, filename, schema_name, description="", author="", organization="", buffer_size=BLOCK_SIZE):
+        self._fp = open(filename, 'wb')
+        self._buffer = []
+        self._buffer_length = 0
+        self._buffer_size = buffer_size
+        self._next_id = 1
+        self._closed = False
+        self.write_record("ISO-10303-21;")
+        self.write_record("HEADER;")
+        self.write_record("FILE_DESCRIPTION((%s),'2;1');"%quote_string(description))
+        self.write_record("FILE_NAME(%s,%s,(%s),(%s),'SCL','SCL','');"%(quote_string(os.path.basename(filename)),
+                          quote_string(time.strftime("%Y-%m-%dT%H:%M:%S")), quote_string(author), quote_string(organization)))
+        self.write_record("FILE_SCHEMA((%s));"%quote_string(schema_name.upper()))
+        self.write_record("ENDSEC;")
+        self.write_record("DATA;")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exctype, excvalue, traceback):
+        self.close()
+
+    def write_record(self, record):
+        """ Writes a raw record, with its semicolon
+        """
+        self._buffer.append(record+"\n")
+        self._buffer_length += len(record)+1
+        if self._buffer_length > self._buffer_size:
+            self.flush()
+
+    def write_instance(self, entity_name, attributes, instance_id=None):
+        """ Writes an entity instance (see format_attribute for the
+        attributes), and returns its id
+        """
+        if instance_id is None:
+            instance_id = self._next_id
+        self._next_id = max(self._next_id, instance_id+1)
+        self.write_record(format_instance(instance_id, entity_name, attributes))
+        return instance_id
+
+    def write_instances(self, instances):
+        """ Writes the instances of a dict of (entity name, attributes)
+        definitions, such as Part21Parser._instances_definition, by increasing
+        id, or of a list of (id, entity name, attributes) tuples, in order
+        """
+        if isinstance(instances, dict):
+            for instance_id in sorted(instances.keys()):
+                entity_name, attributes = instances[instance_id]
+                self.write_instance(entity_name, attributes, instance_id)
+        else:
+            for instance_id, entity_name, attributes in instances:
+                self.write_instance(entity_name, attributes, instance_id)
+
+    def flush(self):
+        self._fp.write(''.join(self._buffer))
+        self._buffer = []
+        self._buffer_length = 0
+
+    def close(self):
+        if self._closed:
+            return
+        self.write_record("ENDSEC;")
+        self.write_record("END-ISO-10303-21;")
+        self.flush()
+        self._fp.close()
+        self._closed = True
+
+def copy_bytes(source, target, length, block_size=BLOCK_SIZE):
+    """ Copies length bytes from a file to another, block by block
+    """
+    while length > 0:
+        block = source.read(min(length, block_size))
+        if not block:
+            break
+        target.write(block)
+        length -= len(block)
+
+def patch_file(filename, target, changes, block_size=BLOCK_SIZE):
+    """ Copies a Part21 file, changing some of its instances. changes is a dict
+    where keys are instance ids, and values are either a (entity name,
+    attributes) tuple, or None to remove the instance. Instances that are not
+    in the file are added at the end of its DATA section. Everything else,
+    including the header, comments and layout, is copied byte for byte, so
+    the metadata of big files can be edited without parsing their geometry.
+    Returns the number of changed records.
+    """
+    pending = dict(changes)
+    count = 0
+    fp = open(filename, 'rb')
+    source = open(filename, 'rb')
+    out = open(target, 'wb')
+    try:
+        position = 0 # the position up to which the source is copied
+        in_data = False
+        for offset, length, record in iter_records(fp, block_size, offsets=True):
+            if record == 'DATA':
+                in_data = True
+                continue
+            elif record == 'ENDSEC' and in_data:
+                # new instances are added before the end of the DATA section
+                copy_bytes(source, out, offset-position, block_size)
+                position = offset
+                for instance_id in sorted(pending.keys()):
+                    if pending[instance_id] is not None:
+                        out.write("\n"+format_instance(instance_id, *pending[instance_id]))
+                        count += 1
+                pending = {}
+                in_data = False
+                continue
+            elif not (in_data and record.startswith('#')):
+                continue
+            eq = record.find('=')
+            try:
+                instance_id = int(record[1:eq])
+            except ValueError:
+                continue
+            if not instance_id in pending:
+                continue
+            copy_bytes(source, out, offset-position, block_size)
+            raw = source.read(length)
+            position = offset+length
+            definition = pending.pop(instance_id)
+            if definition is not None:
+                # keep the line break and indentation before the record
+                out.write(raw[:len(raw)-len(raw.lstrip())]+format_instance(instance_id, *definition))
+            count += 1
+        copy_bytes(source, out, os.path.getsize(filename)-position, block_size)
+    finally:
+        out.close()
+        source.close()
+        fp.close()
+    return count
+
+def benchmark(filenames, repeat=3):
+    """ Parses the given files and returns a list of (filename, size in bytes,
+    number of instances, best parsing time in seconds)
+    """
+    results = []
+    for filename in filenames:
+        best = None
+        count = 0
+        for i in range(repeat):
+            init_time = time.time()
+            count = 0
+            for instance in iter_instances(filename):
+                if instance[0] != 'schema':
+                    count += 1
+            t = time.time()-init_time
+            if (best is None) or (t < best):
+                best = t
+        results.append((filename, os.path.getsize(filename), count, best))
+    return results
+
 if __name__ == "__main__":
-    import time
+    # throughput benchmark, on the given files or on the bundled samples
     import sys
-    from config_control_design import *
-    p21loader = Part21Parser("gasket1.p21")
-    print "Creating instances"
-    p21population = Part21Population(p21loader)
+    filenames = sys.argv[1:]
+    if not filenames:
+        here = os.path.dirname(os.path.abspath(__file__))
+        filenames = [os.path.join(here, f) for f in ["gasket1.p21", "Aufspannung.stp", "Product1.stp"]]
+    for filename, size, count, t in benchmark(filenames):
+        print "%s: %i instances, %i bytes in %fs (%.2f MB/s)"%(os.path.basename(filename), count, size, t, size/(max(t, 1e-9)*1048576))
@@ -34,6 +34,14 @@
 Reads a given STEP file. Maps the enteties and instaciate the
 corosbonding classes.
 In addition it writes out a graphwiz file with the entity graph.
+
+LazyModel gives access to the instances of big files: only an index of the
+records is built when the file is read, and instances are parsed when they
+are accessed, for example:
+
+    model = LazyModel("assembly.stp")
+    for nauo in model.get_instances("NEXT_ASSEMBLY_USAGE_OCCURRENCE"):
+        print nauo.attributes[3], nauo.attributes[4]
 """
 
 import Part21,sys
@@ -93,17 +101,14 @@ class SimpleParser:
 
     def instaciate(self):
         """Instaciate the python classe from the enteties"""
-        import inspect
-        # load the needed schema module
-        if self._p21loader.get_schema_name() == 'config_control_design':
-            import config_control_design
-            self.schemaModule = config_control_design
-        if self._p21loader.get_schema_name() == 'automotive_design':
-            import automotive_design
-            self.schemaModule = automotive_design
+        import LazySchema
+        # load the needed schema module. Its classes are only defined when
+        # they are first looked up in self.schemaClasses
+        if self._p21loader.get_schema_name() in ['config_control_design','automotive_design']:
+            self.schemaModule = LazySchema.load_schema(self._p21loader.get_schema_name())
 
         if self.schemaModule:
-            self.schemaClasses = dict(inspect.getmembers(self.schemaModule))
+            self.schemaClasses = vars(self.schemaModule)
 
         for i in self._p21loader._instances_definition.keys():
             #print i
@@ -111,61 +116,186 @@ class SimpleParser:
                 self._create_entity_instance(i)
 
     def _create_entity_instance(self, instance_id):
-        if self._p21loader._instances_definition.has_key(instance_id):
-            instance_definition = self._p21loader._instances_definition[instance_id]
-            #print "Instance definition to process",instance_definition
+        # the referenced instances are created first. An explicit stack is used
+        # instead of recursion, as reference chains can be very long
+        stack = [instance_id]
+        pending = set()
+        while stack:
+            i = stack[-1]
+            if self.instanceMape.has_key(i):
+                stack.pop()
+                continue
+            if not self._p21loader._instances_definition.has_key(i):
+                print '############################# lost entity: ',i
+                self.instanceMape[i] = int(41) # dummy
+                stack.pop()
+                continue
+            instance_definition = self._p21loader._instances_definition[i]
+            if not i in pending:
+                pending.add(i)
+                missing = [k for k in getReferences(instance_definition[1]) if not (self.instanceMape.has_key(k) or k in pending)]
+                if missing:
+                    stack.extend(missing)
+                    continue
             # first find class name
             class_name = instance_definition[0].lower()
-            #print "Class name:%s"%class_name
-
             if not class_name=='':
                 classDef = self.schemaClasses[class_name]
-                # then attributes
-                #print object_.__doc__
-            instance_attributes = instance_definition[1]
-            self._transformAttributes(instance_attributes)
-            print 'Attribute list after transform: ',instance_attributes
-
-            self.instanceMape[instance_id] = str('dummy#:'+str(instance_id)) # dummy instance to test
-        else:
-            print '############################# lost entity: ',instance_id
-            self.instanceMape[instance_id] = int(41) # dummy
-        #print "instance_attributes:",instance_attributes
-        #a = object_(*instance_attributes)
+            instance_attributes = self._transformAttributes(instance_definition[1])
+            self.instanceMape[i] = str('dummy#:'+str(i)) # dummy instance to test
+            stack.pop()
 
     def _transformAttributes(self,attrList):
-        n = 0
-        for i in attrList:
-            if isinstance(i,list):
-                self._transformAttributes(i)
-            elif  isinstance(i,str):
-                if i == '':
-                    print 'empty string'
-                elif i[0] == '#':
-                    key = int(i[1:])
-                    #print 'Item: ',int(i[1:])
-                    if self.instanceMape.has_key(key):
-                        attrList[n] =  self.instanceMape[key]
-                    else:
-                        self._create_entity_instance(key)
-                        if not self.instanceMape.has_key(key):
-                            raise NameError("Needed instance not instanciated: ",key)
-                        else:
-                            attrList[n] =  self.instanceMape[key]
-                elif i[0] == '$':
-                    #print 'Dollar'
-                    pass
-                elif i[0] == "'":
-                    print 'Dopelstring: ',i[1:-1]
-                else:
-                    print 'String: ',i
+        """returns a copy of the given attributes list where references are
+        replaced by the corresponding instances"""
+        def transform(i):
+            if i and i[0] == '#':
+                key = int(i[1:])
+                if not self.instanceMape.has_key(key):
+                    raise NameError("Needed instance not instanciated: ",key)
+                return self.instanceMape[key]
+            return i
+        return mapAttributes(attrList,transform)
+
+def mapAttributes(attrList,function):
+    """returns a copy of the given nested attributes list where each string
+    attribute is replaced by the result of the given function. Nested lists
+    are processed with an explicit stack instead of recursion. Typed
+    parameters keep their name."""
+    result = []
+    stack = [(attrList,result)]
+    while stack:
+        source,target = stack.pop()
+        for i in source:
+            if isinstance(i,Part21.TypedParameter):
+                l = Part21.TypedParameter(i.name)
+                target.append(l)
+                stack.append((i,l))
+            elif isinstance(i,list):
+                l = []
+                target.append(l)
+                stack.append((i,l))
+            elif isinstance(i,str):
+                target.append(function(i))
             else:
                 raise NameError("Unknown attribute type")
-            n = n+1
+    return result
+
+def getReferences(attrList):
+    """returns the ids of the instances referenced in the given nested attributes list"""
+    refs = []
+    stack = [attrList]
+    while stack:
+        for i in stack.pop():
+            if isinstance(i,list):
+                stack.append(i)
+            elif i and i[0] == '#':
+                refs.append(int(i[1:]))
+    return refs
+
+
+class EntityInstance(object):
+    """ An entity instance of a LazyModel. Its record is parsed when its name
+    or attributes are first accessed. References to other instances are
+    returned as EntityInstance objects, which are themselves not parsed
+    until accessed.
+    """
+    __slots__ = ('_model','id','_definition')
+
+    def __init__(self, model, instance_id):
+        self._model = model
+        self.id = instance_id
+        self._definition = None
+
+    def _get_definition(self):
+        if self._definition is None:
+            name,attributes = self._model._index.get_definition(self.id)
+            model = self._model
+            def transform(i):
+                if i and i[0] == '#':
+                    return model.get_instance(int(i[1:]))
+                return i
+            self._definition = (name,mapAttributes(attributes,transform))
+        return self._definition
+
+    @property
+    def name(self):
+        return self._get_definition()[0]
+
+    @property
+    def attributes(self):
+        return self._get_definition()[1]
+
+    def get_references(self):
+        """returns the instances referenced by this instance"""
+        return [self._model.get_instance(i) for i in getReferences(self._model._index.get_definition(self.id)[1])]
+
+    def __repr__(self):
+        return "#%i=%s"%(self.id,self.name)
+
+
+class LazyModel(object):
+    """ A model of the instances of a Part21 file, materialized on demand.
+
+    Part21.Part21Index stores the position of each record in the file and the
+    ids of the instances of each entity. Instances are parsed the first time
+    they are accessed, and only the instances actually accessed are kept
+    in memory.
+    """
+    def __init__(self, filename):
+        self._index = Part21.Part21Index(filename)
+        self._instances = {}
+
+    def get_schema_name(self):
+        return self._index.get_schema_name()
+
+    def get_number_of_instances(self):
+        return self._index.get_number_of_instances()
+
+    def get_entity_names(self):
+        return self._index.get_entity_names()
+
+    def get_instance(self, instance_id):
+        """returns the instance with the given id, or None if there is none"""
+        if instance_id in self._instances:
+            return self._instances[instance_id]
+        if not self._index.has_id(instance_id):
+            return None
+        instance = EntityInstance(self, instance_id)
+        self._instances[instance_id] = instance
+        return instance
+
+    def get_instances(self, entity_name):
+        """returns all the instances of the given entity name"""
+        return [self.get_instance(i) for i in self._index.get_ids(entity_name)]
+
+    def get_dependencies(self, instance_id, exclude=[]):
+        """returns all the instances referenced directly or indirectly by the
+        given instance. Instances of the entity names given in exclude, such
+        as geometry, are not followed"""
+        exclude = [e.upper() for e in exclude]
+        found = set([instance_id])
+        result = []
+        stack = [instance_id]
+        while stack:
+            name,attributes = self._index.get_definition(stack.pop())
+            for i in getReferences(attributes):
+                if (not i in found) and self._index.has_id(i):
+                    found.add(i)
+                    instance = self.get_instance(i)
+                    if exclude and (instance.name.upper() in exclude):
+                        continue
+                    result.append(instance)
+                    stack.append(i)
+        return result
+
+    def close(self):
+        """closes the underlying file"""
+        self._index.close()
 
 if __name__ == "__main__":
     sys.path.append('..') # path where config_control_design.py is found
-    parser = SimpleReader("Aufspannung.stp") # simple test file
+    parser = SimpleParser("Aufspannung.stp") # simple test file
     #parser.instaciate()
     parser.writeGraphViz('TestGrap.gv')
     #dot.exe -Tsvg -o Test.svg e:\fem-dev\src\Mod\Import\App\SCL\TestGrap-geo.gv
@@ -35,6 +35,28 @@ import BaseType
 RAISE_EXCEPTION_IF_TYPE_DOES_NOT_MATCH = True
 DEBUG = False
 
+# Validation modes:
+# IMMEDIATE : mismatches raise when values are set (default)
+# DEFERRED : mismatches are recorded when values are set, and returned all at
+# once by validate_pending(), for example after a file is parsed
+# DISABLED : mismatches are ignored
+# In all modes, values that do not match are cast to their EXPRESS type by the
+# generated setters
+IMMEDIATE = 'immediate'
+DEFERRED = 'deferred'
+DISABLED = 'disabled'
+VALIDATION_MODE = IMMEDIATE
+
+# validators are built once for each expected type (see get_validator)
+_validators = {}
+# the (instance, expected_type, error message) mismatches recorded in DEFERRED
+# mode, at most MAX_PENDING of them. _dropped counts the others
+MAX_PENDING = 10000
+_pending = []
+_dropped = 0
+# the mismatches already warned about, so each one is only printed once
+_warnings = set()
+
 def cast_python_object_to_aggregate(obj, aggregate):
     """ This function casts a python object to an aggregate type. For instance:
     [1.,2.,3.]-> ARRAY(1,3,REAL)"""
@@ -45,57 +67,160 @@ def cast_python_object_to_aggregate(obj, aggregate):
             aggregate[idx] = obj[idx-aggregate_lower_bound]
     return aggregate
 
+def get_type_key(expected_type):
+    """ Returns the key of the validator of an expected type. Aggregate types are
+    created each time an attribute is set, so they are identified by their class,
+    base type and scope. Other types are identified by themselves.
+    """
+    if isinstance(expected_type, BaseType.Aggregate):
+        return (expected_type.__class__, get_type_key(expected_type._typedef), expected_type._scope)
+    return expected_type
+
+def get_select_domain(select):
+    """ Returns the (types, enumeration ids) allowed by a SELECT, looking into
+    its sub SELECTs and ENUMERATIONs
+    """
+    types = []
+    enum_ids = set()
+    stack = [select]
+    seen = set()
+    while stack:
+        s = stack.pop()
+        if id(s) in seen:
+            continue
+        seen.add(id(s))
+        for allowed_type in s.get_allowed_types():
+            if isinstance(allowed_type,SELECT):
+                stack.append(allowed_type)
+            elif isinstance(allowed_type,ENUMERATION):
+                enum_ids.update(allowed_type.get_enum_ids())
+            elif not allowed_type in types:
+                types.append(allowed_type)
+    return tuple(types), frozenset(enum_ids)
+
+def make_validator(expected_type):
+    """ Returns a (validator, strict) tuple for an expected type. The validator is
+    a function that returns None if an instance matches the expected type, or the
+    error message otherwise. If strict is True, a mismatch always raises a
+    TypeError, otherwise the value can be cast to the expected type.
+    """
+    if (isinstance(expected_type,ENUMERATION)):
+        allowed_ids = expected_type.get_enum_ids()
+        allowed_set = frozenset(allowed_ids)
+        def validator(instance):
+            try:
+                if instance in allowed_set:
+                    return None
+            except TypeError: # unhashable
+                pass
+            return 'Enumeration ids must be %s ( passed %s)'%(allowed_ids,type(instance))
+        return validator, True
+    elif (isinstance(expected_type,SELECT)):
+        allowed_types, allowed_ids = get_select_domain(expected_type)
+        def validator(instance):
+            if isinstance(instance,allowed_types):
+                return None
+            try:
+                if instance in allowed_ids:
+                    return None
+            except TypeError: # unhashable
+                pass
+            return 'Argument type must be %s (you passed %s)'%(list(allowed_types),type(instance))
+        return validator, False
+    elif (isinstance(expected_type, BaseType.Aggregate)):
+        aggregate_class = type(expected_type)
+        base_type = expected_type.get_type()
+        base_key = get_type_key(base_type)
+        def validator(instance):
+            # first check that they are instance of the same class
+            if not (type(instance) == aggregate_class):
+                return 'Expected %s but passed %s'%(aggregate_class,type(instance))
+            # then check that the base type is the same. Aggregates of
+            # aggregates are compared by their keys
+            if not (get_type_key(instance.get_type()) == base_key):
+                return 'Expected %s:%s base type but passed %s:%s base type'%(aggregate_class,base_type,type(instance), instance.get_type())
+            # @TODO: check aggregate bounds, UNIQUE and OPTIONAL properties
+            return None
+        return validator, True
+    else: # simple data types
+        def validator(instance):
+            if isinstance(instance,expected_type):
+                return None
+            return 'Argument type must be %s (you passed %s)'%(expected_type,type(instance))
+        return validator, False
+
+def get_validator(expected_type):
+    """ Returns the (validator, strict) tuple of an expected type (see make_validator),
+    built on first use
+    """
+    try:
+        # classes, SELECTs and ENUMERATIONs are their own key
+        validator = _validators.get(expected_type)
+    except TypeError: # unhashable type, not cached
+        return make_validator(expected_type)
+    if validator is None:
+        key = get_type_key(expected_type)
+        validator = _validators.get(key)
+        if validator is None:
+            validator = _validators[key] = make_validator(expected_type)
+    return validator
+
 def check_type(instance, expected_type):
     """ This function checks wether an object is an instance of a given class
-    returns False or True
+    returns False or True. In DEFERRED and DISABLED modes a mismatch never
+    raises, False is returned so that the value is cast.
     """
-    type_match = False #by default, will be set to True if any match
     if DEBUG:
         print "==="
         print "Instance passed: ",instance
         print "Expected type: ", expected_type
-    # in the case of an enumeration, we have to check if the instance is in the list
-    if (isinstance(expected_type,ENUMERATION)):
-        allowed_ids = expected_type.get_enum_ids()
-        if instance in allowed_ids:
-            type_match = True
-        else:
-            raise TypeError('Enumeration ids must be %s ( passed %s)'%(allowed_ids,type(instance)))
-    elif (isinstance(expected_type,SELECT)):        
-        # we check if the instance is of the type of any of the types that are in the SELECT
-        allowed_types = expected_type.get_allowed_basic_types()
-        for allowed_type in allowed_types:
-            if isinstance(instance,allowed_type):
-                type_match = True
-        if not type_match:
-            if RAISE_EXCEPTION_IF_TYPE_DOES_NOT_MATCH:
-                raise TypeError('Argument type must be %s (you passed %s)'%(allowed_types,type(instance)))
-            else:
-                print "WARNING: expected '%s' but passed a '%s', casting from python value to EXPRESS type"%(allowed_types, type(instance))
-                return False
-    elif (isinstance(expected_type, BaseType.Aggregate)):
-        # first check that they are instance of the same class
-        if not (type(instance) == type(expected_type)):
-            raise TypeError('Expected %s but passed %s'%(type(expected_type),type(instance)))
-        # then check that the base type is the same
-        elif not (instance.get_type() == expected_type.get_type()):
-            #print instance.get_type()
-            #print expected_type.get_type()
-            raise TypeError('Expected %s:%s base type but passed %s:%s base type'%(type(expected_type),expected_type.get_type(),type(instance), instance.get_type()))
-        # check optional and unique attributes
-        #elif not (instance._unique == expected_type._unique):
-        #    raise TypeError('Aggregate expects UNIQUE:%s property but passed UNIQUE:%s'%(expected_type._unique, instance._unique))
-        #elif not (instance._optional == expected_type._optional):
-        #    raise TypeError('Aggregate expects OPTIONAL:%s property but passed OPTIONAL:%s'%(expected_type._optional, instance._optional))
-        # @TODO: check aggregate bounds
-        else:
-            type_match = True
-    else: # simple data types
-        type_match = isinstance(instance,expected_type)
-        if not type_match:
-            if RAISE_EXCEPTION_IF_TYPE_DOES_NOT_MATCH:
-                raise TypeError('Argument type must be %s (you passed %s)'%(expected_type,type(instance)))
-            else:
-                print "WARNING: expected '%s' but passed a '%s', casting from python value to EXPRESS type"%(expected_type, type(instance))
-                return False
-    return True
+    if VALIDATION_MODE == IMMEDIATE:
+        validator, strict = get_validator(expected_type)
+        error = validator(instance)
+    else:
+        strict = False
+        try:
+            error = get_validator(expected_type)[0](instance)
+        except (AssertionError,TypeError), e: # type not resolvable in its scope
+            error = str(e)
+    if error is None:
+        return True
+    if VALIDATION_MODE == DEFERRED:
+        add_pending(instance,expected_type,error)
+        return False
+    elif VALIDATION_MODE == DISABLED:
+        return False
+    if strict or RAISE_EXCEPTION_IF_TYPE_DOES_NOT_MATCH:
+        raise TypeError(error)
+    warning = (get_type_key(expected_type),type(instance))
+    if not warning in _warnings:
+        _warnings.add(warning)
+        print "WARNING: %s, casting from python value to EXPRESS type"%error
+    return False
+
+def add_pending(instance, expected_type, error):
+    global _dropped
+    if len(_pending) < MAX_PENDING:
+        _pending.append((instance,expected_type,error))
+    else:
+        _dropped += 1
+
+def clear_pending():
+    """ Forgets the mismatches recorded in DEFERRED mode. Called each time a
+    file is parsed
+    """
+    global _pending, _dropped
+    _pending = []
+    _dropped = 0
+
+def validate_pending():
+    """ Returns the list of (instance, expected_type, error message) tuples of
+    the values that did not match their type since the last call, in DEFERRED
+    mode, and forgets them. If there were more than MAX_PENDING, a last
+    (None, None, message) tuple tells how many were not kept
+    """
+    errors = _pending
+    if _dropped:
+        errors.append((None,None,'%i more mismatches not recorded'%_dropped))
+    clear_pending()
+    return errors
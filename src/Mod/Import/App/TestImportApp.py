@@ -0,0 +1,255 @@
+# Unit test for the Python readers and writers of the Import module
+
+#***************************************************************************
+#*   This file is part of the FreeCAD CAx development system.              *
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   FreeCAD is distributed in the hope that it will be useful,            *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with FreeCAD; if not, write to the Free Software        *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************/
+
+import FreeCAD, os, re, sys, unittest, StringIO
+
+# the SCL modules import each other by their module name
+sclDir = os.path.join(os.path.dirname(os.path.abspath(__file__)),"SCL")
+if not sclDir in sys.path:
+    sys.path.append(sclDir)
+
+import Part21, Utils
+
+def getStepFiles():
+    "returns the sample STEP files of the SCL folder and of data/tests/Step"
+    files = [os.path.join(sclDir,f) for f in ["gasket1.p21","Aufspannung.stp","Product1.stp"]]
+    testDir = os.path.join(FreeCAD.getHomePath(),"data","tests","Step")
+    if os.path.isdir(testDir):
+        files += [os.path.join(testDir,f) for f in sorted(os.listdir(testDir))]
+    return [f for f in files if os.path.isfile(f)]
+
+def getRecords(fileName):
+    "returns the cleaned records of the instances of a Part21 file"
+    f = open(fileName,"rb")
+    records = [r for r in Part21.iter_records(f) if r.startswith("#")]
+    f.close()
+    return records
+
+def normalizeBaseline(attributes):
+    '''returns the attributes returned by Utils.process_nested_parent_str
+    without the surrounding whitespace and the trailing empty attribute that
+    it adds after a list'''
+    result = []
+    for a in attributes:
+        if isinstance(a,list):
+            result.append(normalizeBaseline(a))
+        else:
+            result.append(a.strip())
+    if len(result) > 1 and result[-1] == "" and isinstance(result[-2],list):
+        result.pop()
+    return result
+
+class Part21ParserTest(unittest.TestCase):
+
+    def testBaseline(self):
+        FreeCAD.Console.PrintLog ('Checking Part21 attributes against the previous parser...\n')
+        count = 0
+        for fileName in getStepFiles():
+            for record in getRecords(fileName):
+                body = record[record.find("=")+1:].strip()
+                attributes = body[body.find("(")+1:body.rfind(")")]
+                if "'" in attributes:
+                    # the previous parser split strings containing commas
+                    strings = Part21.STRING_OR_COMMENT_RE.findall(attributes)
+                    if [s for s in strings if ("," in s) or ("(" in s) or (")" in s)]:
+                        continue
+                if re.search(r"\)[^,]",attributes):
+                    # it also skipped the character following a closing
+                    # parenthesis, which is only right for a comma
+                    continue
+                reference = normalizeBaseline(Utils.process_nested_parent_str(attributes)[0])
+                self.assertEqual(Part21.parse_attributes(attributes),reference,
+                                 "%s: %s" % (os.path.basename(fileName),record))
+                count += 1
+        self.failUnless(count > 1000,"Too few Part21 records compared")
+
+    def testComplexInstance(self):
+        FreeCAD.Console.PrintLog ('Checking Part21 complex instances and typed parameters...\n')
+        instances = {}
+        for instance in Part21.iter_instances(os.path.join(sclDir,"gasket1.p21")):
+            instances[instance[0]] = instance[1:]
+        name,attributes = instances[9040]
+        self.assertEqual(name,"")
+        self.assertEqual([a.name for a in attributes],["LENGTH_UNIT","NAMED_UNIT","SI_UNIT"])
+        self.assertEqual(attributes,[[""],["*"],[".MILLI.",".METRE."]])
+        name,attributes = instances[9043]
+        self.assertEqual(name,"UNCERTAINTY_MEASURE_WITH_UNIT")
+        self.assertEqual(attributes,[Part21.TypedParameter("LENGTH_MEASURE",["0.000001"]),"#9040"])
+        self.assertEqual(attributes[0].name,"LENGTH_MEASURE")
+        name,attributes = instances[9230]
+        self.assertEqual([a.name for a in attributes],["GEOMETRIC_REPRESENTATION_CONTEXT","GLOBAL_UNCERTAINTY_ASSIGNED_CONTEXT",
+                                                       "GLOBAL_UNIT_ASSIGNED_CONTEXT","REPRESENTATION_CONTEXT"])
+        self.assertEqual(attributes[2],[["#9040","#9041","#9042"]])
+
+    def testStringsAndComments(self):
+        FreeCAD.Console.PrintLog ('Checking Part21 strings and comments...\n')
+        data = "DATA;\n#1=A('x /* y */ ;z',/* a;comment */ 'it''s',\n(1.,2.));\n/* #2=B(); */#3=C('');\nENDSEC;\n"
+        for blockSize in [1,7,Part21.BLOCK_SIZE]:
+            records = list(Part21.iter_records(StringIO.StringIO(data),blockSize))
+            self.assertEqual(records,["DATA","#1=A('x /* y */ ;z', 'it''s',(1.,2.))","#3=C('')","ENDSEC"])
+        self.assertEqual(Part21.parse_record(records[1]),(1,"A",["'x /* y */ ;z'","'it''s'",["1.","2."]]))
+
+    def testEscapedQuotes(self):
+        FreeCAD.Console.PrintLog ('Checking Part21 strings with many escaped quotes...\n')
+        # the first blocks end in the middle of a string holding a semicolon
+        text = "'" + "''"*40 + ";" + "''"*40 + "'"
+        data = "#1=A(%s);\n#2=B();\n" % text
+        for blockSize in [16,64,Part21.BLOCK_SIZE]:
+            records = list(Part21.iter_records(StringIO.StringIO(data),blockSize))
+            self.assertEqual(records,["#1=A(%s)" % text,"#2=B()"])
+
+class LazyModelTest(unittest.TestCase):
+
+    def setUp(self):
+        import SimpleReader
+        self.fileName = os.path.join(sclDir,"Product1.stp")
+        self.model = SimpleReader.LazyModel(self.fileName)
+
+    def testDefinitions(self):
+        FreeCAD.Console.PrintLog ('Checking the lazy Part21 model against the full parser...\n')
+        parser = Part21.Part21Parser(self.fileName)
+        definitions = parser._instances_definition
+        self.assertEqual(self.model.get_number_of_instances(),len(definitions))
+        self.assertEqual(self.model.get_schema_name(),parser.get_schema_name())
+        for i in definitions.keys():
+            self.assertEqual(self.model._index.get_definition(i),definitions[i])
+
+    def testInstances(self):
+        FreeCAD.Console.PrintLog ('Checking the instances of the lazy Part21 model...\n')
+        nauos = self.model.get_instances("next_assembly_usage_occurrence")
+        self.assertEqual(sorted([n.id for n in nauos]),[151,164,179])
+        nauo = self.model.get_instance(164)
+        self.assertEqual(nauo.name,"NEXT_ASSEMBLY_USAGE_OCCURRENCE")
+        self.assertEqual(nauo.attributes[0],"'Product2.1'")
+        # references are returned as instances, parsed on demand
+        self.failUnless(nauo.attributes[3] is self.model.get_instance(17))
+        self.assertEqual(nauo.attributes[4].name,"PRODUCT_DEFINITION")
+        self.assertEqual([i.id for i in nauo.get_references()],[17,58])
+        self.assertEqual(self.model.get_instance(123456),None)
+
+    def testDependencies(self):
+        FreeCAD.Console.PrintLog ('Checking the dependencies of the lazy Part21 model...\n')
+        dependencies = set([i.id for i in self.model.get_dependencies(164)])
+        self.failUnless(set([17,58,6,57,3]) <= dependencies)
+        # excluded entities are neither returned nor followed
+        excluded = self.model.get_dependencies(164,exclude=["PRODUCT_DEFINITION"])
+        self.assertEqual(excluded,[])
+
+    def tearDown(self):
+        self.model.close()
+
+class TypeCheckerTest(unittest.TestCase):
+
+    def setUp(self):
+        # the schema modules use this type checker
+        import SCL.TypeChecker
+        self.checker = SCL.TypeChecker
+        self.mode = self.checker.VALIDATION_MODE
+
+    def testModes(self):
+        FreeCAD.Console.PrintLog ('Checking the validation modes of the SCL type checker...\n')
+        import config_control_design
+        self.checker.VALIDATION_MODE = self.checker.IMMEDIATE
+        self.assertRaises(TypeError,config_control_design.application_context,"mechanical")
+        for mode in [self.checker.DEFERRED,self.checker.DISABLED]:
+            self.checker.VALIDATION_MODE = mode
+            self.checker.clear_pending()
+            context = config_control_design.application_context("mechanical")
+            # values are still cast to their EXPRESS type
+            self.failUnless(isinstance(context.application,config_control_design.text))
+            errors = self.checker.validate_pending()
+            self.assertEqual(len(errors),int(mode == self.checker.DEFERRED))
+
+    def testPendingBound(self):
+        FreeCAD.Console.PrintLog ('Checking the bound of the SCL type mismatches...\n')
+        import config_control_design
+        self.checker.VALIDATION_MODE = self.checker.DEFERRED
+        maxPending = self.checker.MAX_PENDING
+        self.checker.MAX_PENDING = 5
+        try:
+            for i in range(8):
+                config_control_design.application_context("mechanical")
+            errors = self.checker.validate_pending()
+            self.assertEqual(len(errors),6)
+            self.assertEqual(errors[-1][0],None)
+            config_control_design.application_context("mechanical")
+            # parsing a file forgets the mismatches of the previous one
+            Part21.Part21Index(os.path.join(sclDir,"Product1.stp")).close()
+            self.assertEqual(self.checker.validate_pending(),[])
+        finally:
+            self.checker.MAX_PENDING = maxPending
+
+    def tearDown(self):
+        self.checker.VALIDATION_MODE = self.mode
+        self.checker.clear_pending()
+
+def normalizeRecord(record):
+    "returns a record without the whitespace outside its strings"
+    return re.sub(r"('(?:[^']|'')*')|\s+",lambda m: m.group(1) or "",record)
+
+def getNormalizedRecords(fileName):
+    "returns the normalized records of the instances of a Part21 file, by id"
+    records = {}
+    for record in getRecords(fileName):
+        records[int(record[1:record.find("=")])] = normalizeRecord(record)
+    return records
+
+class Part21WriterTest(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        self.tempFile = os.path.join(tempfile.gettempdir(),"TestImportApp.stp")
+
+    def testRoundTrip(self):
+        FreeCAD.Console.PrintLog ('Checking that Part21 files are written back unchanged...\n')
+        for fileName in getStepFiles():
+            parser = Part21.Part21Parser(fileName)
+            writer = Part21.Part21Writer(self.tempFile,parser.get_schema_name())
+            writer.write_instances(parser._instances_definition)
+            writer.close()
+            source = getNormalizedRecords(fileName)
+            written = getNormalizedRecords(self.tempFile)
+            self.assertEqual(sorted(written.keys()),sorted(source.keys()))
+            for i in source.keys():
+                self.assertEqual(written[i],source[i],os.path.basename(fileName))
+            self.assertEqual(Part21.Part21Parser(self.tempFile)._instances_definition,parser._instances_definition)
+
+    def testPatch(self):
+        FreeCAD.Console.PrintLog ('Checking the patching of Part21 files...\n')
+        fileName = os.path.join(sclDir,"gasket1.p21")
+        changes = {9043:("UNCERTAINTY_MEASURE_WITH_UNIT",[Part21.TypedParameter("LENGTH_MEASURE",["1.E-05"]),"#9040"]),
+                   9100:None,
+                   99999:("",[Part21.TypedParameter("NAMED_UNIT",["*"]),Part21.TypedParameter("SI_UNIT",["$",".RADIAN."])])}
+        self.assertEqual(Part21.patch_file(fileName,self.tempFile,changes),3)
+        source = getNormalizedRecords(fileName)
+        patched = getNormalizedRecords(self.tempFile)
+        self.assertEqual(patched[9043],"#9043=UNCERTAINTY_MEASURE_WITH_UNIT(LENGTH_MEASURE(1.E-05),#9040)")
+        self.assertEqual(patched[99999],"#99999=(NAMED_UNIT(*)SI_UNIT($,.RADIAN.))")
+        self.failIf(9100 in patched)
+        for i in source.keys():
+            if not i in changes:
+                self.assertEqual(patched[i],source[i])
+
+    def tearDown(self):
+        if os.path.exists(self.tempFile):
+            os.remove(self.tempFile)
@@ -29,6 +29,8 @@ This Script includes various pyhton helper functions that are shared across
 the module
 '''
 
+import re
+
 def translate(context,text):
     "convenience function for Qt translator"
     from PySide import QtGui
@@ -124,53 +126,282 @@ tempfilenamegen=newtempfilename()
 
 def callopenscad(inputfilename,outputfilename=None,outputext='csg',keepname=False):
     '''call the open scad binary
+    results found in the cache are copied instead of calling OpenSCAD again
     returns the filename of the result (or None),
     please delete the file afterwards'''
-    import FreeCAD,os,subprocess,tempfile,time
-    def check_output2(*args,**kwargs):
-        kwargs.update({'stdout':subprocess.PIPE,'stderr':subprocess.PIPE})
-        p=subprocess.Popen(*args,**kwargs)
+    return callopenscadmany([inputfilename],outputext,keepname,\
+        [outputfilename])[0]
+
+def callopenscadmany(inputfilenames,outputext='csg',keepname=False,\
+        outputfilenames=None):
+    '''call the open scad binary on each of the given files, running up to
+    'openscadprocesses' of them at the same time (the number of CPUs by
+    default). Results found in the cache are copied instead of calling
+    OpenSCAD again.
+    returns the list of the filenames of the results,
+    please delete the files afterwards'''
+    import FreeCAD,os,tempfile
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD")
+    osfilename = params.GetString('openscadexecutable')
+    if not (osfilename and os.path.isfile(osfilename)):
+        raise OpenSCADError('OpenSCAD executeable unavailable')
+    outputfilenames = list(outputfilenames or [None]*len(inputfilenames))
+    dir1=tempfile.gettempdir()
+    for i,inputfilename in enumerate(inputfilenames):
+        if not outputfilenames[i]:
+            if keepname:
+                outputfilenames[i]=os.path.join(dir1,'%s.%s' % (os.path.split(\
+                    inputfilename)[1].rsplit('.',1)[0],outputext))
+            else:
+                outputfilenames[i]=os.path.join(dir1,'%s.%s' % \
+                    (tempfilenamegen.next(),outputext))
+    cachedir = getcachedir()
+    jobs = []
+    for inputfilename,outputfilename in zip(inputfilenames,outputfilenames):
+        cachefilename = None
+        if cachedir:
+            digest = getcachedigest(osfilename,inputfilename,outputext)
+            if digest:
+                cachefilename = os.path.join(cachedir,'%s.%s' % (digest,outputext))
+                if getcachedfile(cachefilename,outputfilename):
+                    continue
+            else:
+                cachestats['uncacheable'] += 1
+        jobs.append(([osfilename,'-o',outputfilename,inputfilename],\
+            outputfilename,cachefilename))
+    runopenscadjobs(jobs,params.GetInt('openscadprocesses',0) or cpucount())
+    return outputfilenames
+
+def cpucount():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError,NotImplementedError):
+        return 1
+
+def runopenscadjobs(jobs,maxprocesses=1):
+    '''runs the given (arguments,outputfilename,cachefilename) jobs, at most
+    maxprocesses at the same time, and stores their results in the cache.
+    Raises an OpenSCADError for the first job that failed, once they are
+    all finished'''
+    import FreeCAD,subprocess
+    running = []
+    errors = []
+    jobs = list(jobs)
+    while jobs or running:
+        while jobs and len(running) < maxprocesses:
+            args,outputfilename,cachefilename = jobs.pop(0)
+            p=subprocess.Popen(args,stdout=subprocess.PIPE,\
+                stderr=subprocess.PIPE)
+            running.append((p,outputfilename,cachefilename))
+        # the processes write little output, the others do not block while
+        # the first one is read
+        p,outputfilename,cachefilename = running.pop(0)
         stdoutd,stderrd = p.communicate()
         if p.returncode != 0:
-            raise OpenSCADError('%s %s\n' % (stdoutd.strip(),stderrd.strip()))
-            #raise Exception,'stdout %s\n stderr%s' %(stdoutd,stderrd)
+            errors.append('%s %s\n' % (stdoutd.strip(),stderrd.strip()))
+            continue
         if stderrd.strip():
             FreeCAD.Console.PrintWarning(stderrd+u'\n')
         if stdoutd.strip():
             FreeCAD.Console.PrintMessage(stdoutd+u'\n')
-            return stdoutd
+        if cachefilename:
+            storecachedfile(outputfilename,cachefilename)
+    if errors:
+        raise OpenSCADError(errors[0])
+
+# The results of OpenSCAD are cached by content: the key of a call is a digest
+# of the OpenSCAD binary, of the output format, of the script, and of the
+# files it includes or imports. CSG output repeats the names of the imported
+# files, so they are part of the key. Mesh and drawing output only holds
+# geometry, imported files are then identified by their content alone and the
+# temporary mesh files written by meshoptempfile give the same key for the
+# same meshes.
+
+cachestats = {'hits':0,'misses':0,'stored':0,'uncacheable':0}
+
+# include <file> and use <file>, or a quoted string
+referencere = re.compile(r'\b(?:include|use)\s*<([^>]*)>|"((?:[^"\\]|\\.)*)"')
+# extensions of the files OpenSCAD can import
+importexts = ('.stl','.off','.obj','.amf','.3mf','.dxf','.svg','.dat',\
+    '.png','.csg','.scad')
+# output formats that do not refer to the imported files
+geometryexts = ('stl','off','amf','3mf','dxf','svg')
+
+def getcachedir():
+    '''returns the folder of the cache of OpenSCAD results, or None if the
+    cache is disabled'''
+    import FreeCAD,os
+    params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD")
+    if not params.GetBool('useOpenSCADCache',True):
+        return None
+    dir1 = params.GetString('openscadcachedir') or \
+        os.path.join(FreeCAD.ConfigGet("UserAppData"),'OpenSCADCache')
+    if not os.path.isdir(dir1):
+        try:
+            os.makedirs(dir1)
+        except OSError:
+            return None
+    return dir1
+
+def getfiledigest(filename):
+    import hashlib
+    h = hashlib.sha1()
+    f = open(filename,'rb')
+    for block in iter(lambda: f.read(1<<16),''):
+        h.update(block)
+    f.close()
+    return h.hexdigest()
+
+def getscriptdigest(filename,seen=None,byname=True):
+    '''returns a digest of the given script, in which included and imported
+    files are replaced by the digest of their content, and by their path if
+    byname is True, or None if one of them can not be found'''
+    import hashlib,os
+    if seen is None:
+        seen = set()
+    filename = os.path.abspath(filename)
+    if filename in seen: # included twice
+        return ''
+    seen.add(filename)
+    dir1 = os.path.dirname(filename)
+    f = open(filename,'rb')
+    script = f.read()
+    f.close()
+    missing = []
+    def replace(match):
+        name = match.group(1)
+        if name is not None: # include or use
+            path = os.path.join(dir1,name)
+            digest = None
+            if os.path.isfile(path):
+                digest = getscriptdigest(path,seen,byname)
+            if digest is None:
+                # not relative to the script, it could be in a library folder
+                missing.append(name)
+                return match.group(0)
+            return '<%s>' % digest
+        name = match.group(2)
+        path = os.path.join(dir1,name)
+        if name and os.path.isfile(path):
+            if byname:
+                return '"%s %s"' % (os.path.abspath(path),getfiledigest(path))
+            return '"%s"' % getfiledigest(path)
+        if os.path.splitext(name)[1].lower() in importexts:
+            missing.append(name)
+        return match.group(0)
+    script = referencere.sub(replace,script)
+    if missing:
+        return None
+    return hashlib.sha1(script).hexdigest()
+
+def getcachedigest(osfilename,inputfilename,outputext):
+    '''returns the key of the result of calling the given OpenSCAD binary on
+    the given file, or None if it can not be cached'''
+    import hashlib,os
+    digest = getscriptdigest(inputfilename,\
+        byname=outputext.lower() not in geometryexts)
+    if digest is None:
+        return None
+    stat = os.stat(osfilename)
+    return hashlib.sha1('%s %d %d %s %s' % (os.path.abspath(osfilename),\
+        int(stat.st_mtime),stat.st_size,outputext,digest)).hexdigest()
+
+def getcachedfile(cachefilename,outputfilename):
+    '''copies the cached result to outputfilename, returns False if there
+    is none'''
+    import os,shutil
+    try:
+        shutil.copyfile(cachefilename,outputfilename)
+    except (IOError,OSError):
+        cachestats['misses'] += 1
+        return False
+    try:
+        os.utime(cachefilename,None) # the least recently used are pruned
+    except OSError:
+        pass
+    cachestats['hits'] += 1
+    return True
 
-    osfilename = FreeCAD.ParamGet(\
+def storecachedfile(outputfilename,cachefilename):
+    import FreeCAD,os,shutil
+    tmpfilename = '%s.%s' % (cachefilename,tempfilenamegen.next())
+    try:
+        shutil.copyfile(outputfilename,tmpfilename)
+        # another FreeCAD could store the same result at the same time
+        if os.path.exists(cachefilename):
+            os.unlink(tmpfilename)
+        else:
+            os.rename(tmpfilename,cachefilename)
+    except (IOError,OSError):
+        return
+    cachestats['stored'] += 1
+    prunecache(os.path.dirname(cachefilename),FreeCAD.ParamGet(\
         "User parameter:BaseApp/Preferences/Mod/OpenSCAD").\
-        GetString('openscadexecutable')
-    if osfilename and os.path.isfile(osfilename):
-        if not outputfilename:
-            dir1=tempfile.gettempdir()
-            if keepname:
-                outputfilename=os.path.join(dir1,'%s.%s' % (os.path.split(\
-                    inputfilename)[1].rsplit('.',1)[0],outputext))
-            else:
-                outputfilename=os.path.join(dir1,'%s.%s' % \
-                    (tempfilenamegen.next(),outputext))
-        check_output2([osfilename,'-o',outputfilename, inputfilename])
-        return outputfilename
-    else:
-        raise OpenSCADError('OpenSCAD executeable unavailable')
+        GetInt('openscadcachesize',500))
+
+def prunecache(cachedir,maxentries):
+    "removes the least recently used results above maxentries"
+    import os
+    entries = []
+    for name in os.listdir(cachedir):
+        path = os.path.join(cachedir,name)
+        try:
+            entries.append((os.stat(path).st_mtime,path))
+        except OSError:
+            pass
+    entries.sort()
+    for mtime,path in entries[:max(0,len(entries)-maxentries)]:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+def getcachestats():
+    '''returns the numbers of cache hits, misses, stored and uncacheable
+    calls of this session, and the number and size of the cached results'''
+    import os
+    stats = dict(cachestats)
+    stats['entries'] = 0
+    stats['size'] = 0
+    cachedir = getcachedir()
+    if cachedir:
+        for name in os.listdir(cachedir):
+            stats['entries'] += 1
+            stats['size'] += os.path.getsize(os.path.join(cachedir,name))
+    return stats
+
+def clearcache():
+    "removes all the cached OpenSCAD results"
+    cachedir = getcachedir()
+    if cachedir:
+        prunecache(cachedir,0)
 
 def callopenscadstring(scadstr,outputext='csg'):
     '''create a tempfile and call the open scad binary
     returns the filename of the result (or None),
     please delete the file afterwards'''
-    import os,tempfile,time
+    return callopenscadstrings([scadstr],outputext)[0]
+
+def callopenscadstrings(scadstrs,outputext='csg'):
+    '''create a tempfile for each of the given scripts and call the open scad
+    binary on them, see callopenscadmany
+    returns the list of the filenames of the results,
+    please delete the files afterwards'''
+    import os,tempfile
     dir1=tempfile.gettempdir()
-    inputfilename=os.path.join(dir1,'%s.scad' % tempfilenamegen.next())
-    inputfile = open(inputfilename,'w')
-    inputfile.write(scadstr)
-    inputfile.close()
-    outputfilename = callopenscad(inputfilename,outputext=outputext,\
-        keepname=True)
-    os.unlink(inputfilename)
-    return outputfilename
+    inputfilenames = []
+    for scadstr in scadstrs:
+        inputfilename=os.path.join(dir1,'%s.scad' % tempfilenamegen.next())
+        inputfile = open(inputfilename,'w')
+        inputfile.write(scadstr)
+        inputfile.close()
+        inputfilenames.append(inputfilename)
+    try:
+        return callopenscadmany(inputfilenames,outputext,keepname=True)
+    finally:
+        for inputfilename in inputfilenames:
+            os.unlink(inputfilename)
 
 def reverseimporttypes():
     '''allows to search for supported filetypes by module'''
@@ -388,15 +619,22 @@ def roundrotation(rot,maxangulardistance=1e-5):
 
 def callopenscadmeshstring(scadstr):
     """Call OpenSCAD and return the result as a Mesh"""
+    return callopenscadmeshstrings([scadstr])[0]
+
+def callopenscadmeshstrings(scadstrs):
+    """Call OpenSCAD on each of the given scripts, at the same time, and
+    return the results as a list of Meshes"""
     import Mesh,os
-    tmpfilename=callopenscadstring(scadstr,'stl')
-    newmesh=Mesh.Mesh()
-    newmesh.read(tmpfilename)
-    try:
-        os.unlink(tmpfilename)
-    except OSError:
-        pass
-    return newmesh
+    meshes = []
+    for tmpfilename in callopenscadstrings(scadstrs,'stl'):
+        newmesh=Mesh.Mesh()
+        newmesh.read(tmpfilename)
+        try:
+            os.unlink(tmpfilename)
+        except OSError:
+            pass
+        meshes.append(newmesh)
+    return meshes
 
 def meshopinline(opname,iterable1):
     """uses OpenSCAD to combine meshes
@@ -414,24 +652,38 @@ def meshoptempfile(opname,iterable1):
     FreeCAD Mesh objects
     uses stl files to supply the mesh data
     """
+    return meshoptempfiles([(opname,iterable1)])[0]
+
+def meshoptempfiles(jobs):
+    """uses OpenSCAD to combine meshes, see meshoptempfile
+    takes a list of (name of the CGAL operation, iterable of FreeCAD Mesh
+    objects) and returns the list of the resulting meshes. The OpenSCAD
+    calls run at the same time
+    """
     import os,tempfile
     dir1=tempfile.gettempdir()
     filenames = []
-    for mesh in iterable1:
-        outputfilename=os.path.join(dir1,'%s.stl' % tempfilenamegen.next())
-        mesh.write(outputfilename)
-        filenames.append(outputfilename)
-    #absolute path causes error. We rely that the scad file will be in the dame tmpdir
-    meshimports = ' '.join("import(file = \"%s\");" % \
-        #filename \
-        os.path.split(filename)[1] for filename in filenames)
-    result = callopenscadmeshstring('%s(){%s}' % (opname,meshimports))
-    for filename in filenames:
-        try:
-            os.unlink(filename)
-        except OSError:
-            pass
-    return result
+    scadstrs = []
+    for opname,iterable1 in jobs:
+        jobfilenames = []
+        for mesh in iterable1:
+            outputfilename=os.path.join(dir1,'%s.stl' % tempfilenamegen.next())
+            mesh.write(outputfilename)
+            jobfilenames.append(outputfilename)
+        filenames.extend(jobfilenames)
+        #absolute path causes error. We rely that the scad file will be in the dame tmpdir
+        meshimports = ' '.join("import(file = \"%s\");" % \
+            #filename \
+            os.path.split(filename)[1] for filename in jobfilenames)
+        scadstrs.append('%s(){%s}' % (opname,meshimports))
+    try:
+        return callopenscadmeshstrings(scadstrs)
+    finally:
+        for filename in filenames:
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
 
 def meshoponobjs(opname,inobjs):
     """
@@ -504,27 +756,41 @@ def process2D_ObjectsViaOpenSCAD(ObjList,Operation,doc=None):
     return(obj)
 
 def process3D_ObjectsViaOpenSCADShape(ObjList,Operation,maxmeshpoints=None):
+    return process3D_ShapesViaOpenSCAD([(Operation,[obj.Shape for obj in \
+        ObjList])],maxmeshpoints)[0]
+
+def process3D_ShapesViaOpenSCAD(jobs,maxmeshpoints=None):
+    '''takes a list of (operation, list of shapes) and returns the list of
+    the resulting solids. The OpenSCAD calls run at the same time. The result
+    of a job is None if one of its meshes has too many points'''
     import FreeCAD,Mesh,Part
     params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD")
-    if False: # disabled due to issue 1292
-        import MeshPart
-        meshes = [MeshPart.meshFromShape(obj.Shape,params.GetFloat(\
-                'meshmaxlength',1.0), params.GetFloat('meshmaxarea',0.0),\
-                 params.GetFloat('meshlocallen',0.0),\
-                 params.GetFloat('meshdeflection',0.0)) for obj in ObjList]
-    else:
-        meshes = [Mesh.Mesh(obj.Shape.tessellate(params.GetFloat(\
-                            'meshmaxlength',1.0))) for obj in ObjList]
-    if max(mesh.CountPoints for mesh in meshes) < \
-            (maxmeshpoints or params.GetInt('tempmeshmaxpoints',5000)):
-        stlmesh = meshoptempfile(Operation,meshes)
+    maxmeshpoints = maxmeshpoints or params.GetInt('tempmeshmaxpoints',5000)
+    results = [None]*len(jobs)
+    meshjobs = [] # (index, operation, meshes)
+    for i,(Operation,shapes) in enumerate(jobs):
+        if False: # disabled due to issue 1292
+            import MeshPart
+            meshes = [MeshPart.meshFromShape(shape,params.GetFloat(\
+                    'meshmaxlength',1.0), params.GetFloat('meshmaxarea',0.0),\
+                     params.GetFloat('meshlocallen',0.0),\
+                     params.GetFloat('meshdeflection',0.0)) for shape in shapes]
+        else:
+            meshes = [Mesh.Mesh(shape.tessellate(params.GetFloat(\
+                                'meshmaxlength',1.0))) for shape in shapes]
+        if max(mesh.CountPoints for mesh in meshes) < maxmeshpoints:
+            meshjobs.append((i,Operation,meshes))
+    stlmeshes = meshoptempfiles([(Operation,meshes) for i,Operation,meshes \
+        in meshjobs])
+    for (i,Operation,meshes),stlmesh in zip(meshjobs,stlmeshes):
         sh=Part.Shape()
         sh.makeShapeFromMesh(stlmesh.Topology,0.1)
         solid = Part.Solid(sh)
         solid=solid.removeSplitter()
         if solid.Volume < 0:
            solid.complement()
-        return solid
+        results[i] = solid
+    return results
 
 def process3D_ObjectsViaOpenSCAD(doc,ObjList,Operation):
     solid = process3D_ObjectsViaOpenSCADShape(ObjList,Operation)
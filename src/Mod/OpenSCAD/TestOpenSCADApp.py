@@ -0,0 +1,247 @@
+#***************************************************************************
+#*                                                                         *
+#*   This program is free software; you can redistribute it and/or modify  *
+#*   it under the terms of the GNU Lesser General Public License (LGPL)    *
+#*   as published by the Free Software Foundation; either version 2 of     *
+#*   the License, or (at your option) any later version.                   *
+#*   for detail see the LICENCE text file.                                 *
+#*                                                                         *
+#*   This program is distributed in the hope that it will be useful,       *
+#*   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+#*   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+#*   GNU Library General Public License for more details.                  *
+#*                                                                         *
+#*   You should have received a copy of the GNU Library General Public     *
+#*   License along with this program; if not, write to the Free Software   *
+#*   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+#*   USA                                                                   *
+#*                                                                         *
+#***************************************************************************
+
+# Unit test for the OpenSCAD module
+
+import FreeCAD, os, shutil, sys, tempfile, unittest
+
+csgData = '''group() {
+	multmatrix([[1, 0, 0, 10], [0, 1, 0, -2.5e-1], [0, 0, 1, 0],
+	            [0, 0, 0, 1]]) {
+		polyhedron(points = [[0, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1]], faces = [[0, 1, 2], [0, 3, 1], [1, 3, 2], [0, 2, 3]], convexity = 1);
+	}
+	multmatrix([[0, -1, 0, 0], [1, 0, 0, 0], [0, 0, 1, 5], [0, 0, 0, 1]]) {
+		cube(size = [1, 2, 3], center = false);
+	}
+	polygon(points = [[0, 0], [2, 0], [0, 2]], paths = undef, convexity = 1);
+	polygon(points = [[0, 0], [1, 0], [1, 1], [0, 1]], paths = [[0, 1, 2, 3]], convexity = 1);
+}
+'''
+
+class CSGLexerTest(unittest.TestCase):
+
+    def getTokens(self,data):
+        import tokrules, ply.lex as lex
+        lexer = tokrules.VectorListLexer(lex.lex(module=tokrules))
+        lexer.input(data)
+        return [(t.type,t.value,t.lineno) for t in iter(lexer.token,None)]
+
+    def testVectorList(self):
+        FreeCAD.Console.PrintLog ('Checking the lexing of number lists...\n')
+        tokens = self.getTokens('multmatrix([[1, 0, 0, 10],\n [0, 1, 0, -2.5e-3], [0, 0, 1, .5], [0, 0, 0, 1]]) {\n}')
+        self.assertEqual([t[0] for t in tokens],['multmatrix','LPAREN','VECTORLIST','RPAREN','OBRACE','EBRACE'])
+        self.assertEqual(tokens[2][1],[['1','0','0','10'],['0','1','0','-2.5e-3'],['0','0','1','.5'],['0','0','0','1']])
+        # the lines of a number list are counted
+        self.assertEqual(tokens[-1][2],3)
+
+    def testOtherLists(self):
+        FreeCAD.Console.PrintLog ('Checking the lexing of other lists...\n')
+        # a single list of numbers is left to the parser
+        tokens = self.getTokens('size = [1, 2, 3]')
+        self.assertEqual([t[0] for t in tokens],['ID','EQ','OSQUARE','NUMBER','COMMA','NUMBER','COMMA','NUMBER','ESQUARE'])
+        # as are lists holding anything but numbers
+        tokens = self.getTokens('[[1, a], [2, 3]]')
+        self.failIf('VECTORLIST' in [t[0] for t in tokens])
+        self.assertEqual(tokens[0][0],'OSQUARE')
+
+class CSGImportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.docs = []
+        self.fileName = os.path.join(tempfile.gettempdir(),"TestOpenSCADApp.csg")
+        f = open(self.fileName,"w")
+        f.write(csgData)
+        f.close()
+
+    def importCSG(self,lexer=None,twoPhase=False):
+        "imports the test file into a new document and returns its objects"
+        import importCSG
+        doc = FreeCAD.newDocument("OpenSCADTest")
+        self.docs.append(doc.Name)
+        defaultLexer = importCSG.lexer
+        params = importCSG.params
+        twoPhaseDefault = params.GetBool('useTwoPhaseImport',False)
+        try:
+            importCSG.getParser()
+            if lexer:
+                importCSG.lexer = lexer
+            params.SetBool('useTwoPhaseImport',twoPhase)
+            importCSG.insert(self.fileName,doc.Name)
+        finally:
+            importCSG.lexer = defaultLexer
+            params.SetBool('useTwoPhaseImport',twoPhaseDefault)
+        return doc.Objects
+
+    def getSignature(self,objs):
+        "returns what the imported objects should have in common"
+        result = []
+        for o in objs:
+            shape = o.Shape
+            result.append((o.TypeId,round(shape.Volume,6),round(shape.Area,6),len(shape.Solids),
+                           tuple([round(v,6) for v in o.Placement.toMatrix().A])))
+        return result
+
+    def testImport(self):
+        FreeCAD.Console.PrintLog ('Checking the import of CSG files...\n')
+        objs = self.importCSG()
+        polyhedron = [o for o in objs if o.Name.startswith("polyhedron")][0]
+        self.assertAlmostEqual(abs(polyhedron.Shape.Volume),1.0/6)
+        self.failUnless(polyhedron.Placement.Base.isEqual(FreeCAD.Vector(10,-0.25,0),1e-9))
+        cube = [o for o in objs if o.TypeId == "Part::Box"][0]
+        self.assertEqual((cube.Length.Value,cube.Width.Value,cube.Height.Value),(1,2,3))
+        self.failUnless(cube.Placement.Base.isEqual(FreeCAD.Vector(0,0,5),1e-9))
+        self.assertAlmostEqual(cube.Placement.Rotation.Angle,0.5*3.14159265358979,6)
+        areas = sorted([o.Shape.Area for o in objs if o.Name.startswith("polygon") or o.Name.startswith("wire")])
+        self.assertEqual(len(areas),2)
+        self.assertAlmostEqual(areas[0],1.0)
+        self.assertAlmostEqual(areas[1],2.0)
+
+    def testNumberLists(self):
+        FreeCAD.Console.PrintLog ('Checking CSG number lists against the previous lexer...\n')
+        import tokrules, ply.lex as lex
+        reference = self.getSignature(self.importCSG(lexer=lex.lex(module=tokrules)))
+        self.assertEqual(self.getSignature(self.importCSG()),reference)
+        self.assertEqual(self.getSignature(self.importCSG(twoPhase=True)),reference)
+
+    def tearDown(self):
+        for name in self.docs:
+            FreeCAD.closeDocument(name)
+        if os.path.exists(self.fileName):
+            os.remove(self.fileName)
+
+# copies the input to the output like OpenSCAD would for a CSG file, fails
+# on scripts containing "fail" and logs its calls
+stubScript = """#!/bin/sh
+echo "$@" >> "$(dirname "$0")/calls.log"
+case "$(cat "$3")" in *fail*) echo "ERROR: stub" >&2; exit 1;; esac
+cat "$3" > "$2"
+"""
+
+@unittest.skipIf(sys.platform == 'win32',"the OpenSCAD stub is a shell script")
+class OpenSCADCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        import OpenSCADUtils
+        self.utils = OpenSCADUtils
+        self.dir = tempfile.mkdtemp()
+        self.stub = os.path.join(self.dir,"openscad")
+        f = open(self.stub,"w")
+        f.write(stubScript)
+        f.close()
+        os.chmod(self.stub,0755)
+        self.params = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD")
+        self.executable = self.params.GetString('openscadexecutable')
+        self.cacheDir = self.params.GetString('openscadcachedir')
+        self.useCache = self.params.GetBool('useOpenSCADCache',True)
+        self.params.SetBool('useOpenSCADCache',True)
+        self.params.SetString('openscadexecutable',self.stub)
+        self.params.SetString('openscadcachedir',os.path.join(self.dir,"cache"))
+
+    def getCalls(self):
+        "returns the number of times the stub was called"
+        log = os.path.join(self.dir,"calls.log")
+        if not os.path.exists(log):
+            return 0
+        f = open(log)
+        calls = len(f.readlines())
+        f.close()
+        return calls
+
+    def writeFile(self,name,data):
+        fileName = os.path.join(self.dir,name)
+        f = open(fileName,"w")
+        f.write(data)
+        f.close()
+        return fileName
+
+    def call(self,inputFileName,outputext):
+        "returns the content of the result of OpenSCAD"
+        outputFileName = self.utils.callopenscad(inputFileName,outputext=outputext)
+        f = open(outputFileName)
+        result = f.read()
+        f.close()
+        os.remove(outputFileName)
+        return result
+
+    def testCache(self):
+        FreeCAD.Console.PrintLog ('Checking the cache of OpenSCAD results...\n')
+        script = self.writeFile("cube.scad","cube(1);")
+        self.assertEqual(self.call(script,"csg"),"cube(1);")
+        self.assertEqual(self.call(script,"csg"),"cube(1);")
+        self.assertEqual(self.getCalls(),1)
+        # the output format is part of the key
+        self.call(script,"stl")
+        self.assertEqual(self.getCalls(),2)
+        # unresolved imports are not cached
+        script = self.writeFile("missing.scad",'import("missing.stl");')
+        self.call(script,"csg")
+        self.call(script,"csg")
+        self.assertEqual(self.getCalls(),4)
+        # failures are not cached
+        script = self.writeFile("fail.scad","fail();")
+        self.assertRaises(self.utils.OpenSCADError,self.call,script,"csg")
+        self.assertRaises(self.utils.OpenSCADError,self.call,script,"csg")
+        self.assertEqual(self.getCalls(),6)
+
+    def testImportedFiles(self):
+        FreeCAD.Console.PrintLog ('Checking the cache of OpenSCAD results of imported files...\n')
+        self.writeFile("a.stl","solid a")
+        self.writeFile("b.stl","solid a")
+        scripts = [self.writeFile("%s.scad" % n,'hull(){import(file = "%s.stl");}' % n) for n in "ab"]
+        # meshes only depend on the content of the imported files
+        self.assertEqual(self.call(scripts[0],"stl"),self.call(scripts[1],"stl"))
+        self.assertEqual(self.getCalls(),1)
+        # CSG files refer to them by name
+        self.failUnless('"a.stl"' in self.call(scripts[0],"csg"))
+        self.failUnless('"b.stl"' in self.call(scripts[1],"csg"))
+        self.assertEqual(self.getCalls(),3)
+        # a changed import is a new call
+        self.writeFile("a.stl","solid b")
+        self.call(scripts[0],"csg")
+        self.assertEqual(self.getCalls(),4)
+
+    def testManyCalls(self):
+        FreeCAD.Console.PrintLog ('Checking OpenSCAD calls running at the same time...\n')
+        scripts = [self.writeFile("cube%d.scad" % i,"cube(%d);" % i) for i in range(4)]
+        outputFileNames = self.utils.callopenscadmany(scripts+scripts[:1])
+        results = []
+        for outputFileName in outputFileNames:
+            f = open(outputFileName)
+            results.append(f.read())
+            f.close()
+            os.remove(outputFileName)
+        # the results are in the order of the scripts
+        self.assertEqual(results,["cube(%d);" % i for i in range(4)]+["cube(0);"])
+        self.assertEqual(self.getCalls(),5)
+        # a failure is raised once all the calls are done
+        scripts = [self.writeFile("fail.scad","fail();"),self.writeFile("cube4.scad","cube(4);")]
+        self.assertRaises(self.utils.OpenSCADError,self.utils.callopenscadmany,scripts)
+        self.assertEqual(self.getCalls(),7)
+        self.assertEqual(self.call(scripts[1],"csg"),"cube(4);")
+        self.assertEqual(self.getCalls(),7)
+
+    def tearDown(self):
+        self.params.SetString('openscadexecutable',self.executable)
+        if self.cacheDir:
+            self.params.SetString('openscadcachedir',self.cacheDir)
+        else:
+            self.params.RemString('openscadcachedir')
+        self.params.SetBool('useOpenSCADCache',self.useCache)
+        shutil.rmtree(self.dir)
@@ -33,7 +33,7 @@ __url__ = ["http://www.sloan-home.co.uk/ImportCSG"]
 
 printverbose = False
 
-import FreeCAD, os, sys
+import FreeCAD, os, sys, copy
 if FreeCAD.GuiUp:
     import FreeCADGui
     gui = True
@@ -114,30 +114,362 @@ def insert(filename,docname):
         pathName = os.path.dirname(os.path.normpath(filename))
         processcsg(filename)
 
+# The lexer and the parsers are built on first use and shared by all imports
+lexer = None
+parsers = {}
+
+class CSGNode(object):
+    "a node of the tree built by parsecsg(data,ast=True): a grammar rule and its values"
+    __slots__ = ('func','values')
+
+    def __init__(self,func,values):
+        self.func = func
+        self.values = values
+
+    def __repr__(self):
+        return 'CSGNode(%s)' % self.func[2:]
+
+def nodeaction(func):
+    "returns a grammar action that stores the values of the rule in a CSGNode"
+    def action(p):
+        p[0] = CSGNode(func,[p[i] for i in range(1,len(p))])
+    return action
+
+def getParser(ast=False):
+    """returns the CSG parser. The parse tables are built once and stored in
+    the user folder, they are only built again if the grammar changes. If ast
+    is True, the parser builds a tree of CSGNode instead of document objects"""
+    global lexer
+    if lexer is None:
+        if printverbose: print 'Start Lex'
+        lexer = tokrules.VectorListLexer(lex.lex(module=tokrules))
+        if printverbose: print 'End Lex'
+    if not parsers:
+        if printverbose: print 'Load Parser'
+        tabfile = os.path.join(FreeCAD.ConfigGet("UserAppData"),"csgparsetab.p")
+        # No debug out otherwise Linux has protection exception
+        try:
+            parser = yacc.yacc(debug=0,write_tables=0,picklefile=tabfile)
+        except IOError:
+            parser = yacc.yacc(debug=0,write_tables=0)
+        if printverbose: print 'Parser Loaded'
+        # same tables, bound to actions that build the tree
+        astparser = copy.copy(parser)
+        astparser.productions = [copy.copy(prod) for prod in parser.productions]
+        for prod in astparser.productions:
+            if prod.func:
+                prod.callable = nodeaction(prod.func)
+        parsers[False] = parser
+        parsers[True] = astparser
+    return parsers[ast]
+
+def parsecsg(data,ast=False):
+    """parsecsg(data,[ast]): parses the given CSG string. Objects are created in
+    doc as the rules are matched, and the result of the top rule is returned.
+    If ast is True, no object is created and a tree of CSGNode is returned, to
+    be turned into objects later by buildcsg"""
+    # Swap statements to enable Parser debugging
+    #return getParser(ast).parse(data,lexer=lexer,debug=1)
+    parser = getParser(ast)
+    return parser.parse(data,lexer=lexer)
+
+def buildcsg(node):
+    """buildcsg(node): creates the objects of a tree returned by parsecsg, by
+    running the grammar actions in the order the parser runs them, and returns
+    the result of the top rule"""
+    if not isinstance(node,CSGNode):
+        return node
+    results = {}
+    stack = [node]
+    while stack:
+        n = stack[-1]
+        pending = [v for v in n.values if isinstance(v,CSGNode) and not id(v) in results]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+        p = [None]+[(results.pop(id(v)) if isinstance(v,CSGNode) else v) for v in n.values]
+        globals()[n.func](p)
+        results[id(n)] = p[0]
+    return results[id(node)]
+
+def freeze(value):
+    "returns a hashable copy of a value built by the grammar actions"
+    if isinstance(value,(list,tuple)):
+        return tuple([freeze(v) for v in value])
+    if isinstance(value,dict):
+        return tuple(sorted([(k,freeze(v)) for k,v in value.items()]))
+    return value
+
+def fuseshapes(shapes,op='fuse'):
+    """fuses (or intersects, with op='common') the given shapes two by two, as
+    a balanced tree, so no operand grows more than the others"""
+    while len(shapes) > 1:
+        pairs = [getattr(shapes[i],op)(shapes[i+1]) for i in range(0,len(shapes)-1,2)]
+        if len(shapes) % 2:
+            pairs.append(shapes[-1])
+        shapes = pairs
+    return shapes[0]
+
+class ShapeBuilder:
+    """Turns a tree returned by parsecsg(data,ast=True) directly into shapes,
+    without creating the parametric features. Unions and intersections are
+    computed as balanced trees of pairwise operations, and identical subtrees,
+    such as a child repeated under several multmatrix, are computed once.
+    Rules not handled here (extrusions, imports...) are built as features by
+    buildcsg, and only their shapes are kept. The 3D hull and minkowski
+    operations are computed ahead, see batch()."""
+
+    # rules whose actions only build values, they are run as they are
+    datarules = ('p_boolean','p_stripped_string','p_anymodifier','p_2d_point',
+                 'p_points_list_2d','p_3d_point','p_points_list_3d','p_path_points',
+                 'p_path_list','p_path_set','p_points_2d','p_points_3d','p_paths_list',
+                 'p_size_vector','p_keywordargument','p_keywordargument_list',
+                 'p_vector','p_matrix')
+    # rules computed by OpenSCAD
+    cgalrules = ('p_hull_action','p_minkowski_action')
+
+    def __init__(self):
+        self.keys = {}    # structural key -> number
+        self.shapes = {}  # number -> list of shapes
+        self.fnmax = FreeCAD.ParamGet("User parameter:BaseApp/Preferences/Mod/OpenSCAD").\
+            GetInt('useMaxFN')
+
+    def key(self,key):
+        "returns a small number for a structural key, so keys of parents stay flat"
+        return self.keys.setdefault(key,len(self.keys))
+
+    def evaluate(self,node):
+        "returns the list of shapes of the given tree"
+        if node is None:
+            return []
+        self.batch(node)
+        return self.walk(node)[1]
+
+    def walk(self,node):
+        "returns the key number and the value of the given tree"
+        results = {} # id(node) -> (key number, value)
+        stack = [node]
+        while stack:
+            n = stack[-1]
+            rule = getattr(self,n.func[2:],None)
+            if rule:
+                pending = [v for v in n.values if isinstance(v,CSGNode) and not id(v) in results]
+                if pending:
+                    stack.extend(reversed(pending))
+                    continue
+            stack.pop()
+            if rule:
+                values = [(results.pop(id(v)) if isinstance(v,CSGNode) else (self.key(freeze(v)),v)) for v in n.values]
+                k = self.key((n.func,)+tuple([kv[0] for kv in values]))
+                if not k in self.shapes:
+                    self.shapes[k] = rule(n,[kv[1] for kv in values])
+                results[id(n)] = (k,self.shapes[k])
+            elif n.func in self.datarules:
+                value = buildcsg(n)
+                results[id(n)] = (self.key(freeze(value)),value)
+            else:
+                k = self.key(('features',id(n)))
+                if not k in self.shapes:
+                    self.shapes[k] = self.features(n)
+                results[id(n)] = (k,self.shapes[k])
+        return results[id(node)]
+
+    def batch(self,node):
+        """computes the 3D hull and minkowski operations of the given tree,
+        with the OpenSCAD calls of those that don't hold one another running
+        at the same time. Their results are stored for walk(), the others are
+        left to the features"""
+        levels = {} # id(node) -> number of nested operations in the node
+        operations = [] # (level, node)
+        stack = [node]
+        while stack:
+            n = stack[-1]
+            children = []
+            if getattr(self,n.func[2:],None):
+                children = [v for v in n.values if isinstance(v,CSGNode)]
+            pending = [v for v in children if not id(v) in levels]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            level = max([levels[id(v)] for v in children] or [0])
+            if n.func in self.cgalrules:
+                level += 1
+                operations.append((level,n))
+            levels[id(n)] = level
+        for level in range(1,levels[id(node)]+1):
+            jobs = [] # (key number, operation, shapes)
+            for l,n in operations:
+                if l != level:
+                    continue
+                values = [(self.walk(v) if isinstance(v,CSGNode) else (self.key(freeze(v)),v)) for v in n.values]
+                k = self.key((n.func,)+tuple([kv[0] for kv in values]))
+                shapes = values[-2][1] # the block_list
+                if (k in self.shapes) or (k in [job[0] for job in jobs]) or not shapes:
+                    continue
+                if all((not s.isNull()) and s.Volume > 0 for s in shapes):
+                    jobs.append((k,values[0][1],shapes))
+            if not jobs:
+                continue
+            try:
+                solids = process3D_ShapesViaOpenSCAD([job[1:] for job in jobs])
+            except OpenSCADError:
+                # the failed operations report their error as features
+                continue
+            for (k,operation,shapes),solid in zip(jobs,solids):
+                if solid is not None:
+                    self.shapes[k] = [solid]
+
+    def features(self,node):
+        "builds the given tree as features, and returns their shapes"
+        objs = buildcsg(node)
+        if not objs:
+            return []
+        doc.recompute()
+        shapes = [obj.Shape for obj in objs]
+        removesubtree(objs)
+        return shapes
+
+    def empty(self):
+        return [Part.Compound([])]
+
+    # the rules below get their node and the values of its symbols
+
+    def block_list_(self,node,values):
+        if len(values) > 1:
+            return values[0] + values[1]
+        return values[0]
+
+    def statement(self,node,values):
+        return values[0]
+
+    part = statement
+    operation = statement
+
+    def statementwithmod(self,node,values):
+        return values[1]
+
+    def render_action(self,node,values):
+        return values[5]
+
+    def color_action(self,node,values):
+        # colors are not kept on evaluated shapes
+        return values[5]
+
+    def group_action1(self,node,values):
+        if len(values[4]) > 1:
+            return [fuseshapes(values[4])]
+        return values[4]
+
+    def group_action2(self,node,values):
+        return []
+
+    def union_action(self,node,values):
+        if not values[4]:
+            return self.empty()
+        return [fuseshapes(values[4])]
+
+    def intersection_action(self,node,values):
+        if not values[4]:
+            return self.empty()
+        return [fuseshapes(values[4],'common')]
+
+    def difference_action(self,node,values):
+        if len(values[4]) < 2:
+            return values[4]
+        return [values[4][0].cut(fuseshapes(values[4][1:]))]
+
+    def multmatrix_action(self,node,values):
+        transform_matrix,matrixisrounded = getmatrix(values[2])
+        if not values[5]:
+            part = self.empty()[0]
+        else:
+            part = fuseshapes(values[5])
+        if isspecialorthogonalpython(fcsubmatrix(transform_matrix)):
+            plm=FreeCAD.Placement(transform_matrix)
+            if matrixisrounded:
+                plm=FreeCAD.Placement(plm.Base,roundrotation(plm.Rotation))
+            # the shape can be used elsewhere, it is not moved in place
+            new_part = part.copy()
+            new_part.Placement = plm.multiply(part.Placement)
+        elif isrotoinversionpython(fcsubmatrix(transform_matrix)):
+            cmat,axisvec = decomposerotoinversion(transform_matrix)
+            new_part = part.mirror(FreeCAD.Vector(),axisvec)
+            plm=FreeCAD.Placement(cmat)
+            if matrixisrounded:
+                plm=FreeCAD.Placement(plm.Base,roundrotation(plm.Rotation))
+            new_part.Placement = plm.multiply(new_part.Placement)
+        else:
+            new_part = part.transformGeometry(transform_matrix)
+        return [new_part]
+
+    def sphere_action(self,node,values):
+        return [Part.makeSphere(float(values[2]['r']))]
+
+    def cube_action(self,node,values):
+        l,w,h = [float(str1) for str1 in values[2]['size']]
+        if not (l > 0 and w > 0 and h > 0):
+            FreeCAD.Console.PrintWarning('cube with radius zero\n')
+            return self.empty()
+        if values[2]['center']=='true':
+            return [Part.makeBox(l,w,h,FreeCAD.Vector(-l/2.0,-w/2.0,-h/2.0))]
+        return [Part.makeBox(l,w,h)]
+
+    def cylinder_action(self,node,values):
+        h = float(values[2]['h'])
+        r1 = float(values[2]['r1'])
+        r2 = float(values[2]['r2'])
+        n = int(values[2]['$fn'])
+        if h <= 0 or (r1 == 0 and r2 == 0):
+            FreeCAD.Console.PrintWarning('cylinder with height <= zero or radius zero\n')
+            return self.empty()
+        if not (n < 3 or self.fnmax != 0 and n > self.fnmax):
+            # prisms and frustums
+            return self.features(node)
+        base = FreeCAD.Vector()
+        if values[2]['center']=='true':
+            base = FreeCAD.Vector(0,0,-h/2.0)
+        if r1 == r2:
+            return [Part.makeCylinder(r1,h,base)]
+        return [Part.makeCone(r1,r2,h,base)]
+
+    def polyhedron_action(self,node,values):
+        return [polyhedronshape(values[4],values[8])]
+
+    def hull_action(self,node,values):
+        # 2D operations, and those batch() couldn't compute
+        return self.features(node)
+
+    minkowski_action = hull_action
+
 def processcsg(filename):
     global doc
     
     if printverbose: print 'ImportCSG Version 0.5d'
-    # Build the lexer
-    if printverbose: print 'Start Lex'
-    lex.lex(module=tokrules)
-    if printverbose: print 'End Lex'
-
-    # Build the parser   
-    if printverbose: print 'Load Parser'
-    # No debug out otherwise Linux has protection exception
-    parser = yacc.yacc(debug=0)
-    if printverbose: print 'Parser Loaded'
-    # Give the lexer some input
-    #f=open('test.scad', 'r')
     f = pythonopen(filename, 'r')
-    #lexer.input(f.read())
+    data = f.read()
+    f.close()
 
     if printverbose: print 'Start Parser'
-    # Swap statements to enable Parser debugging
-    #result = parser.parse(f.read(),debug=1)
-    result = parser.parse(f.read())
-    f.close()
+    if params.GetBool('useShapeImport',False):
+        # the tree is evaluated into shapes, see ShapeBuilder
+        tree = parsecsg(data,ast=True)
+        result = []
+        for shape in ShapeBuilder().evaluate(tree):
+            obj = doc.addObject('Part::Feature','CSG')
+            obj.Shape = shape
+            result.append(obj)
+        if params.GetBool('useShapeImportFeatures',False):
+            # the parametric features, hidden behind the evaluated shapes
+            for obj in buildcsg(tree) or []:
+                if gui:
+                    obj.ViewObject.hide()
+    elif params.GetBool('useTwoPhaseImport',False):
+        # the whole file is parsed before any object is created
+        result = buildcsg(parsecsg(data,ast=True))
+    else:
+        result = parsecsg(data)
     if printverbose:
         print 'End Parser'
         print result  
@@ -327,6 +659,36 @@ def p_path_set(p) :
         p[0] = p[1]
     if printverbose: print p[0]
 
+def p_points_2d(p):
+    '''
+    points_2d : OSQUARE points_list_2d ESQUARE
+              | VECTORLIST
+              '''
+    if len(p) == 2:
+        p[0] = [[float(x) for x in point] for point in p[1]]
+    else:
+        p[0] = p[2]
+
+def p_points_3d(p):
+    '''
+    points_3d : OSQUARE points_list_3d ESQUARE
+              | VECTORLIST
+              '''
+    if len(p) == 2:
+        p[0] = p[1]
+    else:
+        p[0] = p[2]
+
+def p_paths_list(p):
+    '''
+    paths_list : OSQUARE path_set ESQUARE
+               | VECTORLIST
+               '''
+    if len(p) == 2:
+        p[0] = p[1]
+    else:
+        p[0] = p[2]
+
 def p_operation(p):
     '''
     operation : difference_action
@@ -726,13 +1088,9 @@ def processDXF(fname,layer):
 def processSTL(fname):
     if printverbose: print "Process STL file"
 
-def p_multmatrix_action(p):
-    'multmatrix_action : multmatrix LPAREN matrix RPAREN OBRACE block_list EBRACE'
-    if printverbose: print "MultMatrix"
-    transform_matrix = FreeCAD.Matrix()
-    if printverbose: print "Multmatrix"
-    if printverbose: print p[3]
-    m1l=sum(p[3],[])
+def getmatrix(rows):
+    "returns the FreeCAD matrix of a multmatrix, and whether its numbers were rounded"
+    m1l=sum(rows,[])
     if any('x' in me for me in m1l): #hexfloats
         m1l=[float.fromhex(me) for me in m1l]
         matrixisrounded=False
@@ -743,7 +1101,13 @@ def p_multmatrix_action(p):
     else: #trucanted numbers
         m1l=[round(float(me),12) for me in m1l] #round
         matrixisrounded=True
-    transform_matrix = FreeCAD.Matrix(*tuple(m1l))
+    return FreeCAD.Matrix(*tuple(m1l)),matrixisrounded
+
+def p_multmatrix_action(p):
+    'multmatrix_action : multmatrix LPAREN matrix RPAREN OBRACE block_list EBRACE'
+    if printverbose: print "MultMatrix"
+    if printverbose: print p[3]
+    transform_matrix,matrixisrounded = getmatrix(p[3])
     if printverbose: print transform_matrix
     if printverbose: print "Apply Multmatrix"
 #   If more than one object on the stack for multmatrix fuse first
@@ -814,9 +1178,15 @@ def p_multmatrix_action(p):
     if printverbose: print "Multmatrix applied"
     
 def p_matrix(p):
-    'matrix : OSQUARE vector COMMA vector COMMA vector COMMA vector ESQUARE'
+    '''
+    matrix : OSQUARE vector COMMA vector COMMA vector COMMA vector ESQUARE
+           | VECTORLIST
+           '''
     if printverbose: print "Matrix"
-    p[0] = [p[2],p[4],p[6],p[8]]
+    if len(p) == 2:
+        p[0] = p[1]
+    else:
+        p[0] = [p[2],p[4],p[6],p[8]]
 
 def p_vector(p):
     'vector : OSQUARE NUMBER COMMA NUMBER COMMA NUMBER COMMA NUMBER ESQUARE'
@@ -1019,10 +1389,10 @@ def convert_points_list_to_vector(l):
 
 
 def p_polygon_action_nopath(p) :
-    'polygon_action_nopath : polygon LPAREN points EQ OSQUARE points_list_2d ESQUARE COMMA paths EQ undef COMMA keywordargument_list RPAREN SEMICOL'
+    'polygon_action_nopath : polygon LPAREN points EQ points_2d COMMA paths EQ undef COMMA keywordargument_list RPAREN SEMICOL'
     if printverbose: print "Polygon"
-    if printverbose: print p[6]
-    v = convert_points_list_to_vector(p[6])
+    if printverbose: print p[5]
+    v = convert_points_list_to_vector(p[5])
     mypolygon = doc.addObject('Part::Feature',p[1])
     if printverbose: print "Make Parts"
     # Close Polygon
@@ -1033,13 +1403,13 @@ def p_polygon_action_nopath(p) :
     p[0] = [mypolygon]
 
 def p_polygon_action_plus_path(p) :
-    'polygon_action_plus_path : polygon LPAREN points EQ OSQUARE points_list_2d ESQUARE COMMA paths EQ OSQUARE path_set ESQUARE COMMA keywordargument_list RPAREN SEMICOL'
+    'polygon_action_plus_path : polygon LPAREN points EQ points_2d COMMA paths EQ paths_list COMMA keywordargument_list RPAREN SEMICOL'
     if printverbose: print "Polygon with Path"
-    if printverbose: print p[6]
-    v = convert_points_list_to_vector(p[6])
+    if printverbose: print p[5]
+    v = convert_points_list_to_vector(p[5])
     if printverbose: print "Path Set List"
-    if printverbose: print p[12]
-    for i in p[12] :
+    if printverbose: print p[9]
+    for i in p[9] :
          if printverbose: print i
          mypolygon = doc.addObject('Part::Feature','wire')
          path_list = []
@@ -1061,29 +1431,37 @@ def make_face(v1,v2,v3):
     face = Part.Face(wire)
     return face
 
-def p_polyhedron_action(p) :
-    '''polyhedron_action : polyhedron LPAREN points EQ OSQUARE points_list_3d ESQUARE COMMA faces EQ OSQUARE points_list_3d ESQUARE COMMA keywordargument_list RPAREN SEMICOL
-                      | polyhedron LPAREN points EQ OSQUARE points_list_3d ESQUARE COMMA triangles EQ OSQUARE points_list_3d ESQUARE COMMA keywordargument_list RPAREN SEMICOL'''
-    if printverbose: print "Polyhedron Points"
+def polyhedronshape(points,faces):
+    "returns the solid of a polyhedron"
     v = []
-    for i in p[6] :
+    for i in points :
         if printverbose: print i
         v.append(FreeCAD.Vector(float(i[0]),float(i[1]),float(i[2])))
     if printverbose:
         print v
         print "Polyhedron triangles"
-        print p[12]
+        print faces
     faces_list = []    
-    mypolyhed = doc.addObject('Part::Feature',p[1])
-    for i in p[12] :
+    for i in faces :
         if printverbose: print i
-        f = make_face(v[int(i[0])],v[int(i[1])],v[int(i[2])])
+        if len(i) == 3:
+            f = make_face(v[int(i[0])],v[int(i[1])],v[int(i[2])])
+        else: # VECTORLIST faces can have more vertices
+            face_points = [v[int(j)] for j in i]
+            f = Part.Face(Part.makePolygon(face_points+face_points[:1]))
         faces_list.append(f)
     shell=Part.makeShell(faces_list)
     solid=Part.Solid(shell).removeSplitter()
     if solid.Volume < 0:
         solid.reverse()
-    mypolyhed.Shape=solid
+    return solid
+
+def p_polyhedron_action(p) :
+    '''polyhedron_action : polyhedron LPAREN points EQ points_3d COMMA faces EQ points_3d COMMA keywordargument_list RPAREN SEMICOL
+                      | polyhedron LPAREN points EQ points_3d COMMA triangles EQ points_3d COMMA keywordargument_list RPAREN SEMICOL'''
+    if printverbose: print "Polyhedron Points"
+    mypolyhed = doc.addObject('Part::Feature',p[1])
+    mypolyhed.Shape = polyhedronshape(p[5],p[9])
     p[0] = [mypolyhed]
 
 def p_projection_action(p) :
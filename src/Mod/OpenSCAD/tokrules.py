@@ -25,6 +25,9 @@ __title__="FreeCAD OpenSCAD Workbench - CSG importer Version 0.5c"
 __author__ = "Keith Sloan <keith@sloan-home.co.uk>"
 __url__ = ["http://www.sloan-home.co.uk/ImportCSG"]
 
+import re
+import ply.lex as lex
+
 # Reserved words
 reserved = (
     'group',
@@ -80,7 +83,8 @@ tokens = reserved + (
    'MODIFIERBACK',
    'MODIFIERDEBUG',
    'MODIFIERROOT',
-   'MODIFIERDISABLE'
+   'MODIFIERDISABLE',
+   'VECTORLIST'
 )
 
 # Regular expression rules for simple tokens
@@ -102,6 +106,7 @@ t_MODIFIERBACK    = r'%'
 t_MODIFIERDEBUG   = r'\#'
 t_MODIFIERROOT    = r'!'
 t_MODIFIERDISABLE = r'\*'
+# VECTORLIST tokens are produced by VectorListLexer
 # Deal with Reserved words
 reserved_map = { }
 for r in reserved:
@@ -133,3 +138,44 @@ t_ignore  = " \t\r"
 def t_error(t):
     print "Illegal character '%s'" % t.value[0]
     t.lexer.skip(1)
+
+# Nested lists of numbers, as found in multmatrix, polygon and polyhedron,
+# can hold thousands of numbers. Going through the parser number by number
+# is slow, so they are read in one go into a single VECTORLIST token, whose
+# value is the list of rows, each a list of number strings like NUMBER tokens
+number = r'[-]?[0-9]*[\.]*[0-9]+(?:[eE]-?[0-9]+)*' # same as t_NUMBER
+row = r'\[\s*%s(?:\s*,\s*%s)*\s*\]' % (number,number)
+number_re = re.compile(number)
+row_re = re.compile(row)
+vectorlist_re = re.compile(r'\s*(\[\s*%s(?:\s*,\s*%s)*\s*\])' % (row,row))
+
+class VectorListLexer(object):
+    """Wraps a ply lexer built from this module. Nested lists of numbers
+    are returned as VECTORLIST tokens, everything else is left to the ply
+    lexer"""
+
+    def __init__(self,lexer):
+        self.lexer = lexer
+
+    def __getattr__(self,name):
+        return getattr(self.lexer,name)
+
+    def input(self,data):
+        self.lexer.input(data)
+        self.lexer.lineno = 1
+
+    def token(self):
+        lexer = self.lexer
+        m = vectorlist_re.match(lexer.lexdata,lexer.lexpos)
+        if m is None:
+            return lexer.token()
+        text = m.group(1)
+        lexer.lineno += lexer.lexdata.count('\n',lexer.lexpos,m.start(1))
+        tok = lex.LexToken()
+        tok.type = 'VECTORLIST'
+        tok.value = [number_re.findall(r) for r in row_re.findall(text)]
+        tok.lineno = lexer.lineno
+        tok.lexpos = m.start(1)
+        lexer.lineno += text.count('\n')
+        lexer.lexpos = m.end(1)
+        return tok
@@ -72,7 +72,9 @@ def All():
                "TestPartApp",
                "TestPartDesignApp",
                "TestSpreadsheet",
-               "TestTechDrawApp" ]
+               "TestTechDrawApp",
+               "TestImportApp",
+               "TestOpenSCADApp" ]
 
     # gui tests of modules
     if (FreeCAD.GuiUp == 1):